@@ -0,0 +1,418 @@
+"""
+Module describing the BlockTable class.
+"""
+import json
+import mmap
+import os
+from array import array
+from itertools import izip
+
+import numpy as np
+
+from attestation.halfblock import Halfblock
+from attestation.public_key import PublicKey
+
+# Binary fields of a block in the order in which they are stored in the blob
+# buffer of the table.
+BLOB_FIELDS = ['previous_hash_requester', 'signature_requester', 'hash_requester',
+               'previous_hash_responder', 'signature_responder', 'hash_responder']
+
+# Number of rows read at once by BlockTable.iter_halfblocks.
+CHUNK_ROWS = 65536
+
+# Version of the snapshot format written by BlockTable.save.
+SNAPSHOT_VERSION = 1
+
+# Columns of the table which are stored as arrays in a snapshot.
+SNAPSHOT_COLUMNS = ['requester', 'responder', 'up', 'down', 'sequence_number_requester',
+                    'sequence_number_responder', 'blob_offsets', 'chain_order', 'chain_offsets']
+
+
+class BlockTable(object):
+    """
+    Columnar in-memory representation of the multi_chain table. Every block
+    is a row index into a set of typed arrays, public keys are replaced by
+    integer agent ids and the hashes and signatures of all blocks are kept in
+    one contiguous bytes buffer.
+    """
+
+    def __init__(self, public_keys, requester, responder, up, down,
+                 sequence_number_requester, sequence_number_responder,
+                 blobs, blob_offsets):
+        """
+        Creates a block table from its columns.
+
+        :param public_keys: List of binary public keys, indexed by agent id.
+        :param requester: Agent ids of the requesters.
+        :param responder: Agent ids of the responders.
+        :param up: Amount of data uploaded by the requester.
+        :param down: Amount of data downloaded by the requester.
+        :param sequence_number_requester: Sequence numbers in the requester chains.
+        :param sequence_number_responder: Sequence numbers in the responder chains.
+        :param blobs: Concatenation of all binary fields, see BLOB_FIELDS.
+        :param blob_offsets: Start offsets into blobs, one per binary field
+        plus a final end offset.
+        """
+        self.public_keys = public_keys
+        self.requester = requester
+        self.responder = responder
+        self.up = up
+        self.down = down
+        self.sequence_number_requester = sequence_number_requester
+        self.sequence_number_responder = sequence_number_responder
+        self.blobs = blobs
+        self.blob_offsets = blob_offsets
+        self.chain_order = None
+        self.chain_offsets = None
+        self.public_key_objects = None
+        self.halfblock_cache = {}
+
+    @classmethod
+    def from_blocks(cls, blocks):
+        """
+        Creates a block table from an iterable of database blocks. The blocks
+        are consumed in a single pass.
+        """
+        key_ids = {}
+        public_keys = []
+
+        def key_id(bin_key):
+            """
+            Returns the agent id of a binary key, assigning a new one if needed.
+            """
+            try:
+                return key_ids[bin_key]
+            except KeyError:
+                key_ids[bin_key] = len(public_keys)
+                public_keys.append(bin_key)
+                return key_ids[bin_key]
+
+        requester = array('l')
+        responder = array('l')
+        up = array('l')
+        down = array('l')
+        sequence_number_requester = array('l')
+        sequence_number_responder = array('l')
+        blob_lengths = array('l')
+        blobs = []
+
+        for block in blocks:
+            requester.append(key_id(block.public_key_requester))
+            responder.append(key_id(block.public_key_responder))
+            up.append(block.up)
+            down.append(block.down)
+            sequence_number_requester.append(block.sequence_number_requester)
+            sequence_number_responder.append(block.sequence_number_responder)
+            for field in BLOB_FIELDS:
+                blob = getattr(block, field)
+                blob_lengths.append(len(blob))
+                blobs.append(blob)
+
+        blob_offsets = np.zeros(len(blob_lengths) + 1, dtype=np.int64)
+        np.cumsum(np.frombuffer(blob_lengths, dtype=np.int_), out=blob_offsets[1:])
+
+        return cls(public_keys,
+                   np.frombuffer(requester, dtype=np.int_).astype(np.int32),
+                   np.frombuffer(responder, dtype=np.int_).astype(np.int32),
+                   np.frombuffer(up, dtype=np.int_).astype(np.int64),
+                   np.frombuffer(down, dtype=np.int_).astype(np.int64),
+                   np.frombuffer(sequence_number_requester, dtype=np.int_).astype(np.int64),
+                   np.frombuffer(sequence_number_responder, dtype=np.int_).astype(np.int64),
+                   ''.join(blobs), blob_offsets)
+
+    @classmethod
+    def from_database(cls, database, batch_size=1000):
+        """
+        Creates a block table directly from the multi_chain table.
+
+        :param database: A MultiChainDB object.
+        """
+        return cls.from_blocks(database.iter_blocks(batch_size))
+
+    @staticmethod
+    def is_snapshot(path):
+        """
+        Returns true if a snapshot of a table exists at the given path.
+        """
+        return os.path.isfile(os.path.join(path, 'snapshot.json'))
+
+    def save(self, path):
+        """
+        Writes a snapshot of the table to a directory, which is created if
+        needed. Every column is stored as a .npy file, the public keys and
+        the blobs as raw bytes with their offsets. The snapshot also contains
+        the halfblocks ordered by chain, see build_chain_index.
+        """
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        if self.chain_offsets is None:
+            self.build_chain_index()
+
+        key_offsets = np.zeros(len(self.public_keys) + 1, dtype=np.int64)
+        np.cumsum([len(bin_key) for bin_key in self.public_keys], out=key_offsets[1:])
+        np.save(os.path.join(path, 'key_offsets.npy'), key_offsets)
+        with open(os.path.join(path, 'keys.bin'), 'wb') as keys_file:
+            keys_file.write(''.join(self.public_keys))
+        with open(os.path.join(path, 'blobs.bin'), 'wb') as blobs_file:
+            blobs_file.write(self.blobs[:])
+        for column in SNAPSHOT_COLUMNS:
+            np.save(os.path.join(path, column + '.npy'), getattr(self, column))
+
+        # The description is written last, so a partly written snapshot is
+        # not recognized as one.
+        with open(os.path.join(path, 'snapshot.json'), 'w') as description:
+            json.dump({'version': SNAPSHOT_VERSION, 'blocks': len(self), 'agents': self.num_agents()},
+                      description)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a table from a snapshot. The columns and blobs are memory-mapped
+        read-only, so they are only read from disk when used and processes
+        loading the same snapshot share their pages. The stored chain index
+        is used as is instead of being rebuilt.
+        """
+        with open(os.path.join(path, 'snapshot.json')) as description_file:
+            description = json.load(description_file)
+        if description['version'] != SNAPSHOT_VERSION:
+            raise ValueError("Unsupported snapshot version: %s" % description['version'])
+
+        # Plain array views of the memory maps avoid the overhead of indexing
+        # numpy.memmap objects.
+        columns = {column: np.asarray(np.load(os.path.join(path, column + '.npy'), mmap_mode='r'))
+                   for column in SNAPSHOT_COLUMNS}
+        key_offsets = np.load(os.path.join(path, 'key_offsets.npy'))
+        with open(os.path.join(path, 'keys.bin'), 'rb') as keys_file:
+            keys = keys_file.read()
+        public_keys = [keys[start:end] for start, end in zip(key_offsets[:-1], key_offsets[1:])]
+
+        with open(os.path.join(path, 'blobs.bin'), 'rb') as blobs_file:
+            if os.fstat(blobs_file.fileno()).st_size:
+                blobs = mmap.mmap(blobs_file.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                blobs = ''
+
+        table = cls(public_keys, columns['requester'], columns['responder'], columns['up'], columns['down'],
+                    columns['sequence_number_requester'], columns['sequence_number_responder'],
+                    blobs, columns['blob_offsets'])
+        table.chain_order = columns['chain_order']
+        table.chain_offsets = columns['chain_offsets']
+        return table
+
+    def build_chain_index(self):
+        """
+        Orders the halfblocks by agent and sequence number. Halfblock i is the
+        requester halfblock of row i for i below the number of rows and the
+        responder halfblock of row i minus the number of rows otherwise. The
+        chain of agent a consists of the halfblocks
+        chain_order[chain_offsets[a]:chain_offsets[a + 1]].
+        """
+        owners = np.concatenate([self.requester, self.responder])
+        sequence_numbers = np.concatenate([self.sequence_number_requester, self.sequence_number_responder])
+        self.chain_order = np.lexsort((sequence_numbers, owners))
+        self.chain_offsets = np.zeros(self.num_agents() + 1, dtype=np.int64)
+        np.cumsum(np.bincount(owners, minlength=self.num_agents()), out=self.chain_offsets[1:])
+
+    def __len__(self):
+        """
+        Returns the number of blocks in the table.
+        """
+        return len(self.requester)
+
+    def num_agents(self):
+        """
+        Returns the number of distinct public keys in the table.
+        """
+        return len(self.public_keys)
+
+    def get_blob(self, index, field):
+        """
+        Returns a binary field of the block at the given row index.
+        """
+        position = index * len(BLOB_FIELDS) + BLOB_FIELDS.index(field)
+        return self.blobs[self.blob_offsets[position]:self.blob_offsets[position + 1]]
+
+    def get_halfblocks(self, index):
+        """
+        Creates the two halfblocks of the block at the given row index.
+        """
+        up = int(self.up[index])
+        down = int(self.down[index])
+        public_key_requester = self.public_keys[self.requester[index]]
+        public_key_responder = self.public_keys[self.responder[index]]
+        sequence_number_requester = int(self.sequence_number_requester[index])
+        sequence_number_responder = int(self.sequence_number_responder[index])
+
+        block1 = Halfblock([up, up - down, public_key_requester, sequence_number_requester,
+                            public_key_responder, sequence_number_responder,
+                            self.get_blob(index, 'previous_hash_requester'),
+                            self.get_blob(index, 'signature_requester')])
+        block2 = Halfblock([down, down - up, public_key_responder, sequence_number_responder,
+                            public_key_requester, sequence_number_requester,
+                            self.get_blob(index, 'previous_hash_responder'),
+                            self.get_blob(index, 'signature_responder')])
+
+        return block1, block2
+
+    def iter_halfblocks(self, start=0, stop=None):
+        """
+        Iterates over the halfblock pairs of the blocks in a range of rows,
+        all rows by default. The columns are read in chunks of CHUNK_ROWS
+        rows, which is faster than get_halfblocks for many rows.
+        """
+        stop = len(self) if stop is None else stop
+        fields = len(BLOB_FIELDS)
+        previous_hash_requester = BLOB_FIELDS.index('previous_hash_requester')
+        signature_requester = BLOB_FIELDS.index('signature_requester')
+        previous_hash_responder = BLOB_FIELDS.index('previous_hash_responder')
+        signature_responder = BLOB_FIELDS.index('signature_responder')
+
+        for chunk_start in xrange(start, stop, CHUNK_ROWS):
+            chunk_stop = min(chunk_start + CHUNK_ROWS, stop)
+            rows = slice(chunk_start, chunk_stop)
+            offsets = self.blob_offsets[chunk_start * fields:chunk_stop * fields + 1].tolist()
+            blobs = self.blobs[offsets[0]:offsets[-1]]
+            base = offsets[0]
+
+            def blob(position):
+                return blobs[offsets[position] - base:offsets[position + 1] - base]
+
+            columns = izip(self.up[rows].tolist(), self.down[rows].tolist(),
+                           self.requester[rows].tolist(), self.responder[rows].tolist(),
+                           self.sequence_number_requester[rows].tolist(),
+                           self.sequence_number_responder[rows].tolist())
+            for position, (up, down, requester, responder, sequence_number_requester,
+                           sequence_number_responder) in izip(xrange(0, len(offsets) - 1, fields), columns):
+                public_key_requester = self.public_keys[requester]
+                public_key_responder = self.public_keys[responder]
+                yield (Halfblock([up, up - down, public_key_requester, sequence_number_requester,
+                                  public_key_responder, sequence_number_responder,
+                                  blob(position + previous_hash_requester),
+                                  blob(position + signature_requester)]),
+                       Halfblock([down, down - up, public_key_responder, sequence_number_responder,
+                                  public_key_requester, sequence_number_requester,
+                                  blob(position + previous_hash_responder),
+                                  blob(position + signature_responder)]))
+
+    def halfblock_columns(self):
+        """
+        Returns the table in halfblock form: a dict of arrays with one entry
+        per halfblock. The first half of each array contains the requester
+        halfblocks, the second half the responder halfblocks.
+        """
+        return {
+            'public_key': np.concatenate([self.requester, self.responder]),
+            'sequence_number': np.concatenate([self.sequence_number_requester,
+                                               self.sequence_number_responder]),
+            'link_public_key': np.concatenate([self.responder, self.requester]),
+            'link_sequence_number': np.concatenate([self.sequence_number_responder,
+                                                    self.sequence_number_requester]),
+            'contribution': np.concatenate([self.up, self.down]),
+            'net_contribution': np.concatenate([self.up - self.down, self.down - self.up]),
+        }
+
+    def chain_lengths(self):
+        """
+        Returns the number of blocks in the chain of every agent.
+        """
+        return np.bincount(self.requester, minlength=self.num_agents()) + \
+            np.bincount(self.responder, minlength=self.num_agents())
+
+    def up_totals(self):
+        """
+        Returns the total amount of uploaded data of every agent, equal to
+        Chain.up for each agent.
+        """
+        totals = np.bincount(self.requester, self.up, minlength=self.num_agents()) + \
+            np.bincount(self.responder, self.down, minlength=self.num_agents())
+        return totals.astype(np.int64)
+
+    def down_totals(self):
+        """
+        Returns the total amount of downloaded data of every agent, equal to
+        Chain.down for each agent.
+        """
+        totals = np.bincount(self.requester, self.down, minlength=self.num_agents()) + \
+            np.bincount(self.responder, self.up, minlength=self.num_agents())
+        return totals.astype(np.int64)
+
+    def net_contributions(self):
+        """
+        Returns the net contribution of every agent.
+        """
+        return self.up_totals() - self.down_totals()
+
+    def get_public_keys(self):
+        """
+        Returns the PublicKey objects of all agents, indexed by agent id.
+        """
+        if self.public_key_objects is None:
+            self.public_key_objects = [PublicKey(bin_key) for bin_key in self.public_keys]
+        return self.public_key_objects
+
+    def get_chain_halfblocks(self, agent_id):
+        """
+        Returns the ids of the halfblocks in the chain of an agent, sorted by
+        sequence number, see build_chain_index. The index is built on first
+        use unless the table was loaded from a snapshot.
+        """
+        if self.chain_offsets is None:
+            self.build_chain_index()
+        return self.chain_order[self.chain_offsets[agent_id]:self.chain_offsets[agent_id + 1]]
+
+    def halfblock_fields(self, halfblock_ids):
+        """
+        Returns the columns of the halfblocks with the given ids as a dict of
+        arrays, with the keys of halfblock_columns.
+        """
+        halfblock_ids = np.asarray(halfblock_ids, dtype=np.int64)
+        rows = halfblock_ids % len(self)
+        requester = halfblock_ids < len(self)
+        owner = np.where(requester, self.requester[rows], self.responder[rows])
+        link = np.where(requester, self.responder[rows], self.requester[rows])
+        up = self.up[rows]
+        down = self.down[rows]
+        contribution = np.where(requester, up, down)
+        return {
+            'public_key': owner,
+            'sequence_number': np.where(requester, self.sequence_number_requester[rows],
+                                        self.sequence_number_responder[rows]),
+            'link_public_key': link,
+            'link_sequence_number': np.where(requester, self.sequence_number_responder[rows],
+                                             self.sequence_number_requester[rows]),
+            'contribution': contribution,
+            'net_contribution': 2 * contribution - up - down,
+        }
+
+    def get_halfblocks_by_ids(self, halfblock_ids):
+        """
+        Returns the Halfblock objects of the halfblocks with the given ids.
+        Every halfblock is created once and shared by all later calls.
+        """
+        result = []
+        for halfblock_id in np.asarray(halfblock_ids).tolist():
+            halfblock = self.halfblock_cache.get(halfblock_id)
+            if halfblock is None:
+                row = halfblock_id % len(self)
+                block_req, block_res = self.get_halfblocks(row)
+                self.halfblock_cache.setdefault(row, block_req)
+                self.halfblock_cache.setdefault(row + len(self), block_res)
+                halfblock = self.halfblock_cache[halfblock_id]
+            result.append(halfblock)
+        return result
+
+    def get_chain_indices(self, agent_id):
+        """
+        Returns the row indices of all blocks in the chain of an agent, sorted
+        by the sequence number of the agent.
+        """
+        if self.chain_offsets is not None:
+            return self.get_chain_halfblocks(agent_id) % len(self)
+
+        as_requester = np.flatnonzero(self.requester == agent_id)
+        as_responder = np.flatnonzero(self.responder == agent_id)
+        indices = np.concatenate([as_requester, as_responder])
+        sequence_numbers = np.concatenate([self.sequence_number_requester[as_requester],
+                                           self.sequence_number_responder[as_responder]])
+
+        return indices[np.argsort(sequence_numbers, kind='mergesort')]
@@ -2,9 +2,11 @@
 This file contains everything related to persistence for MultiChain.
 """
 import base64
+import itertools
 import os
 import sqlite3
 
+from contextlib import contextmanager
 from hashlib import sha256
 
 
@@ -12,7 +14,17 @@ DATABASE_DIRECTORY = os.path.join(u"sqlite")
 # Path to the database location + dispersy._workingdirectory
 DATABASE_PATH = os.path.join(DATABASE_DIRECTORY, u"multichain_09_02_18.db")
 # Version to keep track if the db schema needs to be updated.
-LATEST_DB_VERSION = 2
+LATEST_DB_VERSION = 3
+# Orderings supported when iterating over all blocks.
+BLOCK_ORDERINGS = {
+    u"rowid": u"rowid ASC",
+    u"insert_time": u"insert_time ASC, rowid ASC",
+}
+# Indexes for the lookups of the blocks of a public key by sequence number.
+index_schema = u"""
+CREATE INDEX IF NOT EXISTS multi_chain_requester ON multi_chain(public_key_requester, sequence_number_requester);
+CREATE INDEX IF NOT EXISTS multi_chain_responder ON multi_chain(public_key_responder, sequence_number_responder);
+"""
 # Schema for the MultiChain DB.
 schema = u"""
 CREATE TABLE IF NOT EXISTS multi_chain(
@@ -37,16 +49,40 @@ CREATE TABLE IF NOT EXISTS multi_chain(
 
  insert_time                TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL
  );
+""" + index_schema + u"""
 
 CREATE TABLE option(key TEXT PRIMARY KEY, value BLOB);
 INSERT INTO option(key, value) VALUES('database_version', '""" + str(LATEST_DB_VERSION) + u"""');
 """
 
+# Drops the indexes of index_schema while blocks are ingested.
+drop_index_script = u"""
+DROP INDEX IF EXISTS multi_chain_requester;
+DROP INDEX IF EXISTS multi_chain_responder;
+"""
+
+insert_block_statement = u"INSERT INTO multi_chain (public_key_requester, public_key_responder, up, down, " \
+                         u"total_up_requester, total_down_requester, sequence_number_requester, " \
+                         u"previous_hash_requester, signature_requester, hash_requester, " \
+                         u"total_up_responder, total_down_responder, sequence_number_responder, " \
+                         u"previous_hash_responder, signature_responder, hash_responder) " \
+                         u"VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)"
+
+update_responder_statement = u"UPDATE multi_chain " \
+                             u"SET total_up_responder = ?, total_down_responder = ?, " \
+                             u"sequence_number_responder = ?, previous_hash_responder = ?, " \
+                             u"signature_responder = ?, hash_responder = ? " \
+                             u"WHERE hash_requester = ?"
+
 upgrade_to_version_2_script = u"""
 DROP TABLE IF EXISTS multi_chain;
 DROP TABLE IF EXISTS option;
 """
 
+upgrade_to_version_3_script = index_schema + u"""
+UPDATE option SET value = '3' WHERE key = 'database_version';
+"""
+
 
 class MultiChainDB(object):
     """
@@ -64,7 +100,6 @@ class MultiChainDB(object):
         :return:
         """
         self._dbPath = os.path.join(os.getcwd(), path)
-        self.blocks = None
         self.open()
 
     def add_block(self, block):
@@ -72,23 +107,70 @@ class MultiChainDB(object):
         Persist a block
         :param block: The data that will be saved.
         """
-        data = (buffer(block.public_key_requester), buffer(block.public_key_responder), block.up, block.down,
-                block.total_up_requester, block.total_down_requester,
-                block.sequence_number_requester, buffer(block.previous_hash_requester),
-                buffer(block.signature_requester), buffer(block.hash_requester),
-                block.total_up_responder, block.total_down_responder,
-                block.sequence_number_responder, buffer(block.previous_hash_responder),
-                buffer(block.signature_responder), buffer(block.hash_responder))
-
-        self.execute(
-            u"INSERT INTO multi_chain (public_key_requester, public_key_responder, up, down, "
-            u"total_up_requester, total_down_requester, sequence_number_requester, previous_hash_requester, "
-            u"signature_requester, hash_requester, "
-            u"total_up_responder, total_down_responder, sequence_number_responder, previous_hash_responder, "
-            u"signature_responder, hash_responder) "
-            u"VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
-            data)
+        self.execute(insert_block_statement, _block_data(block))
+        self.commit()
+
+    def add_blocks(self, blocks, batch_size=10000):
+        """
+        Persist many blocks in a single transaction.
+        :param blocks: Iterable of blocks, consumed in batches.
+        :param batch_size: The number of blocks inserted by one executemany call.
+        :return: The number of blocks added.
+        """
+        return self._execute_batches(insert_block_statement, itertools.imap(_block_data, blocks), batch_size)
+
+    def update_blocks_with_responder(self, blocks, batch_size=10000):
+        """
+        Update many existing blocks in a single transaction.
+        :param blocks: Iterable of blocks, consumed in batches.
+        :param batch_size: The number of blocks updated by one executemany call.
+        :return: The number of blocks updated.
+        """
+        return self._execute_batches(update_responder_statement, itertools.imap(_responder_data, blocks),
+                                     batch_size)
+
+    def _execute_batches(self, statement, rows, batch_size):
+        """
+        Executes a statement for all rows in batches of batch_size rows and
+        commits once at the end, or rolls back if any batch fails.
+        :return: The number of rows.
+        """
+        assert batch_size > 0
+        count = 0
+        try:
+            while True:
+                batch = list(itertools.islice(rows, batch_size))
+                if not batch:
+                    break
+                self._cursor.executemany(statement, batch)
+                count += len(batch)
+        except:
+            self._connection.rollback()
+            raise
+        self.commit()
+        return count
+
+    @contextmanager
+    def ingest(self):
+        """
+        Context manager for loading many blocks at once. Inside it the
+        database uses write-ahead logging with synchronous=NORMAL, so a
+        commit does not wait for the disk, and the indexes of index_schema
+        are dropped. The indexes are rebuilt once at the end and the
+        previous synchronous setting is restored, the database stays in WAL
+        mode. A crash may lose the last commits but not corrupt the database.
+        """
         self.commit()
+        synchronous = self.execute(u"PRAGMA synchronous").fetchone()[0]
+        self.execute(u"PRAGMA journal_mode = WAL")
+        self.execute(u"PRAGMA synchronous = NORMAL")
+        self.executescript(drop_index_script)
+        try:
+            yield self
+        finally:
+            self.executescript(index_schema)
+            self.commit()
+            self.execute(u"PRAGMA synchronous = %d" % synchronous)
 
     def get_stats(self):
         """
@@ -96,9 +178,9 @@ class MultiChainDB(object):
         """
         stats = {}
         stats['unique_keys'] = len(self.get_unique_public_keys())
-        stats['num_blocks'] = len(self.get_all_blocks())
-        stats['first_block'] = self.get_all_blocks()[0].to_dictionary()
-        stats['last_block'] = self.get_all_blocks()[-1].to_dictionary()
+        stats['num_blocks'] = self.get_num_blocks()
+        stats['first_block'] = self._get_boundary_block(u"ASC").to_dictionary()
+        stats['last_block'] = self._get_boundary_block(u"DESC").to_dictionary()
 
         return stats
 
@@ -107,18 +189,7 @@ class MultiChainDB(object):
         Update an existing block
         :param block: The data that will be saved.
         """
-        data = (
-            block.total_up_responder, block.total_down_responder,
-            block.sequence_number_responder, buffer(block.previous_hash_responder),
-            buffer(block.signature_responder), buffer(block.hash_responder), buffer(block.hash_requester))
-
-        self.execute(
-            u"UPDATE multi_chain "
-            u"SET total_up_responder = ?, total_down_responder = ?, "
-            u"sequence_number_responder = ?, previous_hash_responder = ?, "
-            u"signature_responder = ?, hash_responder = ? "
-            u"WHERE hash_requester = ?",
-            data)
+        self.execute(update_responder_statement, _responder_data(block))
         self.commit()
 
     def get_latest_hash(self, public_key):
@@ -130,12 +201,11 @@ class MultiChainDB(object):
         :return: the relevant hash
         """
         public_key = buffer(public_key)
-        db_query = u"SELECT block_hash FROM (" \
-                   u"SELECT hash_requester AS block_hash, sequence_number_requester AS sequence_number " \
+        db_query = u"SELECT hash_requester AS block_hash, sequence_number_requester AS sequence_number " \
                    u"FROM multi_chain WHERE public_key_requester = ? " \
-                   u"UNION " \
+                   u"UNION ALL " \
                    u"SELECT hash_responder AS block_hash, sequence_number_responder AS sequence_number " \
-                   u"FROM multi_chain WHERE public_key_responder = ?) ORDER BY sequence_number DESC LIMIT 1"
+                   u"FROM multi_chain WHERE public_key_responder = ? ORDER BY sequence_number DESC LIMIT 1"
         db_result = self.execute(db_query, (public_key, public_key)).fetchone()
         return str(db_result[0]) if db_result else None
 
@@ -188,14 +258,16 @@ class MultiChainDB(object):
                    u"signature_requester, hash_requester, " \
                    u"total_up_responder, total_down_responder, sequence_number_responder, previous_hash_responder, " \
                    u"signature_responder, hash_responder, insert_time " \
-                   u"FROM (" \
-                   u"SELECT *, sequence_number_requester AS sequence_number, " \
-                   u"public_key_requester AS pk FROM `multi_chain` " \
-                   u"UNION " \
-                   u"SELECT *, sequence_number_responder AS sequence_number," \
-                   u"public_key_responder AS pk FROM `multi_chain`) " \
-                   u"WHERE sequence_number = ? AND pk = ? LIMIT 1"
-        db_result = self.execute(db_query, (sequence_number, buffer(public_key))).fetchone()
+                   u"FROM `multi_chain` WHERE public_key_requester = ? AND sequence_number_requester = ? " \
+                   u"UNION ALL " \
+                   u"SELECT public_key_requester, public_key_responder, up, down, " \
+                   u"total_up_requester, total_down_requester, sequence_number_requester, previous_hash_requester, " \
+                   u"signature_requester, hash_requester, " \
+                   u"total_up_responder, total_down_responder, sequence_number_responder, previous_hash_responder, " \
+                   u"signature_responder, hash_responder, insert_time " \
+                   u"FROM `multi_chain` WHERE public_key_responder = ? AND sequence_number_responder = ? LIMIT 1"
+        public_key = buffer(public_key)
+        db_result = self.execute(db_query, (public_key, sequence_number, public_key, sequence_number)).fetchone()
         # Create a DB Block or return None
         return self._create_database_block(db_result)
 
@@ -210,17 +282,21 @@ class MultiChainDB(object):
                    u"total_up_requester, total_down_requester, sequence_number_requester, previous_hash_requester, " \
                    u"signature_requester, hash_requester, " \
                    u"total_up_responder, total_down_responder, sequence_number_responder, previous_hash_responder, " \
-                   u"signature_responder, hash_responder, insert_time " \
-                   u"FROM (" \
-                   u"SELECT *, sequence_number_requester AS sequence_number," \
-                   u" public_key_requester AS public_key FROM `multi_chain` " \
-                   u"UNION " \
-                   u"SELECT *, sequence_number_responder AS sequence_number," \
-                   u" public_key_responder AS public_key FROM `multi_chain`) " \
-                   u"WHERE sequence_number >= ? AND public_key = ? " \
+                   u"signature_responder, hash_responder, insert_time, " \
+                   u"sequence_number_requester AS sequence_number " \
+                   u"FROM `multi_chain` WHERE public_key_requester = ? AND sequence_number_requester >= ? " \
+                   u"UNION ALL " \
+                   u"SELECT public_key_requester, public_key_responder, up, down, " \
+                   u"total_up_requester, total_down_requester, sequence_number_requester, previous_hash_requester, " \
+                   u"signature_requester, hash_requester, " \
+                   u"total_up_responder, total_down_responder, sequence_number_responder, previous_hash_responder, " \
+                   u"signature_responder, hash_responder, insert_time, " \
+                   u"sequence_number_responder AS sequence_number " \
+                   u"FROM `multi_chain` WHERE public_key_responder = ? AND sequence_number_responder >= ? " \
                    u"ORDER BY sequence_number ASC " \
                    u"LIMIT 100"
-        db_result = self.execute(db_query, (sequence_number, buffer(public_key))).fetchall()
+        public_key = buffer(public_key)
+        db_result = self.execute(db_query, (public_key, sequence_number, public_key, sequence_number)).fetchall()
         return [self._create_database_block(db_item) for db_item in db_result]
 
     def get_blocks(self, public_key, limit=100):
@@ -235,17 +311,21 @@ class MultiChainDB(object):
                    u"total_up_requester, total_down_requester, sequence_number_requester, previous_hash_requester, " \
                    u"signature_requester, hash_requester, " \
                    u"total_up_responder, total_down_responder, sequence_number_responder, previous_hash_responder, " \
-                   u"signature_responder, hash_responder, insert_time " \
-                   u"FROM (" \
-                   u"SELECT *, sequence_number_requester AS sequence_number," \
-                   u" public_key_requester AS public_key FROM `multi_chain` " \
-                   u"UNION " \
-                   u"SELECT *, sequence_number_responder AS sequence_number," \
-                   u" public_key_responder AS public_key FROM `multi_chain`) " \
-                   u"WHERE public_key = ? " \
+                   u"signature_responder, hash_responder, insert_time, " \
+                   u"sequence_number_requester AS sequence_number " \
+                   u"FROM `multi_chain` WHERE public_key_requester = ? " \
+                   u"UNION ALL " \
+                   u"SELECT public_key_requester, public_key_responder, up, down, " \
+                   u"total_up_requester, total_down_requester, sequence_number_requester, previous_hash_requester, " \
+                   u"signature_requester, hash_requester, " \
+                   u"total_up_responder, total_down_responder, sequence_number_responder, previous_hash_responder, " \
+                   u"signature_responder, hash_responder, insert_time, " \
+                   u"sequence_number_responder AS sequence_number " \
+                   u"FROM `multi_chain` WHERE public_key_responder = ? " \
                    u"ORDER BY sequence_number DESC " \
                    u"LIMIT ?"
-        db_result = self.execute(db_query, (buffer(public_key), limit)).fetchall()
+        public_key = buffer(public_key)
+        db_result = self.execute(db_query, (public_key, public_key, limit)).fetchall()
         return [self._create_database_block(db_item) for db_item in db_result]
 
     def get_num_unique_interactors(self, public_key):
@@ -254,19 +334,21 @@ class MultiChainDB(object):
         :param public_key: The public key of the member of which we want the information
         :return: A tuple of unique number of interactors that helped you and that you have helped respectively
         """
+        # Only the partner and the amounts given and taken from the point of
+        # view of the public key are read. A block with itself is counted as
+        # requester only.
+        db_query = u"SELECT public_key_responder, up, down FROM multi_chain WHERE public_key_requester = ? " \
+                   u"UNION ALL " \
+                   u"SELECT public_key_requester, down, up FROM multi_chain " \
+                   u"WHERE public_key_responder = ? AND public_key_requester != ?"
+        bin_key = buffer(public_key)
         peers_you_helped = set()
         peers_helped_you = set()
-        for block in self.get_blocks(public_key, limit=-1):
-            if block.public_key_requester == public_key:
-                if int(block.up) > 0:
-                    peers_you_helped.add(block.public_key_responder)
-                if int(block.down) > 0:
-                    peers_helped_you.add(block.public_key_responder)
-            else:
-                if int(block.up) > 0:
-                    peers_helped_you.add(block.public_key_requester)
-                if int(block.down) > 0:
-                    peers_you_helped.add(block.public_key_requester)
+        for partner, given, taken in self.execute(db_query, (bin_key, bin_key, bin_key)):
+            if int(given) > 0:
+                peers_you_helped.add(str(partner))
+            if int(taken) > 0:
+                peers_helped_you.add(str(partner))
         return len(peers_you_helped), len(peers_helped_you)
 
     def _create_database_block(self, db_result):
@@ -308,9 +390,9 @@ class MultiChainDB(object):
         """
         public_key = buffer(public_key)
         db_query = u"SELECT MAX(sequence_number) FROM (" \
-                   u"SELECT sequence_number_requester AS sequence_number " \
-                   u"FROM multi_chain WHERE public_key_requester = ? UNION " \
-                   u"SELECT sequence_number_responder AS sequence_number " \
+                   u"SELECT MAX(sequence_number_requester) AS sequence_number " \
+                   u"FROM multi_chain WHERE public_key_requester = ? UNION ALL " \
+                   u"SELECT MAX(sequence_number_responder) AS sequence_number " \
                    u"FROM multi_chain WHERE public_key_responder = ? )"
         db_result = self.execute(db_query, (public_key, public_key)).fetchone()[0]
         return db_result if db_result is not None else -1
@@ -323,12 +405,11 @@ class MultiChainDB(object):
         :return: (total_up (int), total_down (int)) or (0, 0) if no block is known.
         """
         public_key = buffer(public_key)
-        db_query = u"SELECT total_up, total_down FROM (" \
-                   u"SELECT total_up_requester AS total_up, total_down_requester AS total_down, " \
+        db_query = u"SELECT total_up_requester AS total_up, total_down_requester AS total_down, " \
                    u"sequence_number_requester AS sequence_number FROM multi_chain " \
-                   u"WHERE public_key_requester = ? UNION " \
+                   u"WHERE public_key_requester = ? UNION ALL " \
                    u"SELECT total_up_responder AS total_up, total_down_responder AS total_down, " \
-                   u"sequence_number_responder AS sequence_number FROM multi_chain WHERE public_key_responder = ? ) " \
+                   u"sequence_number_responder AS sequence_number FROM multi_chain WHERE public_key_responder = ? " \
                    u"ORDER BY sequence_number DESC LIMIT 1"
         db_result = self.execute(db_query, (public_key, public_key)).fetchone()
         return (db_result[0], db_result[1]) if db_result is not None and db_result[0] is not None \
@@ -337,6 +418,28 @@ class MultiChainDB(object):
     def open(self, initial_statements=True, prepare_visioning=True):
         self._connection = sqlite3.connect(self._dbPath)
         self._cursor = self._connection.cursor()
+        self.upgrade_database()
+
+    def upgrade_database(self):
+        """
+        Brings a database of version 2 to the latest version by adding the
+        indexes of index_schema. Creating the indexes takes a while on large
+        databases, but only happens once. Databases without a multi_chain
+        table and of older versions are left untouched.
+        """
+        tables = [str(name) for (name,) in self.execute(u"SELECT name FROM sqlite_master WHERE type = 'table'")]
+        if 'multi_chain' not in tables:
+            return
+
+        if 'option' in tables:
+            db_result = self.execute(u"SELECT value FROM option WHERE key = 'database_version'").fetchone()
+            database_version = int(db_result[0]) if db_result is not None else 2
+            if database_version < 2 or database_version >= LATEST_DB_VERSION:
+                return
+            self.executescript(upgrade_to_version_3_script)
+        else:
+            self.executescript(index_schema)
+        self.commit()
 
     def close(self, commit=True):
         return super(MultiChainDB, self).close(commit)
@@ -352,34 +455,82 @@ class MultiChainDB(object):
         assert int(database_version) >= 0
         database_version = int(database_version)
 
-        if database_version < LATEST_DB_VERSION:
+        if database_version < 2:
             # Remove all previous data, since we have only been testing so far, and previous blocks might not be
             # reliable. In the future, we should implement an actual upgrade procedure
             self.executescript(upgrade_to_version_2_script)
             self.executescript(schema)
             self.commit()
+        elif database_version < LATEST_DB_VERSION:
+            self.executescript(upgrade_to_version_3_script)
+            self.commit()
 
         return LATEST_DB_VERSION
 
     def get_all_blocks(self, limit=-1):
         """
         Get all blocks in the database.
+        :param limit: The maximum number of blocks to return, -1 for all blocks
         :return: All blocks in the database
         """
-        if self.blocks is None:
-            db_query = u"SELECT public_key_requester, public_key_responder, up, down, " \
-                    u"total_up_requester, total_down_requester, sequence_number_requester, previous_hash_requester, " \
-                    u"signature_requester, hash_requester, " \
-                    u"total_up_responder, total_down_responder, sequence_number_responder, previous_hash_responder, " \
-                    u"signature_responder, hash_responder, insert_time " \
-                    u"FROM `multi_chain` " \
-                    u"LIMIT ?"
+        blocks = self.iter_blocks()
+        if limit >= 0:
+            blocks = itertools.islice(blocks, limit)
 
-            db_result = self.execute(db_query, (limit,)).fetchall()
+        return list(blocks)
 
-            self.blocks = [self._create_database_block(db_item) for db_item in db_result]
-        
-        return self.blocks
+    def iter_blocks(self, batch_size=1000, order_by=u"rowid"):
+        """
+        Iterate over all blocks in the database without loading the complete
+        table into memory. Rows are fetched from the cursor in batches.
+        :param batch_size: The number of rows fetched from sqlite at once
+        :param order_by: Either rowid or insert_time
+        :return: A generator of DatabaseBlocks
+        """
+        assert order_by in BLOCK_ORDERINGS, "Blocks can only be ordered by %s" % ", ".join(BLOCK_ORDERINGS)
+        assert batch_size > 0
+
+        db_query = u"SELECT public_key_requester, public_key_responder, up, down, " \
+                   u"total_up_requester, total_down_requester, sequence_number_requester, previous_hash_requester, " \
+                   u"signature_requester, hash_requester, " \
+                   u"total_up_responder, total_down_responder, sequence_number_responder, previous_hash_responder, " \
+                   u"signature_responder, hash_responder, insert_time " \
+                   u"FROM `multi_chain` " \
+                   u"ORDER BY " + BLOCK_ORDERINGS[order_by]
+
+        # Use a dedicated cursor so that other queries can run while the
+        # generator is suspended.
+        cursor = self._connection.cursor()
+        try:
+            cursor.execute(db_query)
+            while True:
+                db_result = cursor.fetchmany(batch_size)
+                if not db_result:
+                    break
+                for db_item in db_result:
+                    yield DatabaseBlock(db_item)
+        finally:
+            cursor.close()
+
+    def get_num_blocks(self):
+        """
+        Returns the number of blocks in the database.
+        """
+        return self.execute(u"SELECT COUNT(*) FROM multi_chain").fetchone()[0]
+
+    def _get_boundary_block(self, direction):
+        """
+        Returns the first or last inserted block.
+        :param direction: ASC for the first block, DESC for the last block
+        :return: The DatabaseBlock or None
+        """
+        db_query = u"SELECT public_key_requester, public_key_responder, up, down, " \
+                   u"total_up_requester, total_down_requester, sequence_number_requester, previous_hash_requester, " \
+                   u"signature_requester, hash_requester, " \
+                   u"total_up_responder, total_down_responder, sequence_number_responder, previous_hash_responder, " \
+                   u"signature_responder, hash_responder, insert_time " \
+                   u"FROM `multi_chain` ORDER BY rowid " + direction + u" LIMIT 1"
+        return self._create_database_block(self.execute(db_query).fetchone())
 
     def get_unique_public_keys(self):
         """
@@ -468,6 +619,28 @@ class MultiChainDB(object):
         """
         self._connection.commit()
 
+def _block_data(block):
+    """
+    Returns the bindings of insert_block_statement for a block.
+    """
+    return (buffer(block.public_key_requester), buffer(block.public_key_responder), block.up, block.down,
+            block.total_up_requester, block.total_down_requester,
+            block.sequence_number_requester, buffer(block.previous_hash_requester),
+            buffer(block.signature_requester), buffer(block.hash_requester),
+            block.total_up_responder, block.total_down_responder,
+            block.sequence_number_responder, buffer(block.previous_hash_responder),
+            buffer(block.signature_responder), buffer(block.hash_responder))
+
+
+def _responder_data(block):
+    """
+    Returns the bindings of update_responder_statement for a block.
+    """
+    return (block.total_up_responder, block.total_down_responder,
+            block.sequence_number_responder, buffer(block.previous_hash_responder),
+            buffer(block.signature_responder), buffer(block.hash_responder), buffer(block.hash_requester))
+
+
 class DatabaseBlock:
     """ DataClass for a multichain block. """
 
@@ -1,6 +1,9 @@
 """
 Module describing the Halfblock class.
 """
+import hashlib
+import struct
+
 from attestation.public_key import PublicKey
 
 class Halfblock(object):
@@ -20,6 +23,7 @@ class Halfblock(object):
         self.link_sequence_number = data[5]
         self.previous_hash = data[6]
         self.signature = data[7]
+        self._digest = None
 
     @classmethod
     def from_old_block(cls, block):
@@ -39,9 +43,38 @@ class Halfblock(object):
 
         return block1, block2
 
+    def to_tuple(self):
+        """
+        Returns the data of the halfblock as a tuple from which it can be
+        created again.
+        """
+        return (self.contribution, self.net_contribution, self.public_key.bin_key, self.sequence_number,
+                self.link_public_key.bin_key, self.link_sequence_number, self.previous_hash, self.signature)
+
+    def digest(self):
+        """
+        Returns a 64 bit digest identifying the halfblock, computed once.
+        """
+        if self._digest is None:
+            data = self.public_key.bin_key + struct.pack('>q', self.sequence_number) + self.signature
+            self._digest = struct.unpack('<Q', hashlib.sha256(data).digest()[:8])[0]
+        return self._digest
+
     def __lt__(self, other):
         return self.sequence_number < other.sequence_number
 
+    def __hash__(self):
+        return hash((self.public_key, self.sequence_number, self.signature))
+
+    def __eq__(self, other):
+        # Two different blocks with the same sequence number (a fork) have
+        # different signatures and are kept apart.
+        return isinstance(other, Halfblock) and self.public_key == other.public_key and \
+            self.sequence_number == other.sequence_number and self.signature == other.signature
+
+    def __ne__(self, other):
+        return not self == other
+
     def to_dict(self):
         """
         Returns json representation of the halfblock.
@@ -2,40 +2,102 @@
 Module describing the PublicKey class.
 """
 
+class KeyRegistry(object):
+    """
+    Process-wide registry of public keys. The registry hands out one canonical
+    PublicKey object per binary key and assigns each key a dense integer id,
+    which can be used to index arrays and bitsets.
+    """
+
+    def __init__(self):
+        """
+        Creates an empty key registry.
+        """
+        self.keys = {}
+        self.by_id = []
+
+    def get(self, bin_key):
+        """
+        Returns the canonical PublicKey for a binary key, registering the key
+        if it is not yet known.
+        """
+        try:
+            return self.keys[bin_key]
+        except KeyError:
+            public_key = object.__new__(PublicKey)
+            public_key.bin_key = bin_key
+            public_key.id = len(self.by_id)
+            public_key._hex = None
+            public_key._base64 = None
+            self.keys[bin_key] = public_key
+            self.by_id.append(public_key)
+            return public_key
+
+    def get_by_id(self, key_id):
+        """
+        Returns the PublicKey with the given integer id.
+        """
+        return self.by_id[key_id]
+
+    def __len__(self):
+        """
+        Returns the number of registered keys.
+        """
+        return len(self.by_id)
+
+REGISTRY = KeyRegistry()
+
+
 class PublicKey(object):
     """
-    The public key is the identifier of an agent on the network.
+    The public key is the identifier of an agent on the network. Public keys
+    are interned: creating a PublicKey for a binary key that was seen before
+    returns the existing object, so keys can be compared by identity.
     """
+    __slots__ = ['bin_key', 'id', '_hex', '_base64']
 
-    def __init__(self, bin_key):
+    def __new__(cls, bin_key):
         """
-        Creates a public key object from the binary string representation.
+        Returns the public key object for the binary string representation.
         """
-        self.bin_key = bin_key
+        return REGISTRY.get(bin_key)
+
+    @classmethod
+    def from_id(cls, key_id):
+        """
+        Returns the public key with the given integer id.
+        """
+        return REGISTRY.get_by_id(key_id)
 
     def to_hex(self):
         """
         Returns the significant part of the public key in hex encoding.
         """
-
-        return self.bin_key.encode('hex')[53:]
+        if self._hex is None:
+            self._hex = self.bin_key.encode('hex')[53:]
+        return self._hex
 
     def to_base64(self):
         """
         Returns the significant part of the public key in base64 encoding.
         """
+        if self._base64 is None:
+            self._base64 = self.bin_key.encode('base64')[33:]
+        return self._base64
 
-        return self.bin_key.encode('base64')[33:]
+    def __reduce__(self):
+        # Ids are only valid within one process, unpickling interns the key
+        # again in the registry of the receiving process.
+        return (PublicKey, (self.bin_key,))
 
     def __hash__(self):
-        return hash(self.bin_key)
+        return self.id
 
     def __eq__(self, other):
-        return self.bin_key == other.bin_key
+        return self is other
 
     def __ne__(self, other):
-        return not self == other
+        return self is not other
 
     def __repr__(self):
         return self.to_base64()[:8]
-
@@ -0,0 +1,69 @@
+"""
+Benchmark of the binary message codec: encode and decode throughput of
+messages with lists of halfblocks, with public keys sent in full and as key
+ids, compared to pickling the halfblocks as tuples.
+
+Usage: python -m benchmarks.codec [--sizes 1,100,10000] [--repeat 5]
+"""
+import cPickle
+import time
+
+import click
+
+from attestation.halfblock import Halfblock
+from attestation.public_key import REGISTRY, PublicKey
+from network.codec import MessageCodec
+from network.messages import Message, MessageTypes
+from benchmarks.synthetic import generate_halfblocks
+
+
+def measure(function, argument, repeat):
+    """
+    Returns the best wall time of repeated calls of a function.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        function(argument)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def pickle_encode(message):
+    return cPickle.dumps((message.type, message.sender.bin_key, [block.to_tuple() for block in message.payload]), 2)
+
+
+def pickle_decode(data):
+    message_type, sender, blocks = cPickle.loads(data)
+    return Message(message_type, PublicKey(sender), [Halfblock(block) for block in blocks])
+
+
+@click.command()
+@click.option('--sizes', default="1,100,10000", help="Comma separated numbers of halfblocks per message.")
+@click.option('--repeat', default=5, help="Number of measurements of which the best is taken.")
+def main(sizes, repeat):
+    """
+    Runs the benchmark and prints a table of sizes and throughputs.
+    """
+    sizes = [int(size) for size in sizes.split(',')]
+    halfblocks = generate_halfblocks(max(sizes) // 2 + 1)
+    formats = [('keys', MessageCodec()), ('key ids', MessageCodec(len(REGISTRY)))]
+
+    print "%8s %10s %12s %14s %14s %14s" % ('blocks', 'format', 'bytes', 'encode (MB/s)', 'decode (MB/s)',
+                                            'decode (blocks/s)')
+    for size in sizes:
+        message = Message(MessageTypes.PA_BLOCKS, halfblocks[0].public_key, halfblocks[:size])
+        runs = [(name, codec.encode, codec.decode) for name, codec in formats]
+        runs.append(('pickle', pickle_encode, pickle_decode))
+        for name, encode, decode in runs:
+            data = encode(message)
+            megabytes = len(data) / 1e6
+            encode_time = measure(encode, message, repeat)
+            decode_time = measure(decode, data, repeat)
+            print "%8d %10s %12d %14.1f %14.1f %14.0f" % (size, name, len(data), megabytes / encode_time,
+                                                          megabytes / decode_time, size / decode_time)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Benchmark of the per public key lookups of MultiChainDB. Checks with
+EXPLAIN QUERY PLAN that every query reads the multi_chain table through
+the indexes on public key and sequence number, without a full scan or a
+temporary B-tree, and prints the mean time of every lookup.
+
+Usage: python -m benchmarks.database [--blocks 1000000] [--lookups 1000] [--path benchmark.db]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import click
+import numpy as np
+
+from attestation.database import MultiChainDB
+from benchmarks.synthetic import generate_database
+
+# Words in a query plan which mean that a query does not use the indexes.
+FORBIDDEN_PLAN_STEPS = ['SCAN', 'TEMP B-TREE']
+
+
+class RecordingDatabase(MultiChainDB):
+    """
+    MultiChainDB which records the statements it executes.
+    """
+
+    def __init__(self, path):
+        self.statements = []
+        super(RecordingDatabase, self).__init__(path)
+
+    def execute(self, statement, bindings=(), get_lastrowid=False):
+        self.statements.append((statement, bindings))
+        return super(RecordingDatabase, self).execute(statement, bindings, get_lastrowid)
+
+
+def lookups(public_key, sequence_number):
+    """
+    Returns the names and arguments of the lookups for a public key.
+    """
+    return [
+        ('get_blocks', (public_key,)),
+        ('get_blocks_since', (public_key, sequence_number)),
+        ('get_by_public_key_and_sequence_number', (public_key, sequence_number)),
+        ('get_latest_hash', (public_key,)),
+        ('get_latest_sequence_number', (public_key,)),
+        ('get_total', (public_key,)),
+        ('get_num_unique_interactors', (public_key,)),
+    ]
+
+
+def check_plans(database, public_key):
+    """
+    Returns the query plan steps of the lookups which do not use an index.
+    """
+    failures = []
+    for name, arguments in lookups(public_key, 0):
+        del database.statements[:]
+        getattr(database, name)(*arguments)
+        for statement, bindings in list(database.statements):
+            for step in database.execute(u"EXPLAIN QUERY PLAN " + statement, bindings).fetchall():
+                detail = step[-1]
+                if any(word in detail for word in FORBIDDEN_PLAN_STEPS):
+                    failures.append((name, detail))
+    return failures
+
+
+@click.command()
+@click.option('--blocks', default=1000000, help="Number of blocks of the generated database.")
+@click.option('--lookups', 'num_lookups', default=1000, help="Number of public keys looked up per query.")
+@click.option('--path', default=None, help="Database to use, generated if it does not exist.")
+def main(blocks, num_lookups, path):
+    """
+    Runs the benchmark, prints a table of timings and exits with an error
+    when a query plan does not use the indexes.
+    """
+    temporary = path is None
+    if temporary:
+        handle, path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        os.remove(path)
+
+    try:
+        if not os.path.exists(path):
+            start = time.time()
+            generate_database(path, blocks)
+            print "Generated %d blocks in %.1f s" % (blocks, time.time() - start)
+
+        start = time.time()
+        database = RecordingDatabase(path)
+        print "Opened and upgraded the database in %.1f s" % (time.time() - start)
+
+        public_keys = [str(public_key) for (public_key,) in database.get_unique_public_keys()]
+        random = np.random.RandomState(0)
+        sample = [public_keys[i] for i in random.randint(0, len(public_keys), num_lookups)]
+
+        failures = check_plans(database, sample[0])
+        for name, detail in failures:
+            print "%s does not use the indexes: %s" % (name, detail)
+
+        sequence_numbers = [database.get_latest_sequence_number(public_key) // 2 for public_key in sample]
+        print "%40s %12s" % ('lookup', 'mean (ms)')
+        for index, (name, _) in enumerate(lookups(None, None)):
+            method = getattr(database, name)
+            start = time.time()
+            for public_key, sequence_number in zip(sample, sequence_numbers):
+                method(*lookups(public_key, sequence_number)[index][1])
+            print "%40s %12.3f" % (name, (time.time() - start) / len(sample) * 1000)
+    finally:
+        if temporary and os.path.exists(path):
+            os.remove(path)
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
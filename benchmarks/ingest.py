@@ -0,0 +1,78 @@
+"""
+Benchmark of loading blocks into a MultiChain database: add_block with a
+commit per block, add_blocks in one transaction and add_blocks in the
+ingest mode with WAL and deferred indexes, followed by
+update_blocks_with_responder on all blocks.
+
+Usage: python -m benchmarks.ingest [--blocks 500000] [--single 2000] [--batch-size 10000] [--directory /tmp]
+"""
+import os
+import shutil
+import tempfile
+import time
+
+import click
+
+from attestation.database import MultiChainDB, schema
+from benchmarks.synthetic import generate_block_table, iter_database_blocks
+
+
+def create_database(directory, name):
+    """
+    Creates an empty database with the latest schema.
+    """
+    database = MultiChainDB(os.path.join(directory, name + '.db'))
+    database.executescript(schema)
+    return database
+
+
+def load_single(database, blocks, batch_size):
+    for block in blocks:
+        database.add_block(block)
+
+
+def load_batched(database, blocks, batch_size):
+    database.add_blocks(blocks, batch_size)
+
+
+def load_ingest(database, blocks, batch_size):
+    with database.ingest():
+        database.add_blocks(blocks, batch_size)
+
+
+def update_responders(database, blocks, batch_size):
+    database.update_blocks_with_responder(blocks, batch_size)
+
+
+@click.command()
+@click.option('--blocks', default=500000, help="Number of blocks loaded by add_blocks.")
+@click.option('--single', default=2000, help="Number of blocks loaded by add_block.")
+@click.option('--batch-size', default=10000, help="Number of blocks per executemany call.")
+@click.option('--directory', default=None, help="Directory of the databases, a temporary one by default.")
+def main(blocks, single, batch_size, directory):
+    """
+    Runs the benchmark and prints a table of load rates.
+    """
+    blocks = list(iter_database_blocks(generate_block_table(blocks)))
+    directory = tempfile.mkdtemp(dir=directory)
+    runs = [('add_block', load_single, blocks[:single], 'single'),
+            ('add_blocks', load_batched, blocks, 'batched'),
+            ('ingest', load_ingest, blocks, 'ingest'),
+            ('update', update_responders, blocks, 'ingest')]
+
+    print "%12s %10s %10s %12s" % ('method', 'blocks', 'time (s)', 'blocks/s')
+    try:
+        databases = {}
+        for name, function, run_blocks, database_name in runs:
+            if database_name not in databases:
+                databases[database_name] = create_database(directory, database_name)
+            start = time.time()
+            function(databases[database_name], run_blocks, batch_size)
+            elapsed = time.time() - start
+            print "%12s %10d %10.2f %12.0f" % (name, len(run_blocks), elapsed, len(run_blocks) / elapsed)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
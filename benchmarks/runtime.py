@@ -0,0 +1,57 @@
+"""
+Benchmark of concurrent pairwise audits in the AgentRuntime: audits per
+second of wall time for different limits on the number of concurrent audit
+sessions.
+
+Usage: python -m benchmarks.runtime [--blocks 10000] [--audits 2000] [--concurrency 1,100,10000]
+"""
+import os
+import sys
+import time
+
+import click
+
+from network.network import Network
+from network.runtime import AgentRuntime
+from benchmarks.synthetic import generate_block_table
+from benchmarks.scheduler import random_pairs
+
+
+@click.command()
+@click.option('--blocks', default=10000, help="Number of blocks of the synthetic network.")
+@click.option('--audits', default=2000, help="Number of audits per run.")
+@click.option('--concurrency', default="1,100,10000", help="Comma separated limits on concurrent audits.")
+@click.option('--full', is_flag=True, help="Exchange all blocks instead of reconciling.")
+def main(blocks, audits, concurrency, full):
+    """
+    Runs the benchmark and prints a table of throughputs.
+    """
+    table = generate_block_table(blocks)
+    print "%12s %10s %10s %12s %12s" % ('concurrency', 'audits', 'messages', 'wall (s)', 'audits/s')
+    for limit in [int(limit) for limit in concurrency.split(',')]:
+        network = Network.from_block_table(table)
+        runtime = AgentRuntime(network, concurrency=limit)
+        network.set_runtime(runtime)
+        public_keys = sorted(network.agents, key=lambda public_key: public_key.to_hex())
+        finished = []
+
+        # Agents print progress messages while auditing.
+        stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+        try:
+            start = time.time()
+            for requester, responder in random_pairs(public_keys, audits):
+                audit = network.pairwise_audit(network.get_agent(requester), network.get_agent(responder),
+                                               reconcile=not full)
+                audit.addCallback(finished.append)
+            runtime.run()
+            wall_time = time.time() - start
+        finally:
+            sys.stdout = stdout
+
+        assert len(finished) == audits
+        print "%12d %10d %10d %12.3f %12.1f" % (limit, len(finished), runtime.delivered, wall_time,
+                                                len(finished) / wall_time)
+
+
+if __name__ == '__main__':
+    main()
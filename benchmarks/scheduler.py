@@ -0,0 +1,69 @@
+"""
+Benchmark of the discrete-event scheduler: many pairwise audits are started
+at once and delivered by one event loop.
+
+Usage: python -m benchmarks.scheduler [--blocks 10000] [--audits 100,1000,10000]
+"""
+import os
+import sys
+import time
+
+import click
+import numpy as np
+
+from network.network import Network
+from network.scheduler import Scheduler
+from benchmarks.synthetic import generate_block_table
+
+
+def random_pairs(public_keys, count, seed=0):
+    """
+    Returns count distinct unordered pairs of public keys.
+    """
+    random = np.random.RandomState(seed)
+    pairs = set()
+    while len(pairs) < count:
+        first, second = random.choice(len(public_keys), 2, replace=False)
+        pairs.add((min(first, second), max(first, second)))
+    return [(public_keys[first], public_keys[second]) for first, second in sorted(pairs)]
+
+
+@click.command()
+@click.option('--blocks', default=10000, help="Number of blocks of the synthetic network.")
+@click.option('--audits', default="100,1000,10000", help="Comma separated numbers of concurrent audits.")
+@click.option('--latency', default=0.05, help="Link latency in seconds.")
+@click.option('--bandwidth', default=1e6, help="Link bandwidth in bytes per second.")
+@click.option('--full', is_flag=True, help="Exchange all blocks instead of reconciling.")
+def main(blocks, audits, latency, bandwidth, full):
+    """
+    Runs the benchmark and prints a table with the number of delivered
+    messages, the simulated duration and the wall time throughput.
+    """
+    table = generate_block_table(blocks)
+    print "%10s %10s %10s %14s %12s %14s" % ('audits', 'messages', 'MB', 'simulated (s)', 'wall (s)',
+                                             'messages/s')
+    for count in [int(count) for count in audits.split(',')]:
+        network = Network.from_block_table(table)
+        scheduler = Scheduler(network, latency, bandwidth)
+        network.set_scheduler(scheduler)
+        public_keys = sorted(network.agents, key=lambda public_key: public_key.to_hex())
+
+        # Agents print progress messages while auditing.
+        stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+        try:
+            start = time.time()
+            for requester, responder in random_pairs(public_keys, count):
+                network.pairwise_audit(network.get_agent(requester), network.get_agent(responder),
+                                       reconcile=not full)
+            scheduler.run()
+            wall_time = time.time() - start
+        finally:
+            sys.stdout = stdout
+
+        print "%10d %10d %10.1f %14.3f %12.3f %14.0f" % (count, scheduler.delivered,
+                                                        scheduler.delivered_bytes / 1e6, scheduler.now,
+                                                        wall_time, scheduler.messages_per_second())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark of the sharded network simulation: wall time of pairwise audits
+and of increasing the data to a number of hops, for different numbers of
+worker processes. The speedup is relative to a single worker, so it
+includes the cost of serializing messages between shards.
+
+Usage: python -m benchmarks.sharding [--blocks 10000] [--audits 2000] [--hops 2] [--workers 1,2,4,8,16]
+"""
+import multiprocessing
+import os
+import sys
+import time
+
+import click
+
+from network.network import Network
+from network.sharding import ShardedNetwork
+from benchmarks.synthetic import generate_block_table
+from benchmarks.scheduler import random_pairs
+
+
+def run(network, workers, pairs, hops, full):
+    """
+    Runs the audits and the hop requests on a sharded network.
+
+    :return: Tuple of the wall times of the audits and of the hop requests
+    and the number of delivered messages
+    """
+    sharded = ShardedNetwork(network, workers)
+    try:
+        start = time.time()
+        for requester, responder in pairs:
+            sharded.pairwise_audit(requester, responder, reconcile=not full, wait=False)
+        sharded.wait()
+        audit_time = time.time() - start
+
+        start = time.time()
+        sharded.increase_data_to_hops(hops)
+        hop_time = time.time() - start
+
+        delivered, _ = sharded.get_stats()
+    finally:
+        sharded.stop()
+    return audit_time, hop_time, delivered
+
+
+@click.command()
+@click.option('--blocks', default=10000, help="Number of blocks of the synthetic network.")
+@click.option('--audits', default=2000, help="Number of audits per run.")
+@click.option('--hops', default=2, help="Number of hops to increase the data to.")
+@click.option('--workers', default="1,2,4,8,16", help="Comma separated numbers of worker processes.")
+@click.option('--full', is_flag=True, help="Exchange all blocks instead of reconciling.")
+def main(blocks, audits, hops, workers, full):
+    """
+    Runs the benchmark and prints a table of wall times and speedups.
+    """
+    table = generate_block_table(blocks)
+    network = Network.from_block_table(table)
+    public_keys = sorted(network.agents, key=lambda public_key: public_key.to_hex())
+    pairs = random_pairs(public_keys, audits)
+
+    print "%d CPUs" % multiprocessing.cpu_count()
+    print "%8s %12s %12s %10s %12s %12s %10s" % ('workers', 'messages', 'audits (s)', 'speedup',
+                                                 'audits/s', 'hops (s)', 'speedup')
+    baseline = None
+    for count in [int(count) for count in workers.split(',')]:
+        # Agents print progress messages, the workers inherit stdout.
+        stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+        try:
+            audit_time, hop_time, delivered = run(network, count, pairs, hops, full)
+        finally:
+            sys.stdout = stdout
+
+        if baseline is None:
+            baseline = (audit_time, hop_time)
+        print "%8d %12d %12.3f %10.2f %12.1f %12.3f %10.2f" % (count, delivered, audit_time,
+                                                               baseline[0] / audit_time, audits / audit_time,
+                                                               hop_time, baseline[1] / hop_time)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Synthetic interaction data for benchmarks.
+"""
+import os
+
+import numpy as np
+
+from attestation.block_table import BLOB_FIELDS, BlockTable
+from attestation.database import DatabaseBlock, MultiChainDB, schema
+
+KEY_PREFIX = 'LibNaCLPK:'
+
+
+def generate_block_table(num_blocks, num_agents=None, seed=0):
+    """
+    Generates a BlockTable with random interactions between agents. Agent
+    activity follows a heavy-tailed distribution, about half of all blocks
+    only transfer data in one direction and the sequence numbers of every
+    agent form a complete chain.
+
+    :param num_blocks: Number of blocks in the table.
+    :param num_agents: Number of agents, num_blocks / 10 by default.
+    """
+    random = np.random.RandomState(seed)
+    if num_agents is None:
+        num_agents = max(2, num_blocks // 10)
+
+    public_keys = [KEY_PREFIX + random.bytes(64) for _ in range(num_agents)]
+
+    activity = 1.0 / np.arange(1, num_agents + 1)
+    activity /= activity.sum()
+    requester = random.choice(num_agents, num_blocks, p=activity)
+    responder = (requester + random.randint(1, num_agents, num_blocks)) % num_agents
+
+    # Sequence numbers count the earlier participations of each agent.
+    participants = np.column_stack([requester, responder]).ravel()
+    order = np.argsort(participants, kind='mergesort')
+    sorted_participants = participants[order]
+    starts = np.flatnonzero(np.r_[True, sorted_participants[1:] != sorted_participants[:-1]])
+    run_lengths = np.diff(np.r_[starts, len(participants)])
+    sequence_numbers = np.empty(len(participants), dtype=np.int64)
+    sequence_numbers[order] = np.arange(len(participants)) - np.repeat(starts, run_lengths)
+    sequence_numbers = sequence_numbers.reshape(-1, 2)
+
+    up = random.randint(1, 100, num_blocks) * (random.rand(num_blocks) < 0.75)
+    down = random.randint(1, 100, num_blocks) * (random.rand(num_blocks) < 0.75)
+
+    # Every hash and signature is a unique 8 byte string.
+    num_blobs = num_blocks * len(BLOB_FIELDS)
+    blobs = np.arange(num_blobs, dtype='>u8').tostring()
+    blob_offsets = np.arange(num_blobs + 1, dtype=np.int64) * 8
+
+    return BlockTable(public_keys, requester.astype(np.int32), responder.astype(np.int32),
+                      up.astype(np.int64), down.astype(np.int64),
+                      sequence_numbers[:, 0], sequence_numbers[:, 1], blobs, blob_offsets)
+
+
+def generate_halfblocks(num_blocks, num_agents=None, seed=0):
+    """
+    Generates a list of halfblocks, two per generated block.
+    """
+    table = generate_block_table(num_blocks, num_agents, seed)
+    return [halfblock for pair in table.iter_halfblocks() for halfblock in pair]
+
+
+def iter_database_blocks(table):
+    """
+    Generates a DatabaseBlock for every block of a BlockTable. The totals of
+    all blocks are zero.
+    """
+    fields = len(BLOB_FIELDS)
+    positions = [BLOB_FIELDS.index(field) for field in ['previous_hash_requester', 'signature_requester',
+                                                         'hash_requester', 'previous_hash_responder',
+                                                         'signature_responder', 'hash_responder']]
+    offsets = table.blob_offsets.tolist()
+    columns = zip(table.requester.tolist(), table.responder.tolist(), table.up.tolist(), table.down.tolist(),
+                  table.sequence_number_requester.tolist(), table.sequence_number_responder.tolist())
+    for index, (requester, responder, up, down, sequence_number_requester, sequence_number_responder) \
+            in enumerate(columns):
+        blobs = [table.blobs[offsets[index * fields + position]:offsets[index * fields + position + 1]]
+                 for position in positions]
+        yield DatabaseBlock((table.public_keys[requester], table.public_keys[responder], up, down,
+                             0, 0, sequence_number_requester, blobs[0], blobs[1], blobs[2],
+                             0, 0, sequence_number_responder, blobs[3], blobs[4], blobs[5], None))
+
+
+def generate_database(path, num_blocks, num_agents=None, seed=0):
+    """
+    Writes a MultiChain database with the blocks of generate_block_table to
+    a new file, replacing any existing file.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    database = MultiChainDB(path)
+    database.executescript(schema)
+    with database.ingest():
+        database.add_blocks(iter_database_blocks(generate_block_table(num_blocks, num_agents, seed)))
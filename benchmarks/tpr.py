@@ -0,0 +1,92 @@
+"""
+Benchmark of the sparse temporal PageRank engine against the networkx
+implementation. Before the timings, both are compared on blocks of which
+the newest responder halves are not signed yet and have the sequence
+number -1, and the benchmark fails if their scores differ.
+
+Usage: python -m benchmarks.tpr [--sizes 10000,100000,1000000]
+"""
+import sys
+import time
+
+import click
+import numpy as np
+
+from attestation.public_key import PublicKey
+from ranking.temporal_graph import TemporalGraph
+from ranking.temporal_page_rank import calculate_tpr, calculate_tpr_networkx
+from benchmarks.synthetic import generate_block_table
+
+
+def most_active_agent(table):
+    """
+    Returns the public key of the agent with the longest chain.
+    """
+    return PublicKey(table.public_keys[int(np.argmax(table.chain_lengths()))])
+
+
+def unsigned_difference(num_blocks=200, num_agents=10, num_unsigned=10):
+    """
+    Returns the largest difference between calculate_tpr and
+    calculate_tpr_networkx over all agents, on blocks whose last
+    num_unsigned responder halves have the sequence number -1.
+    """
+    table = generate_block_table(num_blocks, num_agents)
+    pairs = list(table.iter_halfblocks())
+    for block_req, block_res in pairs[-num_unsigned:]:
+        block_res.sequence_number = -1
+        block_req.link_sequence_number = -1
+    blocks = [halfblock for pair in pairs for halfblock in pair]
+
+    difference = 0.0
+    for bin_key in table.public_keys:
+        public_key = PublicKey(bin_key)
+        result = calculate_tpr(public_key, blocks)
+        reference = calculate_tpr_networkx(public_key, blocks)
+        keys = set(result) | set(reference)
+        difference = max([difference] + [abs(result.get(key, 0.0) - reference.get(key, 0.0)) for key in keys])
+    return difference
+
+
+@click.command()
+@click.option('--sizes', default="10000,100000,1000000", help="Comma separated numbers of blocks.")
+@click.option('--networkx-limit', default=100000, help="Largest size also run with networkx.")
+def main(sizes, networkx_limit):
+    """
+    Runs the benchmark and prints a table of timings.
+    """
+    difference = unsigned_difference()
+    print "Max diff with unsigned responder halves: %.2e" % difference
+    if difference > 1e-9:
+        sys.exit(1)
+
+    print "%10s %10s %12s %12s %12s %12s" % ('blocks', 'nodes', 'build (s)', 'rank (s)',
+                                             'networkx (s)', 'max diff')
+    for size in [int(size) for size in sizes.split(',')]:
+        table = generate_block_table(size)
+        blocks = [halfblock for pair in table.iter_halfblocks() for halfblock in pair]
+        public_key = most_active_agent(table)
+
+        start = time.time()
+        graph = TemporalGraph.from_blocks(blocks)
+        build_time = time.time() - start
+
+        start = time.time()
+        scores, _ = graph.pagerank(graph.personalization(public_key))
+        result = graph.agent_scores(scores)
+        rank_time = time.time() - start
+
+        networkx_time = float('nan')
+        difference = float('nan')
+        if size <= networkx_limit:
+            start = time.time()
+            reference = calculate_tpr_networkx(public_key, blocks)
+            networkx_time = time.time() - start
+            difference = max(abs(result[key] - score) for key, score in reference.iteritems())
+
+        print "%10d %10d %12.3f %12.3f %12.3f %12.2e" % (size, len(graph), build_time, rank_time,
+                                                        networkx_time, difference)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,3 @@
-from progress.bar import Bar
 from base_experiment import BaseExperiment
 import matplotlib.pyplot as plt
 
@@ -7,23 +6,12 @@ class Experiment(BaseExperiment):
     Test experiment to test functions.
     """
     def run(self):
-        agents = self.net.list_agents()
-
-        data_length = []
-        for a in agents:
-            agent = self.net.get_agent(a)
-            data_length.append(len(agent.interactions.list_public_keys())/float(len(agents)))
-
-        self.result = [sorted(data_length)]
-
-        self.net.increase_data_to_hops(2)
-
-        data_length_after = []
-        for a in Bar('getting data length').iter(agents):
-            agent = self.net.get_agent(a)
-            data_length_after.append(len(agent.interactions.list_public_keys())/float(len(agents)))
+        # Fraction of the network known to every agent before and after
+        # increasing the data to 2 hops, computed on the partner matrix
+        # instead of exchanging chains.
+        _, coverage = self.net.get_hop_coverage(2)
 
-        self.result.append(sorted(data_length_after))
+        self.result = [sorted(coverage[0]), sorted(coverage[1])]
 
     def visualize(self):
         agents = self.net.list_agents()
@@ -10,12 +10,18 @@ class BaseExperiment(object):
     The BaseExperiment defines the interface for an experiment.
     """
 
-    def __init__(self, database):
+    def __init__(self, database, snapshot=None):
         """
         Creates an experiment.
+
+        :param snapshot: Optional snapshot directory of the database, see
+        Network.from_snapshot.
         """
         self.database = MultiChainDB(database)
-        self.net = Network.from_database(self.database)
+        if snapshot is None:
+            self.net = Network.from_database(self.database)
+        else:
+            self.net = Network.from_snapshot(snapshot, self.database)
         self.viz = VisualizationHandler(self.net)
         self.result = None
 
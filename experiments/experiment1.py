@@ -7,10 +7,14 @@ class Experiment(BaseExperiment):
 
         amount_of_data = []
         for i in range(35):
-            self.net.pairwise_audit(agent)
-            amount_of_data.append(len(agent.interactions.get_blocks()))
+            self.net.pairwise_audit(agent, reconcile=True)
+            audit = agent.audit_log[-1]
+            amount_of_data.append((len(agent.interactions),
+                                   audit['bytes_sent'] + audit['bytes_received']))
 
         self.result = amount_of_data
     
     def visualize(self):
-        print self.result
+        print "%6s %10s %14s" % ('audit', 'blocks', 'bytes moved')
+        for i, (blocks, transferred) in enumerate(self.result):
+            print "%6d %10d %14d" % (i, blocks, transferred)
@@ -0,0 +1,30 @@
+import random
+
+from base_experiment import BaseExperiment
+
+class Experiment(BaseExperiment):
+    """
+    Repeats pairwise audits of the most active agent with random partners and
+    re-ranks incrementally after every audit, comparing the warm-started
+    power iteration with a cold start on the same graph.
+    """
+    def run(self, audits=20, seed=0):
+        agents = self.net.list_agents()
+        agent = max(agents.itervalues(), key=lambda candidate: len(candidate.interactions))
+        partners = sorted((key for key in agents if key != agent.public_key), key=lambda key: key.to_hex())
+        rand = random.Random(seed)
+
+        agent.calculate_ranking(incremental=True, compare=True)
+        for _ in range(audits):
+            partner = self.net.get_agent(rand.choice(partners))
+            self.net.pairwise_audit(agent, partner, reconcile=True)
+            agent.calculate_ranking(incremental=True, compare=True)
+
+        self.result = agent.get_ranking_stats()
+
+    def visualize(self):
+        print "%6s %10s %10s %8s %8s %8s" % ('rank', 'new blocks', 'nodes', 'warm', 'cold', 'saved')
+        for i, record in enumerate(self.result):
+            print "%6d %10d %10d %8d %8d %8d" % (i, record['blocks'], record['nodes'], record['iterations'],
+                                                 record['cold_iterations'], record['saved'])
+        print "iterations saved in total: %d" % sum(record['saved'] for record in self.result)
@@ -0,0 +1,27 @@
+from network.network import Network
+from base_experiment import BaseExperiment
+
+class Experiment(BaseExperiment):
+    """
+    Compares the memory used by the interaction sets of all agents with plain
+    Python sets and with bitmaps over a shared block arena, before and after
+    spreading the data to two hops.
+    """
+    def run(self):
+        arena_net = Network.from_database(self.database, use_arena=True)
+
+        self.result = {}
+        for name, net in [('sets', self.net), ('arena', arena_net)]:
+            before = net.memory_usage()
+            net.increase_data_to_hops(2)
+            after = net.memory_usage()
+            blocks = sum(len(agent.interactions) for agent in net.agents.itervalues())
+            self.result[name] = (before, after, blocks)
+
+    def visualize(self):
+        print "%-6s %16s %16s %16s %14s" % ('mode', 'initial (bytes)', 'two hops (bytes)',
+                                           'block references', 'bytes/block')
+        for name in ['sets', 'arena']:
+            before, after, blocks = self.result[name]
+            print "%-6s %16d %16d %16d %14.2f" % (name, before, after, blocks,
+                                                  after / float(max(blocks, 1)))
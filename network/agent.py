@@ -2,10 +2,16 @@
 This module defines the Agent class.
 """
 from ranking.temporal_page_rank import calculate_tpr
+from ranking.incremental import IncrementalRanking
+from ranking.cache import CACHE
+from ranking.local_push import calculate_tpr_push
 from interaction_set import InteractionSet
 from chain import Chain
 from messages import Message, MessageTypes
-from endorsement import Endorsement
+from endorsement import Endorsement, EndorsementStore
+from hops import hop_rings
+from reconciliation import IBLT, CELL_SIZE, DIGEST_SIZE, estimate_difference, get_blocks_by_digests, \
+    get_digests, halfblock_size, sample_digests, sketch_size
 
 class Agent(object):
     """
@@ -16,17 +22,30 @@ class Agent(object):
     key, which we assume to be live-long.
     """
 
-    def __init__(self, network_interface, public_key):
+    def __init__(self, network_interface, public_key, interactions=None, endorsements=None):
         """
         Creates a new agent with the given public_key.
+
+        :param interactions: Interaction set to use as private data, a new
+        InteractionSet by default.
+        :param endorsements: EndorsementStore to keep the endorsements made
+        by the agent in, a new store by default.
         """
-        self.interactions = InteractionSet()
+        self.interactions = interactions if interactions is not None else InteractionSet()
         self.chain = Chain()
         self.public_key = public_key
         self.interface = network_interface
         self.messages = []
         self.accounting_policy = lambda *args: -1
-        self.endorsements = []
+        self.endorsements = endorsements if endorsements is not None else EndorsementStore()
+        self.audits = {}
+        self.audit_log = []
+        self.audit_listeners = []
+        self.ranking = None
+        self.ranking_cache = CACHE
+        self.hop_requests = {}
+        self.hop_visited = {}
+        self.hop_memo = None
 
     def subjective_interaction_graph(self):
         """
@@ -43,26 +62,73 @@ class Agent(object):
 
         if message.type == MessageTypes.PA_BLOCKS:
             print "replying blocks"
+            blocks = self.interactions.get_blocks()
             reply = Message(MessageTypes.PA_BLOCKS_REPLY,
                             self.public_key,
-                            self.interactions.get_blocks())
+                            blocks)
+            self._get_audit(message.sender)['mode'] = 'full'
+            self._count_received(message.sender, message.payload)
             self.interactions.add_blocks(message.payload)
+            self._count_sent(message.sender, blocks)
             self.interface.send(message.sender, reply)
         if message.type == MessageTypes.PA_BLOCKS_REPLY:
             print "sending score"
+            self._count_received(message.sender, message.payload)
             self.interactions.add_blocks(message.payload)
-            reply = Message(MessageTypes.PA_SCORE,
-                            self.public_key,
-                            True)
-            self.interface.send(message.sender, reply)
-            self.endorsements.append(Endorsement([self.public_key, message.sender, True]))
+            self._send_score(message.sender)
         if message.type == MessageTypes.PA_SCORE:
             print "replying score"
             reply = Message(MessageTypes.PA_SCORE_REPLY,
                             self.public_key,
                             True)
-            self.endorsements.append(Endorsement([self.public_key, message.sender, True]))
+            self.endorsements.add(Endorsement([self.public_key, message.sender, True]))
+            self._count_received(message.sender, size=1)
+            self._count_sent(message.sender, size=1)
+            self._finish_audit(message.sender)
+            self.interface.send(message.sender, reply)
+        if message.type == MessageTypes.PA_SCORE_REPLY:
+            self._count_received(message.sender, size=1)
+            self._finish_audit(message.sender)
+        if message.type == MessageTypes.PA_SKETCH:
+            sketch, sample = message.payload
+            record = self._get_audit(message.sender)
+            record['mode'] = 'reconcile'
+            record['rounds'] += 1
+            self._count_received(message.sender, size=sketch.size() + DIGEST_SIZE * len(sample))
+            _, digests = get_digests(self.interactions)
+            difference = sketch.subtract(IBLT.from_digests(digests, len(sketch))).decode()
+            if difference is None:
+                reply = Message(MessageTypes.PA_SKETCH_RETRY,
+                                self.public_key,
+                                estimate_difference(sample, sample_digests(digests)))
+                self._count_sent(message.sender, size=8)
+            else:
+                missing, extra = difference
+                blocks = get_blocks_by_digests(self.interactions, extra)
+                reply = Message(MessageTypes.PA_DELTA,
+                                self.public_key,
+                                (blocks, missing))
+                self._count_sent(message.sender, blocks, DIGEST_SIZE * len(missing))
+            self.interface.send(message.sender, reply)
+        if message.type == MessageTypes.PA_SKETCH_RETRY:
+            self._count_received(message.sender, size=8)
+            record = self._get_audit(message.sender)
+            num_cells = max(2 * record['sketch_cells'], sketch_size(message.payload))
+            self._send_sketch(message.sender, num_cells)
+        if message.type == MessageTypes.PA_DELTA:
+            blocks, missing = message.payload
+            self._count_received(message.sender, blocks, DIGEST_SIZE * len(missing))
+            reply_blocks = get_blocks_by_digests(self.interactions, missing)
+            self.interactions.add_blocks(blocks)
+            reply = Message(MessageTypes.PA_DELTA_REPLY,
+                            self.public_key,
+                            reply_blocks)
+            self._count_sent(message.sender, reply_blocks)
             self.interface.send(message.sender, reply)
+            self._send_score(message.sender)
+        if message.type == MessageTypes.PA_DELTA_REPLY:
+            self._count_received(message.sender, message.payload)
+            self.interactions.add_blocks(message.payload)
         if message.type == MessageTypes.CHAIN:
             reply = Message(MessageTypes.CHAIN_REPLY,
                             self.public_key,
@@ -70,50 +136,132 @@ class Agent(object):
             self.interface.send(message.sender, reply)
         if message.type == MessageTypes.CHAIN_REPLY:
             self.interactions.add_blocks(message.payload.get_blocks())
+            remaining = self.hop_requests.pop(message.sender, 0)
+            if remaining > 1:
+                for partner in message.payload.get_partner_agents():
+                    self._request_hop(partner, remaining - 1)
 
-    def initiate_pairwise_auditing(self, public_key_responder):
+    def initiate_pairwise_auditing(self, public_key_responder, reconcile=False):
         """
         Starts a pairwise auditing session with the agent corresponding to
         `public_key_responder`.
+
+        :param reconcile: Exchange only the symmetric difference of the two
+        interaction sets, found with an IBLT sketch, instead of all blocks.
         """
         responder = public_key_responder
         if responder is None:
             responder = self.get_next_audit_partner()
+            if responder is None:
+                return
 
         print "Starting audit with %s" % responder.to_hex()[:10]
 
-        message = Message(MessageTypes.PA_BLOCKS, self.public_key, self.interactions.get_blocks())
+        self._get_audit(responder)['mode'] = 'reconcile' if reconcile else 'full'
+        if reconcile:
+            self._send_sketch(responder, sketch_size(0))
+        else:
+            self._send_blocks(responder)
+
+    def _send_blocks(self, responder):
+        """
+        Sends all known blocks to the audit partner.
+        """
+        blocks = self.interactions.get_blocks()
+        message = Message(MessageTypes.PA_BLOCKS, self.public_key, blocks)
+        self._count_sent(responder, blocks)
         self.interface.send(responder, message)
 
-    def get_endorsements_by_candidate(self, agent):
+    def _send_sketch(self, responder, num_cells):
         """
-        Returns a list of endorsements of an agent. If none exist,
-        returns None.
+        Sends an IBLT sketch of the known blocks to the audit partner. Falls
+        back to sending all blocks once the sketch is not smaller than them.
+        """
+        blocks, digests = get_digests(self.interactions)
+        if num_cells * CELL_SIZE >= sum(halfblock_size(block) for block in blocks):
+            self._get_audit(responder)['mode'] = 'full'
+            self._send_blocks(responder)
+            return
+
+        sketch = IBLT.from_digests(digests, num_cells)
+        sample = sample_digests(digests)
+        record = self._get_audit(responder)
+        record['sketch_cells'] = len(sketch)
+        record['rounds'] += 1
+        message = Message(MessageTypes.PA_SKETCH, self.public_key, (sketch, sample))
+        self._count_sent(responder, size=sketch.size() + DIGEST_SIZE * len(sample))
+        self.interface.send(responder, message)
+
+    def _send_score(self, partner):
+        """
+        Sends the outcome of the audit to the audit partner.
+        """
+        reply = Message(MessageTypes.PA_SCORE,
+                        self.public_key,
+                        True)
+        self._count_sent(partner, size=1)
+        self.endorsements.add(Endorsement([self.public_key, partner, True]))
+        self.interface.send(partner, reply)
+
+    def _get_audit(self, partner):
+        """
+        Returns the record of the running audit with a partner.
+        """
+        record = self.audits.get(partner)
+        if record is None:
+            record = {'partner': partner, 'mode': None, 'rounds': 0, 'sketch_cells': 0,
+                      'blocks_sent': 0, 'blocks_received': 0, 'bytes_sent': 0, 'bytes_received': 0}
+            self.audits[partner] = record
+        return record
+
+    def _count_sent(self, partner, blocks=(), size=0):
         """
+        Adds sent blocks and bytes to the record of an audit.
+        """
+        record = self._get_audit(partner)
+        record['blocks_sent'] += len(blocks)
+        record['bytes_sent'] += size + sum(halfblock_size(block) for block in blocks)
 
-        result = []
-        for endorsement in self.endorsements:
-            if endorsement.subject == agent:
-                result.append(endorsement)
+    def _count_received(self, partner, blocks=(), size=0):
+        """
+        Adds received blocks and bytes to the record of an audit.
+        """
+        record = self._get_audit(partner)
+        record['blocks_received'] += len(blocks)
+        record['bytes_received'] += size + sum(halfblock_size(block) for block in blocks)
 
-        if len(result) == 0:
-            return None
+    def _finish_audit(self, partner):
+        """
+        Moves the record of a finished audit to the audit log and passes it
+        to the audit listeners.
+        """
+        record = self.audits.pop(partner, None)
+        if record is not None:
+            self.audit_log.append(record)
+            for listener in self.audit_listeners:
+                listener(self, record)
 
-        return result
+    def get_endorsements_by_candidate(self, agent):
+        """
+        Returns a list of endorsements of an agent. If none exist,
+        returns None.
+        """
+        return self.endorsements.get_by_subject(agent) or None
 
     def get_next_audit_partner(self):
         """
         Chooses a random audit partner that is close and has not been audited
-        before.
+        before. Returns None if every reachable agent has been audited.
         """
 
         hops = 1
-        partner = None
-        while not partner:
+        while True:
             hop_partners = self.get_hop_agents(hops)
+            if not hop_partners:
+                return None
 
             for candidate in hop_partners:
-                if self.get_endorsements_by_candidate(candidate) is None:
+                if not self.endorsements.has_subject(candidate):
                     return candidate
 
             hops += 1
@@ -131,66 +279,119 @@ class Agent(object):
         message = Message(MessageTypes.CHAIN, self.public_key)
         self.interface.send(public_key, message)
 
-    def obtain_data_from_hops(self, hops):
+    def obtain_data_from_hops(self, hops, adjacency=None):
         """
         Get the chains of all known agents.
+
+        The chains of the partners are requested, and every received chain
+        leads to requests for the chains of its partners until hops - 1
+        rounds of requests are made. A chain is only requested again if it is
+        reached with more rounds left than before.
+
+        :param adjacency: PartnerAdjacency of the network. With it, the
+        chains of all agents up to hops - 1 hops away are requested at once.
         """
         if hops < 2:
             return
 
-        partners = self.chain.get_partner_agents()
-        for _ in range(1, hops):
-            new_partners = []
+        self.hop_visited = {self.public_key: hops}
+        if adjacency is not None:
+            for ring in adjacency.rings(self.public_key, hops - 1):
+                for public_key in ring:
+                    self._request_hop(public_key, 1)
+            return
 
-            for partner in partners:
-                self.request_data(partner)
-                chain = self.messages[-1].payload
-                new_partners += chain.get_partner_agents()
+        for partner in self.chain.get_partner_agents():
+            self._request_hop(partner, hops - 1)
 
-            partners += new_partners
+    def _request_hop(self, public_key, remaining):
+        """
+        Requests the chain of an agent during obtain_data_from_hops, unless
+        it was requested before with at least as many rounds left.
+
+        :param remaining: Number of request rounds left including this one.
+        """
+        if self.hop_visited.get(public_key, 0) >= remaining:
+            return
+
+        self.hop_visited[public_key] = remaining
+        self.hop_requests[public_key] = remaining
+        self.request_data(public_key)
+
+    def get_hop_rings(self, hops):
+        """
+        Returns the rings of agents at exactly 1 up to hops hops away, found
+        by breadth-first search over the personal chains. The rings are kept
+        until one of the chains they were found from changes.
+        """
+        memo = self.hop_memo
+        if memo is None or len(memo[0]) < hops or \
+                any(chain.modifications != modifications for chain, modifications in memo[1]):
+            chains = []
+
+            def get_partners(public_key):
+                if public_key == self.public_key:
+                    chain = self.chain
+                else:
+                    chain = self.interface.get_chain(public_key)
+                chains.append((chain, chain.modifications))
+                return chain.get_partner_agents()
+
+            memo = self.hop_memo = (hop_rings(self.public_key, hops, get_partners), chains)
+        return memo[0][:hops]
 
     def get_hop_agents(self, hops):
         """
         Get all agents from a specific hop distance.
         """
-        partners = self.chain.get_partner_agents()
-        if hops == 1:
-            return partners
+        if hops < 1:
+            return []
+        return list(self.get_hop_rings(hops)[hops - 1])
 
-        for i in range(1, hops):
-            new_partners = []
+    def calculate_ranking(self, incremental=False, compare=False, epsilon=None):
+        """
+        Calculates a ranking of known agents. Rankings are cached until the
+        interaction set changes.
 
-            for partner in partners:
-                self.request_data(partner)
-                chain = self.messages[-1].payload
-                print chain
-                new_partners += chain.get_partner_agents()
+        :param incremental: Keep the temporal graph and scores between calls
+        and only add the blocks received since the previous ranking.
+        :param compare: In incremental mode, also run a cold start to record
+        the number of iterations saved, see get_ranking_stats.
+        :param epsilon: Approximate the ranking by local forward push with
+        this bound on the sum of the absolute errors of all scores, see
+        ranking.local_push.
+        """
+        if epsilon is not None:
+            ranking, _ = calculate_tpr_push(self.public_key, self.interactions, epsilon)
+            return ranking
 
-            if i == hops:
-                return new_partners
-            else:
-                partners += new_partners
+        if not incremental:
+            ranking = self.ranking_cache.get(self.public_key, self.interactions)
+            if ranking is None:
+                ranking = calculate_tpr(self.public_key, self.interactions.get_blocks())
+                self.ranking_cache.put(self.public_key, self.interactions, ranking)
+            return ranking
 
-        return []
+        if self.ranking is None:
+            self.ranking = IncrementalRanking(self.public_key, self.interactions)
+        return self.ranking.calculate(compare)
 
-    def calculate_ranking(self):
+    def get_ranking_stats(self):
         """
-        Calculates a ranking of known agents.
+        Returns a record per incremental ranking with the number of new
+        blocks, graph nodes and iterations, and the iterations saved by the
+        warm start if it was compared with a cold run.
         """
-        return calculate_tpr(self.public_key, self.interactions.get_blocks())
+        if self.ranking is None:
+            return []
+        return self.ranking.stats
 
     def calculate_score(self, public_key):
         """
         Calculates a ranking of known agents and returns the score corresponding
         to the given public key.
         """
-
-        rank = calculate_tpr(self.public_key, self.interactions.get_blocks())
-        result = -1
-        for key, score in rank.iteritems():
-            if key == public_key:
-                result = score
-        return result
+        return self.calculate_ranking().get(public_key, -1)
 
     def contribution_accounting(self):
         """
@@ -0,0 +1,277 @@
+"""
+Module defining the BlockArena and ArenaInteractionSet classes.
+"""
+import bisect
+import sys
+from array import array
+
+import numpy as np
+
+from attestation.public_key import PublicKey
+from bitmap import Bitmap
+from interaction_set import InteractionSet, _IDENTIFIERS
+
+
+class BlockArena(object):
+    """
+    Network-wide storage of halfblocks. Every halfblock is stored once and
+    gets a dense integer id, so that the interaction sets of agents can be
+    represented as bitmaps over these ids.
+    """
+
+    def __init__(self):
+        """
+        Creates an empty block arena.
+        """
+        self.blocks = []
+        self.ids = {}
+        self.key_ids = array('l')
+        self.link_key_ids = array('l')
+        self.block_index = {}
+        self.key_index = {}
+        self.link_index = {}
+
+    def add_block(self, block):
+        """
+        Adds a halfblock to the arena if it is not yet stored.
+
+        :return: The id of the halfblock
+        """
+        block_id = self.ids.get(block)
+        if block_id is not None:
+            return block_id
+
+        block_id = len(self.blocks)
+        self.ids[block] = block_id
+        self.blocks.append(block)
+        self.key_ids.append(block.public_key.id)
+        self.link_key_ids.append(block.link_public_key.id)
+        self.block_index.setdefault((block.public_key, block.sequence_number), block_id)
+        bisect.insort(self.key_index.setdefault(block.public_key, []),
+                      (block.sequence_number, block_id))
+        self.link_index.setdefault(block.link_public_key, {}) \
+            .setdefault(block.link_sequence_number, []).append(block_id)
+
+        return block_id
+
+    def add_blocks(self, blocks):
+        """
+        Adds multiple halfblocks to the arena.
+
+        :return: An array with the ids of the halfblocks
+        """
+        return np.fromiter((self.add_block(block) for block in blocks),
+                           dtype=np.int64, count=len(blocks))
+
+    def get_block(self, block_id):
+        """
+        Returns the halfblock with the given id.
+        """
+        return self.blocks[block_id]
+
+    def get_key_ids(self, block_ids):
+        """
+        Returns the public key ids and link public key ids of the given
+        halfblocks as two arrays.
+        """
+        key_ids = np.frombuffer(self.key_ids, dtype=np.int_)
+        link_key_ids = np.frombuffer(self.link_key_ids, dtype=np.int_)
+
+        return key_ids[block_ids], link_key_ids[block_ids]
+
+    def memory_usage(self):
+        """
+        Returns an estimate of the memory used by the arena in bytes, not
+        counting the halfblocks themselves.
+        """
+        return sys.getsizeof(self.blocks) + sys.getsizeof(self.ids) + \
+            self.key_ids.buffer_info()[1] * self.key_ids.itemsize * 2 + \
+            sys.getsizeof(self.block_index) + sys.getsizeof(self.key_index) + \
+            sum(sys.getsizeof(ids) for ids in self.key_index.itervalues()) + \
+            sys.getsizeof(self.link_index) + \
+            sum(sys.getsizeof(links) + sum(sys.getsizeof(ids) for ids in links.itervalues())
+                for links in self.link_index.itervalues())
+
+    def __len__(self):
+        """
+        Returns the number of halfblocks in the arena.
+        """
+        return len(self.blocks)
+
+
+class ArenaInteractionSet(InteractionSet):
+    """
+    An interaction set which stores its halfblocks as a compressed bitmap over
+    the ids of a shared BlockArena, and the known public keys as a bitmap
+    over the public key ids.
+    """
+
+    def __init__(self, arena):
+        """
+        Creates a new interaction set on top of the given arena.
+        """
+        self.uid = next(_IDENTIFIERS)
+        self.version = 0
+        self.arena = arena
+        self.members = Bitmap()
+        self.key_members = Bitmap()
+        self.graph = None
+        self.listeners = []
+
+    def add_block(self, block):
+        """
+        Adds a new block to the interaction set.
+
+        :param block: A single halfblock
+        :return: True if the block was not yet part of the set
+        """
+        if not self.members.add(self.arena.add_block(block)):
+            return False
+
+        self.key_members.add(block.public_key.id)
+        self.key_members.add(block.link_public_key.id)
+        self.version += 1
+        self.notify([block])
+
+        return True
+
+    def add_blocks(self, blocks):
+        """
+        Adds multiple blocks to the interaction set as one bitmap union.
+
+        :param blocks: List of halfblocks
+        :return: The number of blocks that were not yet part of the set
+        """
+        assert isinstance(blocks, list)
+        return self._add_ids(self.arena.add_blocks(blocks))
+
+    def _add_ids(self, block_ids):
+        """
+        Adds the halfblocks with the given arena ids to the set.
+        """
+        if len(block_ids) == 0:
+            return 0
+
+        new_ids = self._new_ids(block_ids)
+        before = len(self.members)
+        self.members.update(Bitmap.from_ids(block_ids))
+        key_ids, link_key_ids = self.arena.get_key_ids(block_ids)
+        self.key_members.update(Bitmap.from_ids(np.concatenate([key_ids, link_key_ids])))
+        return self._grown(before, new_ids)
+
+    def _grown(self, before, new_ids):
+        """
+        Increases the version and notifies the listeners if the set grew.
+
+        :return: The number of added blocks
+        """
+        added = len(self.members) - before
+        if added:
+            self.version += 1
+            self._notify_ids(new_ids)
+        return added
+
+    def _new_ids(self, block_ids):
+        """
+        Returns the ids which are not yet part of the set. Only computed when
+        there are listeners to notify.
+        """
+        if not self.listeners:
+            return []
+        return [block_id for block_id in np.unique(block_ids) if block_id not in self.members]
+
+    def _notify_ids(self, block_ids):
+        """
+        Passes the halfblocks with the given arena ids to all listeners.
+        """
+        if self.listeners:
+            self.notify([self.arena.get_block(block_id) for block_id in block_ids])
+
+    def update(self, other):
+        """
+        Adds all blocks of another interaction set. If both sets share the
+        same arena this is a bitmap union.
+        """
+        if isinstance(other, ArenaInteractionSet) and other.arena is self.arena:
+            new_ids = self._new_ids(other.members.to_array()) if self.listeners else []
+            before = len(self.members)
+            self.members.update(other.members)
+            self.key_members.update(other.key_members)
+            return self._grown(before, new_ids)
+
+        return self.add_blocks(other.get_blocks())
+
+    def list_public_keys(self):
+        """
+        Returns the list of all known public keys in the network.
+        """
+        return set(PublicKey.from_id(key_id) for key_id in self.key_members)
+
+    def count_public_keys(self):
+        """
+        Returns the number of known public keys in the network.
+        """
+        return len(self.key_members)
+
+    def get_known_contributions(self, agent):
+        """
+        Calculates the known contributions for a known agent.
+        """
+        return sum(self.arena.get_block(block_id).contribution
+                   for _, block_id in self.arena.key_index.get(agent, [])
+                   if block_id in self.members)
+
+    def get_block(self, public_key, sequence_number):
+        """
+        Get a block given by the public_key and sequence number from the block
+        storage.
+        """
+        block_id = self.arena.block_index.get((public_key, sequence_number))
+        if block_id is not None and block_id in self.members:
+            return self.arena.get_block(block_id)
+
+    def get_blocks_by_key(self, public_key):
+        """
+        Returns the known blocks of a public key, sorted by sequence number.
+        """
+        return [self.arena.get_block(block_id)
+                for _, block_id in self.arena.key_index.get(public_key, [])
+                if block_id in self.members]
+
+    def get_blocks_by_link(self, public_key, sequence_number=None):
+        """
+        Returns the known blocks that link to a public key, or to one
+        sequence number of it.
+        """
+        links = self.arena.link_index.get(public_key, {})
+        if sequence_number is not None:
+            block_ids = links.get(sequence_number, [])
+        else:
+            block_ids = [block_id for ids in links.itervalues() for block_id in ids]
+        return [self.arena.get_block(block_id) for block_id in block_ids if block_id in self.members]
+
+    def get_blocks(self):
+        """
+        Returns all blocks contained in the set.
+        """
+        return [self.arena.blocks[block_id] for block_id in self.members]
+
+    def memory_usage(self):
+        """
+        Returns an estimate of the memory used by the membership structures
+        of the set in bytes, not counting the shared arena.
+        """
+        return self.members.memory_usage() + self.key_members.memory_usage()
+
+    def __len__(self):
+        """
+        Returns the number of blocks contained in the set.
+        """
+        return len(self.members)
+
+    def __contains__(self, block):
+        """
+        Returns true if the block is contained in the set.
+        """
+        block_id = self.arena.ids.get(block)
+        return block_id is not None and block_id in self.members
@@ -0,0 +1,145 @@
+"""
+Module defining the AuditRounds class, which matches the agents of a network
+into disjoint audit pairs round after round.
+
+Policies:
+    random: pairs of agents in random order.
+    hop: every agent, in random order, is paired with the nearest agent by
+    hops that it has not endorsed yet and that has no partner this round.
+    lru: the agents are ordered by the round in which they were last
+    audited, least recently first, and paired in that order.
+"""
+import itertools
+import time
+
+import numpy as np
+
+# Maximum number of hops searched for a partner by the hop policy.
+MAX_HOPS = 3
+
+
+class AuditRounds(object):
+    """
+    Runs rounds of pairwise audits between disjoint pairs of agents and
+    records per round how many bytes the audits moved and how much of the
+    network the agents know afterwards.
+    """
+
+    def __init__(self, network, seed=None):
+        """
+        Creates the rounds for the current agents of a network.
+        """
+        self.network = network
+        self.public_keys = sorted(network.agents, key=lambda public_key: public_key.to_hex())
+        self.index = {public_key: i for i, public_key in enumerate(self.public_keys)}
+        self.last_audit = np.full(len(self.public_keys), -1, dtype=np.int64)
+        self.random = np.random.RandomState(seed)
+        self.adjacency = None
+        self.records = []
+        self.policies = {'random': self.random_pairs, 'hop': self.hop_pairs, 'lru': self.lru_pairs}
+
+    def random_pairs(self, size):
+        """
+        Returns size pairs of agent indices in random order.
+        """
+        order = self.random.permutation(len(self.public_keys))[:2 * size]
+        return order.reshape(-1, 2)
+
+    def lru_pairs(self, size):
+        """
+        Returns size pairs of the least recently audited agents, ties broken
+        at random.
+        """
+        order = np.lexsort((self.random.random_sample(len(self.public_keys)), self.last_audit))[:2 * size]
+        return order.reshape(-1, 2)
+
+    def hop_pairs(self, size):
+        """
+        Returns at most size pairs of agents and the agent nearest to them by
+        hops which they have not endorsed yet.
+        """
+        if self.adjacency is None:
+            self.adjacency = self.network.get_partner_adjacency()
+
+        matched = np.zeros(len(self.public_keys), dtype=bool)
+        pairs = []
+        for requester in self.random.permutation(len(self.public_keys)):
+            if len(pairs) == size:
+                break
+            if matched[requester]:
+                continue
+
+            public_key = self.public_keys[requester]
+            endorsements = self.network.get_agent(public_key).endorsements
+            responder = self._nearest(public_key, matched, endorsements)
+            if responder is not None:
+                matched[requester] = matched[responder] = True
+                pairs.append((requester, responder))
+
+        return np.array(pairs, dtype=np.int64).reshape(-1, 2)
+
+    def _nearest(self, public_key, matched, endorsements):
+        """
+        Returns the index of the nearest unmatched agent which has not been
+        endorsed, None if there is none within MAX_HOPS hops.
+        """
+        for ring in itertools.islice(self.adjacency.iter_rings(public_key), MAX_HOPS):
+            for candidate in ring:
+                index = self.index.get(candidate)
+                if index is not None and not matched[index] and not endorsements.has_subject(candidate):
+                    return index
+        return None
+
+    def run(self, rounds, policy='random', size=None, reconcile=True):
+        """
+        Runs rounds of audits. All audits of a round are started before any
+        message is delivered when the network has a scheduler or runtime.
+
+        :param policy: Name of the policy matching the agents.
+        :param size: Number of pairs per round, as many as possible by default.
+        :param reconcile: Only exchange the blocks the other node is missing.
+        :return: The records of the rounds
+        """
+        if policy not in self.policies:
+            raise ValueError("Unknown audit policy: %s" % policy)
+        if size is None:
+            size = len(self.public_keys) // 2
+
+        records = []
+        for _ in range(rounds):
+            records.append(self.run_round(self.policies[policy](size), reconcile))
+        return records
+
+    def run_round(self, pairs, reconcile=True):
+        """
+        Runs the audits of an array of pairs of agent indices.
+
+        :return: The record of the round
+        """
+        start = time.time()
+        network = self.network
+        agents = [(network.get_agent(self.public_keys[requester]), network.get_agent(self.public_keys[responder]))
+                  for requester, responder in pairs]
+        logged = [len(requester.audit_log) for requester, _ in agents]
+
+        for requester, responder in agents:
+            network.pairwise_audit(requester, responder, reconcile)
+        scheduler = network.interface.scheduler
+        if scheduler is not None:
+            scheduler.run()
+
+        bytes_moved = 0
+        blocks_moved = 0
+        for (requester, _), before in zip(agents, logged):
+            for record in requester.audit_log[before:]:
+                bytes_moved += record['bytes_sent'] + record['bytes_received']
+                blocks_moved += record['blocks_sent'] + record['blocks_received']
+
+        round_number = len(self.records)
+        self.last_audit[pairs.ravel()] = round_number
+        known = sum(agent.interactions.count_public_keys() for agent in network.agents.itervalues())
+
+        record = {'round': round_number, 'pairs': len(pairs), 'bytes': bytes_moved, 'blocks': blocks_moved,
+                  'coverage': known / float(len(network.agents) ** 2), 'time': time.time() - start}
+        self.records.append(record)
+        return record
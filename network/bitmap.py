@@ -0,0 +1,194 @@
+"""
+Module defining the Bitmap class.
+"""
+import numpy as np
+
+# Number of low bits of an id stored inside a container.
+CONTAINER_BITS = 16
+CONTAINER_SIZE = 1 << CONTAINER_BITS
+# Array containers are converted to bitset containers above this size, at
+# which point the bitset is the smaller representation.
+ARRAY_LIMIT = 4096
+# Number of single additions buffered before they are merged into the
+# containers.
+PENDING_LIMIT = 4096
+# Approximate size of a numpy array object and its dict entry in bytes.
+CONTAINER_OVERHEAD = 128
+
+
+def _to_bitset(container):
+    """
+    Converts a container of either kind to a packed bitset container.
+    """
+    if container.dtype == np.uint8:
+        return container
+    bits = np.zeros(CONTAINER_SIZE, dtype=np.bool_)
+    bits[container] = True
+    return np.packbits(bits)
+
+
+def _container_values(container):
+    """
+    Returns the sorted low bits stored in a container.
+    """
+    if container.dtype == np.uint8:
+        return np.flatnonzero(np.unpackbits(container)).astype(np.uint16)
+    return container
+
+
+def _container_size(container):
+    """
+    Returns the number of ids stored in a container.
+    """
+    if container.dtype == np.uint8:
+        return int(np.unpackbits(container).sum())
+    return len(container)
+
+
+def _union(first, second):
+    """
+    Returns the union of two containers.
+    """
+    if first.dtype == np.uint16 and second.dtype == np.uint16:
+        result = np.union1d(first, second).astype(np.uint16)
+        if len(result) <= ARRAY_LIMIT:
+            return result
+        return _to_bitset(result)
+
+    return np.bitwise_or(_to_bitset(first), _to_bitset(second))
+
+
+class Bitmap(object):
+    """
+    Compressed bitmap over non-negative integer ids, in the style of roaring
+    bitmaps. Ids are partitioned on their high bits into containers of 2^16
+    ids. A sparse container is a sorted uint16 array, a dense container is a
+    packed bitset of 8KB.
+    """
+
+    def __init__(self, ids=()):
+        """
+        Creates a bitmap containing the given ids.
+        """
+        self.containers = {}
+        self.pending = set()
+        self.count = 0
+
+        if len(ids):
+            self.update(Bitmap.from_ids(ids))
+
+    @classmethod
+    def from_ids(cls, ids):
+        """
+        Creates a bitmap from an array or list of ids.
+        """
+        bitmap = cls()
+        ids = np.unique(np.asarray(ids, dtype=np.int64))
+        if len(ids) == 0:
+            return bitmap
+
+        highs = ids >> CONTAINER_BITS
+        boundaries = np.flatnonzero(np.diff(highs)) + 1
+        for values in np.split(ids, boundaries):
+            container = (values & (CONTAINER_SIZE - 1)).astype(np.uint16)
+            if len(container) > ARRAY_LIMIT:
+                container = _to_bitset(container)
+            bitmap.containers[int(values[0] >> CONTAINER_BITS)] = container
+        bitmap.count = len(ids)
+
+        return bitmap
+
+    def _flush(self):
+        """
+        Merges the buffered single additions into the containers.
+        """
+        if self.pending:
+            pending = Bitmap.from_ids(list(self.pending))
+            self.pending = set()
+            self._merge(pending)
+
+    def _merge(self, other):
+        """
+        Merges the containers of another bitmap into this one. Containers are
+        never modified in place, so they can be shared between bitmaps.
+        """
+        for high, container in other.containers.iteritems():
+            current = self.containers.get(high)
+            if current is None:
+                self.containers[high] = container
+                self.count += _container_size(container)
+            else:
+                merged = _union(current, container)
+                self.count += _container_size(merged) - _container_size(current)
+                self.containers[high] = merged
+
+    def add(self, value):
+        """
+        Adds an id to the bitmap.
+
+        :return: True if the id was not yet contained in the bitmap
+        """
+        if value in self:
+            return False
+
+        self.pending.add(value)
+        if len(self.pending) >= PENDING_LIMIT:
+            self._flush()
+
+        return True
+
+    def update(self, other):
+        """
+        Adds all ids of another bitmap to this bitmap.
+        """
+        other._flush()
+        self._flush()
+        self._merge(other)
+
+    def __contains__(self, value):
+        """
+        Returns true if the id is contained in the bitmap.
+        """
+        if value in self.pending:
+            return True
+
+        container = self.containers.get(value >> CONTAINER_BITS)
+        if container is None:
+            return False
+
+        low = value & (CONTAINER_SIZE - 1)
+        if container.dtype == np.uint8:
+            return bool(container[low >> 3] & (0x80 >> (low & 7)))
+
+        position = np.searchsorted(container, low)
+        return position < len(container) and container[position] == low
+
+    def __len__(self):
+        """
+        Returns the number of ids in the bitmap.
+        """
+        return self.count + len(self.pending)
+
+    def to_array(self):
+        """
+        Returns all ids in the bitmap as a sorted int64 array.
+        """
+        self._flush()
+        if not self.containers:
+            return np.zeros(0, dtype=np.int64)
+
+        return np.concatenate([(high << CONTAINER_BITS) + _container_values(self.containers[high]).astype(np.int64)
+                               for high in sorted(self.containers)])
+
+    def __iter__(self):
+        """
+        Iterates over the ids in the bitmap in ascending order.
+        """
+        return iter(self.to_array().tolist())
+
+    def memory_usage(self):
+        """
+        Returns an estimate of the memory used by the containers in bytes.
+        """
+        self._flush()
+        return sum(container.nbytes + CONTAINER_OVERHEAD for container in self.containers.itervalues())
@@ -3,17 +3,109 @@ Module describing the chain class.
 """
 import bisect
 
+import numpy as np
+
 class Chain(object):
     """
     The chain class represents a hashchain of blocks of one agent. It is a
     convenience representation of all transactions of the agent.
     """
 
-    def __init__(self, transactions = []):
+    def __init__(self, transactions=None):
         """
         Creates the chain from a set of transactions.
+
+        The chain keeps running totals of the contributions, the first
+        sequence number at which each partner appears and the information
+        needed to decide whether the sequence numbers are contiguous, all
+        updated on every added transaction.
+        """
+        self.table = None
+        self.halfblock_ids = None
+        self.summarized = True
+        self.modifications = 0
+        self._clear()
+
+        for transaction in sorted(transactions or [], key=lambda x: x.sequence_number):
+            self.add(transaction)
+
+    def _clear(self):
+        """
+        Resets the blocks and the running totals of the chain.
+        """
+        self.transactions = []
+        self.up_total = 0
+        self.down_total = 0
+        self.net_total = 0
+        self.partners = {}
+        self.partner_list = None
+        self.sequence_numbers = set()
+        self.duplicates = 0
+        self.unsigned = 0
+        self.invalid = 0
+        self.max_sequence_number = -1
+
+    @classmethod
+    def from_table(cls, table, halfblock_ids):
+        """
+        Creates a chain on top of a BlockTable from the ids of its halfblocks,
+        sorted by sequence number. The totals, partners and completeness of
+        the chain are reductions over the columns of the table, the
+        halfblocks are only created when the blocks are read or the chain is
+        extended.
+        """
+        chain = cls()
+        chain.table = table
+        chain.halfblock_ids = halfblock_ids
+        chain.summarized = False
+        return chain
+
+    def _summarize(self):
         """
-        self.transactions = sorted(transactions, key=lambda x: x.sequence_number)
+        Computes the running totals of a table-backed chain from the columns.
+        """
+        if self.summarized:
+            return
+        self.summarized = True
+
+        fields = self.table.halfblock_fields(self.halfblock_ids)
+        contributions = fields['contribution']
+        net_contributions = fields['net_contribution']
+        self.up_total = int(contributions.sum())
+        self.down_total = int((contributions - net_contributions).sum())
+        self.net_total = int(net_contributions.sum())
+
+        # The halfblocks are sorted by sequence number, so the first block
+        # with a partner has the lowest sequence number.
+        sequence_numbers = fields['sequence_number']
+        partner_ids, first = np.unique(fields['link_public_key'], return_index=True)
+        public_keys = self.table.get_public_keys()
+        self.partners = {public_keys[partner_id]: sequence_number for partner_id, sequence_number
+                         in zip(partner_ids.tolist(), sequence_numbers[first].tolist())}
+
+        signed = sequence_numbers[sequence_numbers >= 0]
+        self.sequence_numbers = set(signed.tolist())
+        self.unsigned = int((sequence_numbers == -1).sum())
+        self.invalid = int((sequence_numbers < -1).sum())
+        self.duplicates = len(signed) - len(self.sequence_numbers)
+        self.max_sequence_number = int(signed.max()) if len(signed) else -1
+
+    def _load(self):
+        """
+        Creates the halfblocks of a table-backed chain, after which it keeps
+        its running totals like any other chain.
+        """
+        if self.table is None:
+            return
+
+        table, halfblock_ids = self.table, self.halfblock_ids
+        self.table = self.halfblock_ids = None
+        self.summarized = True
+        self._clear()
+        modifications = self.modifications
+        for transaction in table.get_halfblocks_by_ids(halfblock_ids):
+            self.add(transaction)
+        self.modifications = modifications
 
     def validate(self):
         """
@@ -25,70 +117,107 @@ class Chain(object):
         """
         Returns the blocks the chain is made of.
         """
+        self._load()
         return self.transactions
 
     def get_partner_agents(self):
         """
         Calculates the list of all agents that this agent has interacted with.
         """
-        partners = []
-        for block in self.transactions:
-            if not block.link_public_key in partners:
-                partners.append(block.link_public_key)
-        return partners
+        self._summarize()
+        if self.partner_list is None:
+            self.partner_list = sorted(self.partners, key=self.partners.get)
+        return list(self.partner_list)
+
+    def has_partner(self, public_key):
+        """
+        Returns true if the agent has interacted with the given public key.
+        """
+        self._summarize()
+        return public_key in self.partners
 
     def is_complete(self):
         """
         Returns true if the chain is continuous and does not contain partly
         signed interactions.
         """
-        j = 0
-        while j < len(self) and self.transactions[j].sequence_number == -1:
-            j = j + 1
-
-        if j == len(self):
+        self._summarize()
+        signed = len(self) - self.unsigned - self.invalid
+        if self.invalid or signed == 0:
             return False
 
-        for i in range(j, len(self)):
-            if self.transactions[i].sequence_number != i-j:
-                return False
+        return self.duplicates == 0 and self.max_sequence_number == signed - 1
 
-        return True
+    def gaps(self):
+        """
+        Returns the number of sequence numbers missing between the first
+        block and the latest known block of the chain.
+        """
+        self._summarize()
+        return self.max_sequence_number + 1 - len(self.sequence_numbers)
 
     def up(self):
         """
         Returns the total amount of uploaded data.
         """
-        return sum([t.contribution for t in self.transactions])
+        self._summarize()
+        return self.up_total
 
     def down(self):
         """
         Returns the total amount of downloaded data.
         """
-        return sum([t.contribution - t.net_contribution for t in self.transactions])
+        self._summarize()
+        return self.down_total
 
     def add(self, transaction):
         """
         Adds a transaction to the chain.
         """
+        self._load()
         bisect.insort(self.transactions, transaction)
+        self.modifications += 1
+
+        self.up_total += transaction.contribution
+        self.down_total += transaction.contribution - transaction.net_contribution
+        self.net_total += transaction.net_contribution
+
+        partner = transaction.link_public_key
+        if partner not in self.partners or transaction.sequence_number < self.partners[partner]:
+            self.partners[partner] = transaction.sequence_number
+            self.partner_list = None
+
+        sequence_number = transaction.sequence_number
+        if sequence_number == -1:
+            self.unsigned += 1
+        elif sequence_number < -1:
+            self.invalid += 1
+        elif sequence_number in self.sequence_numbers:
+            self.duplicates += 1
+        else:
+            self.sequence_numbers.add(sequence_number)
+            self.max_sequence_number = max(self.max_sequence_number, sequence_number)
 
     def net_contribution(self):
         """
         Calculates the net contribution of the agent.
         """
-        return sum([t.net_contribution for t in self.transactions])
+        self._summarize()
+        return self.net_total
 
     def __len__(self):
         """
         Returns the length of the chain.
         """
+        if self.table is not None:
+            return len(self.halfblock_ids)
         return len(self.transactions)
 
     def __repr__(self):
         """
         String representation of the chain.
         """
+        self._load()
         return '\n'.join(['{}: @{} {}MB -> @{}'.format(x.sequence_number, x.public_key.to_base64()[:8],
                                                    x.net_contribution,
                                                    x.link_public_key.to_base64()[:8])
@@ -0,0 +1,334 @@
+"""
+Module defining the binary wire format of messages.
+
+A message starts with the format version, flags and the message type, one
+byte each, followed by the public key of the sender and the payload. Public
+keys are sent as their 74 bytes, or as 4 byte ids when the key ids flag is
+set. Ids are the ids of the process-wide key registry, so both ends must
+have registered the same keys in the same order, as processes forked from
+one parent have. A key without a shared id is sent as the id 0xffffffff
+followed by the 74 bytes.
+
+A halfblock is four signed 64 bit integers (contribution, net contribution,
+sequence number and link sequence number), the public key and the link
+public key and the previous hash and the signature, both prefixed by their
+length as an unsigned 16 bit integer. With key ids, the ids of both keys
+come first and are followed by the keys sent in full, if any. Lists of halfblocks and arrays of
+digests are prefixed by their length as an unsigned 32 bit integer. All
+integers are little-endian.
+
+Decoding reads the fields in place with struct.unpack_from, and arrays of
+digests and IBLT cells are read only views on the encoded data.
+"""
+import struct
+
+import numpy as np
+
+from attestation.halfblock import Halfblock
+from attestation.public_key import PublicKey
+from chain import Chain
+from messages import Message, MessageTypes
+from reconciliation import IBLT, NUM_HASHES
+
+VERSION = 1
+
+# Size of a public key sent in full.
+KEY_SIZE = 74
+
+# Key id of a public key which is sent in full after the id.
+NO_KEY_ID = 0xffffffff
+
+FLAG_KEY_IDS = 1
+
+_HEADER = struct.Struct('<BBB')
+_BLOCK_KEYS = struct.Struct('<qqqq%ds%ds' % (KEY_SIZE, KEY_SIZE))
+_BLOCK_IDS = struct.Struct('<qqqqII')
+_LENGTH = struct.Struct('<H')
+_COUNT = struct.Struct('<I')
+_KEY_ID = struct.Struct('<I')
+_INTEGER = struct.Struct('<q')
+_BOOLEAN = struct.Struct('<?')
+
+
+class CodecError(ValueError):
+    """
+    Raised when a message cannot be encoded or decoded.
+    """
+    pass
+
+
+class MessageCodec(object):
+    """
+    Encodes messages to strings and decodes them again.
+    """
+
+    def __init__(self, shared_keys=0):
+        """
+        Creates a codec.
+
+        :param shared_keys: Number of keys, from id 0 upwards, which are
+        registered with the same id at the receiving end. These keys are sent
+        as ids. By default all keys are sent in full.
+        """
+        self.shared_keys = shared_keys
+        self.flags = FLAG_KEY_IDS if shared_keys else 0
+        self.encoders = {
+            MessageTypes.PA_BLOCKS: self._encode_blocks,
+            MessageTypes.PA_BLOCKS_REPLY: self._encode_blocks,
+            MessageTypes.PA_SCORE: _encode_boolean,
+            MessageTypes.PA_SCORE_REPLY: _encode_boolean,
+            MessageTypes.CHAIN: _encode_nothing,
+            MessageTypes.CHAIN_REPLY: self._encode_chain,
+            MessageTypes.PA_SKETCH: _encode_sketch,
+            MessageTypes.PA_SKETCH_RETRY: _encode_integer,
+            MessageTypes.PA_DELTA: self._encode_delta,
+            MessageTypes.PA_DELTA_REPLY: self._encode_blocks,
+        }
+        self.decoders = {
+            MessageTypes.PA_BLOCKS: _decode_blocks,
+            MessageTypes.PA_BLOCKS_REPLY: _decode_blocks,
+            MessageTypes.PA_SCORE: _decode_boolean,
+            MessageTypes.PA_SCORE_REPLY: _decode_boolean,
+            MessageTypes.CHAIN: _decode_nothing,
+            MessageTypes.CHAIN_REPLY: _decode_chain,
+            MessageTypes.PA_SKETCH: _decode_sketch,
+            MessageTypes.PA_SKETCH_RETRY: _decode_integer,
+            MessageTypes.PA_DELTA: _decode_delta,
+            MessageTypes.PA_DELTA_REPLY: _decode_blocks,
+        }
+
+    def encode(self, message):
+        """
+        Returns the encoding of a message as a string.
+        """
+        encoder = self.encoders.get(message.type)
+        if encoder is None:
+            raise CodecError("Unknown message type: %s" % message.type)
+
+        parts = [_HEADER.pack(VERSION, self.flags, message.type)]
+        self._encode_key(parts, message.sender)
+        encoder(parts, message.payload)
+        return ''.join(parts)
+
+    def decode(self, data):
+        """
+        Creates a message from its encoding.
+
+        :param data: String or other buffer with the encoded message.
+        """
+        try:
+            version, flags, message_type = _HEADER.unpack_from(data, 0)
+            if version != VERSION:
+                raise CodecError("Unsupported format version: %d" % version)
+            decoder = self.decoders.get(message_type)
+            if decoder is None:
+                raise CodecError("Unknown message type: %d" % message_type)
+
+            key_ids = flags & FLAG_KEY_IDS
+            sender, offset = _decode_key(data, _HEADER.size, key_ids)
+            payload, offset = decoder(data, offset, key_ids)
+        except struct.error as error:
+            raise CodecError("Truncated message: %s" % error)
+        except IndexError:
+            raise CodecError("Unknown key id")
+
+        if offset != len(data):
+            raise CodecError("Message has %d trailing bytes" % (len(data) - offset))
+        return Message(message_type, sender, payload)
+
+    def _encode_key(self, parts, public_key):
+        """
+        Appends the encoding of a public key.
+        """
+        if self.shared_keys:
+            if public_key.id < self.shared_keys:
+                parts.append(_KEY_ID.pack(public_key.id))
+                return
+            parts.append(_KEY_ID.pack(NO_KEY_ID))
+
+        if len(public_key.bin_key) != KEY_SIZE:
+            raise CodecError("Public key of %d bytes" % len(public_key.bin_key))
+        parts.append(public_key.bin_key)
+
+    def _encode_blocks(self, parts, blocks):
+        """
+        Appends the encoding of a list of halfblocks.
+        """
+        parts.append(_COUNT.pack(len(blocks)))
+        for block in blocks:
+            public_key = block.public_key
+            link_public_key = block.link_public_key
+            if self.shared_keys:
+                keys = [key.bin_key for key in (public_key, link_public_key) if key.id >= self.shared_keys]
+                parts.append(_BLOCK_IDS.pack(block.contribution, block.net_contribution,
+                                             block.sequence_number, block.link_sequence_number,
+                                             self._key_id(public_key), self._key_id(link_public_key)))
+                for key in keys:
+                    if len(key) != KEY_SIZE:
+                        raise CodecError("Public key of %d bytes" % len(key))
+                    parts.append(key)
+            else:
+                if len(public_key.bin_key) != KEY_SIZE or len(link_public_key.bin_key) != KEY_SIZE:
+                    raise CodecError("Public key of other than %d bytes" % KEY_SIZE)
+                parts.append(_BLOCK_KEYS.pack(block.contribution, block.net_contribution,
+                                              block.sequence_number, block.link_sequence_number,
+                                              public_key.bin_key, link_public_key.bin_key))
+            parts.append(_LENGTH.pack(len(block.previous_hash)))
+            parts.append(block.previous_hash)
+            parts.append(_LENGTH.pack(len(block.signature)))
+            parts.append(block.signature)
+
+    def _key_id(self, public_key):
+        """
+        Returns the id of a public key on the wire.
+        """
+        return public_key.id if public_key.id < self.shared_keys else NO_KEY_ID
+
+    def _encode_chain(self, parts, chain):
+        self._encode_blocks(parts, chain.get_blocks())
+
+    def _encode_delta(self, parts, payload):
+        blocks, missing = payload
+        self._encode_blocks(parts, blocks)
+        _encode_digests(parts, missing)
+
+
+def _decode_key(data, offset, key_ids):
+    """
+    Returns a public key and the offset after it.
+    """
+    if key_ids:
+        key_id = _KEY_ID.unpack_from(data, offset)[0]
+        offset += _KEY_ID.size
+        if key_id != NO_KEY_ID:
+            return PublicKey.from_id(key_id), offset
+
+    end = offset + KEY_SIZE
+    if end > len(data):
+        raise CodecError("Truncated public key")
+    return PublicKey(bytes(data[offset:end])), end
+
+
+def _decode_blocks(data, offset, key_ids):
+    """
+    Returns a list of halfblocks and the offset after it.
+    """
+    count = _COUNT.unpack_from(data, offset)[0]
+    offset += _COUNT.size
+    blocks = []
+    for _ in xrange(count):
+        if key_ids:
+            contribution, net_contribution, sequence_number, link_sequence_number, key_id, link_key_id = \
+                _BLOCK_IDS.unpack_from(data, offset)
+            offset += _BLOCK_IDS.size
+            if key_id == NO_KEY_ID:
+                public_key = bytes(data[offset:offset + KEY_SIZE])
+                offset += KEY_SIZE
+            else:
+                public_key = PublicKey.from_id(key_id).bin_key
+            if link_key_id == NO_KEY_ID:
+                link_public_key = bytes(data[offset:offset + KEY_SIZE])
+                offset += KEY_SIZE
+            else:
+                link_public_key = PublicKey.from_id(link_key_id).bin_key
+        else:
+            contribution, net_contribution, sequence_number, link_sequence_number, public_key, \
+                link_public_key = _BLOCK_KEYS.unpack_from(data, offset)
+            offset += _BLOCK_KEYS.size
+        length = _LENGTH.unpack_from(data, offset)[0]
+        offset += _LENGTH.size
+        previous_hash = bytes(data[offset:offset + length])
+        offset += length
+        length = _LENGTH.unpack_from(data, offset)[0]
+        offset += _LENGTH.size
+        signature = bytes(data[offset:offset + length])
+        offset += length
+        blocks.append(Halfblock((contribution, net_contribution, public_key, sequence_number,
+                                 link_public_key, link_sequence_number, previous_hash, signature)))
+
+    if offset > len(data):
+        raise CodecError("Truncated halfblock")
+    return blocks, offset
+
+
+def _decode_chain(data, offset, key_ids):
+    blocks, offset = _decode_blocks(data, offset, key_ids)
+    return Chain(blocks), offset
+
+
+def _encode_digests(parts, digests):
+    """
+    Appends the encoding of an array of 64 bit digests.
+    """
+    digests = np.asarray(digests, dtype='<u8')
+    parts.append(_COUNT.pack(len(digests)))
+    parts.append(digests.tostring())
+
+
+def _decode_array(data, offset, dtype, count):
+    """
+    Returns a read only array of count items viewing the data and the offset
+    after it.
+    """
+    end = offset + count * np.dtype(dtype).itemsize
+    if end > len(data):
+        raise CodecError("Truncated array")
+    return np.frombuffer(data, dtype=dtype, count=count, offset=offset), end
+
+
+def _decode_digests(data, offset):
+    count = _COUNT.unpack_from(data, offset)[0]
+    return _decode_array(data, offset + _COUNT.size, '<u8', count)
+
+
+def _decode_delta(data, offset, key_ids):
+    blocks, offset = _decode_blocks(data, offset, key_ids)
+    missing, offset = _decode_digests(data, offset)
+    return (blocks, missing), offset
+
+
+def _encode_sketch(parts, payload):
+    """
+    Appends the encoding of an IBLT and a sample of digests: the size of a
+    partition, the counts, digest sums and check sums of all cells and the
+    sample.
+    """
+    sketch, sample = payload
+    parts.append(_COUNT.pack(sketch.partition))
+    parts.append(sketch.counts.astype('<i4').tostring())
+    parts.append(sketch.digest_sums.astype('<u8').tostring())
+    parts.append(sketch.check_sums.astype('<u8').tostring())
+    _encode_digests(parts, sample)
+
+
+def _decode_sketch(data, offset, key_ids):
+    num_cells = NUM_HASHES * _COUNT.unpack_from(data, offset)[0]
+    counts, offset = _decode_array(data, offset + _COUNT.size, '<i4', num_cells)
+    digest_sums, offset = _decode_array(data, offset, '<u8', num_cells)
+    check_sums, offset = _decode_array(data, offset, '<u8', num_cells)
+    sample, offset = _decode_digests(data, offset)
+    return (IBLT.from_arrays(counts, digest_sums, check_sums), sample), offset
+
+
+def _encode_nothing(parts, payload):
+    pass
+
+
+def _decode_nothing(data, offset, key_ids):
+    return None, offset
+
+
+def _encode_boolean(parts, payload):
+    parts.append(_BOOLEAN.pack(payload))
+
+
+def _decode_boolean(data, offset, key_ids):
+    return _BOOLEAN.unpack_from(data, offset)[0], offset + _BOOLEAN.size
+
+
+def _encode_integer(parts, payload):
+    parts.append(_INTEGER.pack(payload))
+
+
+def _decode_integer(data, offset, key_ids):
+    return _INTEGER.unpack_from(data, offset)[0], offset + _INTEGER.size
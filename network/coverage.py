@@ -0,0 +1,116 @@
+"""
+Module for computing how much of the network every agent can know within a
+number of hops, for all agents at once.
+
+The partners of the agents form a sparse boolean matrix A. The agents within
+k hops of every agent are the rows of (I + A)^k, computed by sparse matrix
+products while the result is sparse. Once it becomes dense, the remaining
+hops are done by breadth-first search with bitsets: every agent holds a bit
+per source agent, and a hop ORs the bitsets of its neighbours into it.
+"""
+import numpy as np
+import scipy.sparse as sp
+
+# Fraction of nonzero entries of the reachability matrix above which the
+# bitset search is used instead of sparse matrix products.
+DENSITY = 0.001
+
+# Number of source agents per bitset pass, a multiple of 64. Limits the
+# memory of a pass to CHUNK / 8 bytes per partnership.
+CHUNK = 512
+
+
+def partner_matrix(partners, public_keys):
+    """
+    Creates the sparse boolean partner matrix from a PartnerAdjacency. Entry
+    (i, j) is set when agent j is a partner in the chain of agent i.
+
+    :param public_keys: Public keys of the agents, in the order of the rows.
+    """
+    index = {public_key: i for i, public_key in enumerate(public_keys)}
+    rows = []
+    columns = []
+    for public_key, agent_partners in partners.partners.iteritems():
+        row = index[public_key]
+        for partner in agent_partners:
+            column = index.get(partner)
+            if column is not None:
+                rows.append(row)
+                columns.append(column)
+
+    return sp.csr_matrix((np.ones(len(rows), dtype=bool), (rows, columns)),
+                         shape=(len(public_keys), len(public_keys)))
+
+
+def table_partner_matrix(table):
+    """
+    Creates the sparse boolean partner matrix from the columns of a
+    BlockTable, with the agents in the order of the table.
+    """
+    rows = np.concatenate([table.requester, table.responder])
+    columns = np.concatenate([table.responder, table.requester])
+    num_agents = table.num_agents()
+    matrix = sp.csr_matrix((np.ones(len(rows), dtype=bool), (rows, columns)),
+                           shape=(num_agents, num_agents))
+    matrix.sum_duplicates()
+    return matrix
+
+
+def hop_coverage(matrix, max_hops, density=DENSITY):
+    """
+    Calculates for every agent the fraction of agents within 1 up to
+    max_hops hops, including the agent itself.
+
+    :param matrix: Sparse boolean partner matrix.
+    :param density: Fraction of nonzero entries at which to switch to the
+    bitset search.
+    :return: Array of shape (max_hops, number of agents)
+    """
+    num_agents = matrix.shape[0]
+    coverage = np.zeros((max_hops, num_agents))
+    reach = sp.identity(num_agents, dtype=bool, format='csr')
+
+    degrees = np.diff(matrix.indptr)
+    hop = 0
+    while hop < max_hops:
+        # Upper bound on the nonzero entries of the next product, checked
+        # before computing it as the product can grow by orders of magnitude.
+        if reach.nnz + reach.dot(degrees).sum() > density * num_agents * num_agents:
+            break
+        reach = reach + reach.dot(matrix)
+        coverage[hop] = np.diff(reach.indptr)
+        hop += 1
+
+    if hop < max_hops:
+        _bitset_coverage(matrix, reach, hop, coverage)
+
+    return coverage / num_agents
+
+
+def _bitset_coverage(matrix, reach, start, coverage):
+    """
+    Fills the counts of the hops from start onwards by breadth-first search
+    with bitsets, starting from the agents reachable in start hops.
+    """
+    num_agents = matrix.shape[0]
+    incoming = matrix.T.tocsr()
+    has_incoming = np.diff(incoming.indptr) > 0
+    starts = incoming.indptr[:-1][has_incoming]
+
+    for first in range(0, num_agents, CHUNK):
+        last = min(first + CHUNK, num_agents)
+        # Bit s of row v is set when agent v is reachable from source s. The
+        # bits are ORed as 64 bit words and counted as bytes.
+        reachable = np.zeros((num_agents, CHUNK), dtype=bool)
+        reachable[:, :last - first] = reach[first:last].T.toarray()
+        bits = np.packbits(reachable, axis=1)
+        words = bits.view(np.uint64)
+
+        for hop in range(start, len(coverage)):
+            if len(starts):
+                words[has_incoming] |= np.bitwise_or.reduceat(words[incoming.indices], starts, axis=0)
+            coverage[hop, first:last] = np.unpackbits(bits, axis=1)[:, :last - first].sum(axis=0)
+            if hop > 0 and np.array_equal(coverage[hop, first:last], coverage[hop - 1, first:last]):
+                # No agent was added, so the following hops add none either.
+                coverage[hop + 1:, first:last] = coverage[hop, first:last]
+                break
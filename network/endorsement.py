@@ -2,11 +2,13 @@
 Module describing the endorsement class.
 """
 
-class Endorsement:
+class Endorsement(object):
     """
     An endorsement is the outcome of a audit which checks the integrity of data
     and performs an exchange of private data between two agents.
     """
+    __slots__ = ('auditor', 'subject', 'outcome')
+
     def __init__(self, data):
         """
         Creates a new endorsement record from a list.
@@ -14,3 +16,63 @@ class Endorsement:
         self.auditor = data[0]
         self.subject = data[1]
         self.outcome = data[2]
+
+
+class EndorsementStore(object):
+    """
+    Collection of endorsements indexed by subject and by auditor. Stores can
+    have a parent store, which receives all endorsements added to them, such
+    that the endorsements of all agents are also found in one network-wide
+    store.
+    """
+
+    def __init__(self, parent=None):
+        """
+        Creates an empty store.
+
+        :param parent: Store to which all added endorsements are added too.
+        """
+        self.endorsements = []
+        self.by_subject = {}
+        self.by_auditor = {}
+        self.parent = parent
+
+    def add(self, endorsement):
+        """
+        Adds an endorsement to the store and its parent.
+        """
+        self.endorsements.append(endorsement)
+        self.by_subject.setdefault(endorsement.subject, []).append(endorsement)
+        self.by_auditor.setdefault(endorsement.auditor, []).append(endorsement)
+        if self.parent is not None:
+            self.parent.add(endorsement)
+
+    def get_by_subject(self, public_key):
+        """
+        Returns the endorsements of which an agent is the subject.
+        """
+        return list(self.by_subject.get(public_key, ()))
+
+    def get_by_auditor(self, public_key):
+        """
+        Returns the endorsements made by an agent.
+        """
+        return list(self.by_auditor.get(public_key, ()))
+
+    def has_subject(self, public_key):
+        """
+        Returns true if there is an endorsement of an agent.
+        """
+        return public_key in self.by_subject
+
+    def list_auditors(self, public_key):
+        """
+        Returns the agents which endorsed an agent.
+        """
+        return set(endorsement.auditor for endorsement in self.by_subject.get(public_key, ()))
+
+    def __iter__(self):
+        return iter(self.endorsements)
+
+    def __len__(self):
+        return len(self.endorsements)
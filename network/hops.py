@@ -0,0 +1,68 @@
+"""
+Module for finding the agents a number of hops away from an agent, by
+breadth-first search over the partners in the personal chains.
+"""
+import itertools
+
+
+def iter_hop_rings(public_key, get_partners):
+    """
+    Generates the rings of agents at exactly 1, 2, ... hops from an agent,
+    each ring only found when it is asked for. Every agent is only in the
+    ring of its shortest distance and the agent itself is in none of them.
+
+    :param get_partners: Function returning the partners of an agent.
+    """
+    visited = {public_key}
+    frontier = [public_key]
+    while True:
+        ring = []
+        for node in frontier:
+            for partner in get_partners(node):
+                if partner not in visited:
+                    visited.add(partner)
+                    ring.append(partner)
+        yield ring
+        frontier = ring
+
+
+def hop_rings(public_key, hops, get_partners):
+    """
+    Returns the rings of agents at exactly 1 up to hops hops from an agent,
+    see iter_hop_rings.
+
+    :return: List of hops lists of public keys
+    """
+    return list(itertools.islice(iter_hop_rings(public_key, get_partners), hops))
+
+
+class PartnerAdjacency(object):
+    """
+    The partners of all agents of a network, taken from their personal
+    chains at creation. Used to find the agents a number of hops away without
+    requesting the chains in between.
+    """
+
+    def __init__(self, chains):
+        """
+        Creates the adjacency from a dict mapping public keys to chains.
+        """
+        self.partners = {public_key: chain.get_partner_agents() for public_key, chain in chains.iteritems()}
+
+    def get_partners(self, public_key):
+        """
+        Returns the partners of an agent, none if the agent is unknown.
+        """
+        return self.partners.get(public_key, ())
+
+    def rings(self, public_key, hops):
+        """
+        Returns the rings of agents at 1 up to hops hops from an agent.
+        """
+        return hop_rings(public_key, hops, self.get_partners)
+
+    def iter_rings(self, public_key):
+        """
+        Generates the rings of agents at 1, 2, ... hops from an agent.
+        """
+        return iter_hop_rings(public_key, self.get_partners)
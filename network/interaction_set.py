@@ -1,9 +1,15 @@
 """
 Module defining the InteractionSet class.
 """
+import bisect
+import itertools
+import sys
+
 import networkx as nx
+import numpy as np
 
-from chain import Chain
+# Source of unique interaction set identifiers.
+_IDENTIFIERS = itertools.count()
 
 class InteractionSet(object):
     """
@@ -13,36 +19,152 @@ class InteractionSet(object):
     def __init__(self):
         """
         Creates a new interaction set from the block records.
+
+        Next to the set of halfblocks, the interaction set keeps indexes which
+        are updated on every added block: halfblocks by public key and
+        sequence number, halfblocks per public key sorted by sequence number,
+        halfblocks by the public key and sequence number they link to, the
+        set of known public keys and the total contribution per key.
+        Listeners are called with the list of newly added blocks. The version
+        is increased whenever the set grows, so together with the unique id
+        it identifies the content of the set.
         """
+        self.uid = next(_IDENTIFIERS)
+        self.version = 0
         self.halfblocks = set([])
+        self.block_index = {}
+        self.key_index = {}
+        self.link_index = {}
+        self.public_keys = set([])
+        self.contributions = {}
         self.graph = None
+        self.listeners = []
+        self.table = None
+        self.halfblock_ids = None
+
+    @classmethod
+    def from_table(cls, table, halfblock_ids):
+        """
+        Creates an interaction set on top of a BlockTable from the ids of its
+        halfblocks. The size, the known public keys and the contributions are
+        computed on the columns of the table, the halfblocks and indexes are
+        only created when blocks are read or added.
+        """
+        interactions = cls()
+        interactions.table = table
+        interactions.halfblock_ids = halfblock_ids
+        interactions.version = len(halfblock_ids)
+        return interactions
+
+    def _load(self):
+        """
+        Creates the halfblocks and indexes of a table-backed set.
+        """
+        if self.table is None:
+            return
+
+        table, halfblock_ids = self.table, self.halfblock_ids
+        self.table = self.halfblock_ids = None
+        version = self.version
+        self.contributions = {}
+        for block in table.get_halfblocks_by_ids(halfblock_ids):
+            self._add_block(block)
+        self.version = version
+
+    def add_listener(self, listener):
+        """
+        Registers a function which is called with the list of new blocks
+        whenever blocks are added to the set.
+        """
+        self.listeners.append(listener)
+
+    def notify(self, blocks):
+        """
+        Passes newly added blocks to all listeners.
+        """
+        if blocks:
+            for listener in self.listeners:
+                listener(blocks)
 
     def add_block(self, block):
         """
         Adds a new block to the interaction set.
 
         :param block: A single halfblock
+        :return: True if the block was not yet part of the set
+        """
+        if not self._add_block(block):
+            return False
+
+        self.notify([block])
+        return True
+
+    def _add_block(self, block):
         """
-        self.halfblocks |= set([block])
+        Adds a block to the set and its indexes without notifying listeners.
+        """
+        self._load()
+        if block in self.halfblocks:
+            return False
+
+        self.halfblocks.add(block)
+        self.block_index.setdefault((block.public_key, block.sequence_number), block)
+        bisect.insort(self.key_index.setdefault(block.public_key, []), block)
+        self.link_index.setdefault(block.link_public_key, {}) \
+            .setdefault(block.link_sequence_number, []).append(block)
+        self.public_keys.add(block.public_key)
+        self.public_keys.add(block.link_public_key)
+        self.contributions[block.public_key] = \
+            self.contributions.get(block.public_key, 0) + block.contribution
+        self.version += 1
+
+        return True
 
     def add_blocks(self, blocks):
         """
         Adds multiple blocks to the interaction set.
 
         :param blocks: List of halfblocks
+        :return: The number of blocks that were not yet part of the set
         """
         assert isinstance(blocks, list)
-        self.halfblocks |= set(blocks)
+        added = [block for block in blocks if self._add_block(block)]
+        self.notify(added)
+
+        return len(added)
+
+    def update(self, other):
+        """
+        Adds all blocks of another interaction set.
+
+        :return: The number of blocks that were not yet part of the set
+        """
+        return self.add_blocks(other.get_blocks())
 
     def list_public_keys(self):
         """
         Returns the list of all known public keys in the network.
         """
-        responders = [block.public_key for block in self.halfblocks]
-        requesters = [block.link_public_key for block in self.halfblocks]
-        responders.extend(requesters)
+        if self.table is not None:
+            public_keys = self.table.get_public_keys()
+            return set(public_keys[key_id] for key_id in self._table_key_ids().tolist())
+        return set(self.public_keys)
+
+    def count_public_keys(self):
+        """
+        Returns the number of known public keys in the network.
+        """
+        if self.table is not None:
+            return len(self._table_key_ids())
+        return len(self.public_keys)
 
-        return set(responders)
+    def _table_key_ids(self):
+        """
+        Returns the agent ids of the owners and partners of the halfblocks of
+        a table-backed set.
+        """
+        fields = self.table.halfblock_fields(self.halfblock_ids)
+        return np.union1d(fields['public_key'], fields['link_public_key'])
 
     def build_graph(self):
         """
@@ -60,7 +182,7 @@ class InteractionSet(object):
             except KeyError:
                 graph.add_edge(pubkey1, pubkey2, capacity=contrib)
 
-        for block in self.halfblocks:
+        for block in self.get_blocks():
 
             pubkey_req = block.public_key.to_hex()[:10]
             pubkey_res = block.link_public_key.to_hex()[:10]
@@ -74,29 +196,85 @@ class InteractionSet(object):
         """
         Calculates the known contributions for a known agent.
         """
-        agent_blocks = [block for block in self.halfblocks if block.public_key == agent]
-        agent_chain = Chain(agent_blocks)
-
-        return agent_chain.up()
+        if self.table is not None:
+            if not self.contributions:
+                fields = self.table.halfblock_fields(self.halfblock_ids)
+                key_ids, inverse = np.unique(fields['public_key'], return_inverse=True)
+                totals = np.bincount(inverse, fields['contribution'], minlength=len(key_ids))
+                public_keys = self.table.get_public_keys()
+                self.contributions = {public_keys[key_id]: int(total)
+                                      for key_id, total in zip(key_ids.tolist(), totals.tolist())}
+        return self.contributions.get(agent, 0)
 
     def get_block(self, public_key, sequence_number):
         """
         Get a block given by the public_key and sequence number from the block
         storage.
         """
-        for block in self.halfblocks:
-            if block.public_key == public_key and block.sequence_number == sequence_number:
-                return block
+        self._load()
+        return self.block_index.get((public_key, sequence_number))
+
+    def get_blocks_by_key(self, public_key):
+        """
+        Returns the known blocks of a public key, sorted by sequence number.
+        """
+        self._load()
+        return list(self.key_index.get(public_key, []))
+
+    def get_blocks_by_link(self, public_key, sequence_number=None):
+        """
+        Returns the known blocks that link to a public key, or to one
+        sequence number of it.
+        """
+        self._load()
+        links = self.link_index.get(public_key, {})
+        if sequence_number is not None:
+            return list(links.get(sequence_number, []))
+        return [block for blocks in links.itervalues() for block in blocks]
 
     def get_blocks(self):
         """
         Returns all blocks contained in the set.
         """
+        self._load()
         return list(self.halfblocks)
 
+    def memory_usage(self):
+        """
+        Returns an estimate of the memory used by the membership and index
+        structures of the set in bytes, not counting the halfblocks. A
+        table-backed set only uses the array of its halfblock ids.
+        """
+        if self.table is not None:
+            return self.halfblock_ids.nbytes
+        index_keys = sys.getsizeof((None, 0)) * len(self.block_index)
+        key_lists = sum(sys.getsizeof(blocks) for blocks in self.key_index.itervalues())
+        link_lists = sum(sys.getsizeof(links) + sum(sys.getsizeof(blocks) for blocks in links.itervalues())
+                         for links in self.link_index.itervalues())
+
+        return sys.getsizeof(self.halfblocks) + sys.getsizeof(self.block_index) + index_keys + \
+            sys.getsizeof(self.key_index) + key_lists + \
+            sys.getsizeof(self.link_index) + link_lists + \
+            sys.getsizeof(self.public_keys) + sys.getsizeof(self.contributions)
+
+    def __len__(self):
+        """
+        Returns the number of blocks contained in the set.
+        """
+        if self.table is not None:
+            return len(self.halfblock_ids)
+        return len(self.halfblocks)
+
+    def __contains__(self, block):
+        """
+        Returns true if the block is contained in the set.
+        """
+        self._load()
+        return block in self.halfblocks
+
     def to_list(self):
         """
         Returns a list of dicts which represent the data contained in the
         interaction set.
         """
-        return [block.to_dict() for block in self.halfblocks]
+        return [block.to_dict() for block in self.get_blocks()]
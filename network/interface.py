@@ -7,15 +7,40 @@ class NetworkInterface(object):
     The network interface through which agents can communicate.
     """
 
-    def __init__(self, network):
+    def __init__(self, network, scheduler=None):
         """
         Creates a new network interface.
+
+        :param scheduler: Scheduler or AgentRuntime which delivers the
+        messages. Without a scheduler messages are delivered immediately.
         """
         self.network = network
+        self.scheduler = scheduler
+        self.messages_sent = 0
+        self.bytes_sent = 0
+        self.bytes_by_type = {}
 
     def send(self, public_key_receiver, message):
         """
-        Send a message to an agent.
+        Send a message to an agent. The size of the message on the wire is
+        added to the byte counters.
+
+        :return: The result of the scheduler, if any
         """
+        size = message.size()
+        self.messages_sent += 1
+        self.bytes_sent += size
+        self.bytes_by_type[message.type] = self.bytes_by_type.get(message.type, 0) + size
+
+        if self.scheduler is not None:
+            return self.scheduler.schedule(public_key_receiver, message)
+
         receiver = self.network.get_agent(public_key_receiver)
         receiver.receive(message)
+
+    def get_chain(self, public_key):
+        """
+        Returns the personal chain of an agent directly, without exchanging
+        messages.
+        """
+        return self.network.get_agent(public_key).get_personal_chain()
@@ -0,0 +1,99 @@
+"""
+Module defining the KeyPrefixIndex class.
+"""
+import bisect
+
+from attestation.public_key import PublicKey
+
+# Maximum number of matching public keys reported for an ambiguous prefix.
+MAX_REPORTED_MATCHES = 10
+
+
+class AmbiguousKeyError(LookupError):
+    """
+    Raised when a key prefix matches more than one public key.
+    """
+
+    def __init__(self, prefix, matches):
+        """
+        Creates the error for a prefix and the public keys it matches.
+        """
+        LookupError.__init__(self, "Prefix '%s' matches several public keys" % prefix)
+        self.prefix = prefix
+        self.matches = matches
+
+
+class KeyPrefixIndex(object):
+    """
+    Sorted index over the hex and base64 encodings of public keys, which
+    resolves an encoded prefix to the matching keys with a binary search.
+    """
+
+    def __init__(self, public_keys=()):
+        """
+        Creates the index for the given public keys.
+        """
+        self.entries = []
+        self.pending = []
+
+        for public_key in public_keys:
+            self.add(public_key)
+
+    def add(self, public_key):
+        """
+        Adds a public key to the index. The index is re-sorted lazily on the
+        next lookup, so adding many keys in a row stays cheap.
+        """
+        assert isinstance(public_key, PublicKey)
+        self.pending.append((public_key.to_hex(), public_key.id))
+        self.pending.append((public_key.to_base64(), public_key.id))
+
+    def _flush(self):
+        """
+        Merges recently added keys into the sorted entries.
+        """
+        if self.pending:
+            self.entries.extend(self.pending)
+            self.entries.sort()
+            self.pending = []
+
+    def lookup(self, prefix, limit=None):
+        """
+        Returns the list of public keys of which the hex or base64 encoding
+        starts with the given prefix.
+
+        :param limit: Maximum number of public keys returned, all by default.
+        """
+        self._flush()
+
+        key_ids = []
+        seen = set()
+        position = bisect.bisect_left(self.entries, (prefix,))
+        while position < len(self.entries) and self.entries[position][0].startswith(prefix):
+            key_id = self.entries[position][1]
+            if key_id not in seen:
+                if len(key_ids) == limit:
+                    break
+                seen.add(key_id)
+                key_ids.append(key_id)
+            position += 1
+
+        return [PublicKey.from_id(key_id) for key_id in key_ids]
+
+    def resolve(self, prefix):
+        """
+        Returns the single public key matching the prefix, or None if no key
+        matches. Raises an AmbiguousKeyError with at most MAX_REPORTED_MATCHES
+        of the matching keys if several keys match.
+        """
+        matches = self.lookup(prefix, MAX_REPORTED_MATCHES)
+        if len(matches) > 1:
+            raise AmbiguousKeyError(prefix, matches)
+
+        return matches[0] if matches else None
+
+    def __len__(self):
+        """
+        Returns the number of indexed public keys.
+        """
+        return (len(self.entries) + len(self.pending)) / 2
@@ -1,6 +1,18 @@
 """
 Module defining messages that agents can send to each other.
 """
+import numpy as np
+
+from attestation.halfblock import Halfblock
+from chain import Chain
+from reconciliation import IBLT, halfblock_size
+
+# Bytes of the format version, flags, message type and the public key of the
+# sender on the wire, see codec.
+HEADER_SIZE = 3 + 74
+
+# Bytes of the length of a list or array on the wire.
+COUNT_SIZE = 4
 
 class MessageTypes(object):
     PA_BLOCKS = 3
@@ -9,6 +21,10 @@ class MessageTypes(object):
     PA_SCORE_REPLY = 6
     CHAIN = 7
     CHAIN_REPLY = 8
+    PA_SKETCH = 9
+    PA_SKETCH_RETRY = 10
+    PA_DELTA = 11
+    PA_DELTA_REPLY = 12
 
 class Message(object):
     """
@@ -22,4 +38,34 @@ class Message(object):
 
         self.type = message_type
         self.payload = payload
-        self.sender = sender 
+        self.sender = sender
+
+    def size(self):
+        """
+        Returns the size of the message on the wire in bytes, with public keys
+        sent in full.
+        """
+        return HEADER_SIZE + payload_size(self.payload)
+
+
+def payload_size(payload):
+    """
+    Returns the size of a message payload on the wire in bytes.
+    """
+    if payload is None:
+        return 0
+    if isinstance(payload, bool):
+        return 1
+    if isinstance(payload, Halfblock):
+        return halfblock_size(payload)
+    if isinstance(payload, tuple):
+        return sum(payload_size(item) for item in payload)
+    if isinstance(payload, list):
+        return COUNT_SIZE + sum(payload_size(item) for item in payload)
+    if isinstance(payload, Chain):
+        return payload_size(payload.get_blocks())
+    if isinstance(payload, IBLT):
+        return COUNT_SIZE + payload.size()
+    if isinstance(payload, np.ndarray):
+        return COUNT_SIZE + payload.nbytes
+    return 8
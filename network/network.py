@@ -2,14 +2,27 @@
 Module describing the Network class.
 """
 import logging
+from itertools import izip
 import networkx as nx
+import numpy as np
+from twisted.internet import defer
+from attestation.block_table import CHUNK_ROWS, BlockTable
 from attestation.database import MultiChainDB
 from attestation.public_key import PublicKey
 from interaction_set import InteractionSet
+from chain import Chain
 from agent import Agent
+from arena import ArenaInteractionSet, BlockArena
 from attestation.halfblock import Halfblock
 from interface import NetworkInterface
+from endorsement import EndorsementStore
+from hops import PartnerAdjacency
+from audit_rounds import AuditRounds
+from coverage import hop_coverage, partner_matrix, table_partner_matrix
+from key_index import KeyPrefixIndex
 from progress.bar import Bar
+from ranking.score_matrix import ScoreMatrix
+from ranking.temporal_graph import TemporalGraph
 
 class Network(object):
     """
@@ -19,21 +32,38 @@ class Network(object):
     interactions and can act as a reference.
     """
 
-    def __init__(self, blocks):
+    def __init__(self, blocks=(), num_blocks=None, use_arena=False):
         """
         Creates a new Network object.
+
+        :param blocks: Iterable of database blocks, consumed once.
+        :param num_blocks: Number of blocks, used for progress reporting when
+        blocks is a generator.
+        :param use_arena: Store all halfblocks once in a BlockArena and keep
+        the interaction sets of agents as bitmaps over the arena.
         """
         self.agents = {}
-        self.interactions = InteractionSet()
+        self.key_index = KeyPrefixIndex()
+        self.arena = BlockArena() if use_arena else None
+        self.interactions = self.create_interaction_set()
         self.interface = NetworkInterface(self)
+        self.endorsements = EndorsementStore()
+        self.runtime = None
+        self.audit_rounds = None
+        self.table = None
 
-        self.create_agents_from_blocks(blocks)
+        self.create_agents_from_blocks(blocks, num_blocks)
 
-    def create_agents_from_blocks(self, blocks):
+    def create_agents_from_blocks(self, blocks, num_blocks=None):
         """
-        Populate the network with agents from the database.
+        Populate the network with agents from the database. The blocks are
+        consumed in a single pass, so a generator can be passed to avoid
+        holding all database rows in memory.
         """
-        progressbar = Bar('Creating agents', max=len(blocks))
+        if num_blocks is None and hasattr(blocks, '__len__'):
+            num_blocks = len(blocks)
+
+        progressbar = Bar('Creating agents', max=num_blocks or 0)
         for block in blocks:
             public_key1 = PublicKey(block.public_key_requester)
             public_key2 = PublicKey(block.public_key_responder)
@@ -52,6 +82,83 @@ class Network(object):
             progressbar.next()
         progressbar.finish()
 
+    def create_agents_from_block_table(self, table):
+        """
+        Populate the network with agents from a BlockTable. The table is kept
+        so that network-wide aggregates can be computed on its columns.
+
+        Without a block arena, the chains and interaction sets of the agents
+        are views on the table, see Chain.from_table and
+        InteractionSet.from_table, so no halfblock is created until an agent
+        reads or receives blocks.
+        """
+        self.table = table
+        agents = []
+        for public_key in table.get_public_keys():
+            agent = self.get_agent(public_key)
+            if agent is None:
+                agent = self.add_agent(public_key)
+            agents.append(agent)
+
+        if self.arena is None and len(self.interactions) == 0:
+            for agent_id, agent in enumerate(Bar('Creating agents').iter(agents)):
+                halfblock_ids = table.get_chain_halfblocks(agent_id)
+                agent.chain = Chain.from_table(table, halfblock_ids)
+                agent.interactions = InteractionSet.from_table(table, halfblock_ids)
+            self.interactions = InteractionSet.from_table(table, np.arange(2 * len(table)))
+            return
+
+        halfblocks = []
+        progressbar = Bar('Creating agents', max=len(table))
+        for start in xrange(0, len(table), CHUNK_ROWS):
+            stop = min(start + CHUNK_ROWS, len(table))
+            rows = izip(table.requester[start:stop].tolist(), table.responder[start:stop].tolist(),
+                        table.iter_halfblocks(start, stop))
+            for requester, responder, (block_req, block_res) in rows:
+                agents[requester].add_transaction(block_req)
+                agents[responder].add_transaction(block_res)
+                halfblocks.append(block_req)
+                halfblocks.append(block_res)
+            progressbar.next(stop - start)
+        progressbar.finish()
+        self.interactions.add_blocks(halfblocks)
+
+    def get_contribution_totals(self):
+        """
+        Returns a dict mapping the public key of every agent to the total
+        amount of uploaded and downloaded data in its chain. When the network
+        was built from a BlockTable the totals are computed on its columns.
+        """
+        if self.table is not None:
+            up_totals = self.table.up_totals()
+            down_totals = self.table.down_totals()
+            return {PublicKey(bin_key): (up_totals[agent_id], down_totals[agent_id])
+                    for agent_id, bin_key in enumerate(self.table.public_keys)}
+
+        return {public_key: (agent.chain.up(), agent.chain.down())
+                for public_key, agent in self.agents.iteritems()}
+
+    def create_interaction_set(self):
+        """
+        Creates an empty interaction set, backed by the block arena if the
+        network uses one.
+        """
+        if self.arena is not None:
+            return ArenaInteractionSet(self.arena)
+
+        return InteractionSet()
+
+    def memory_usage(self):
+        """
+        Returns an estimate of the memory in bytes used by the interaction
+        sets of all agents plus the block arena, not counting the halfblocks.
+        """
+        usage = sum(agent.interactions.memory_usage() for agent in self.agents.itervalues())
+        if self.arena is not None:
+            usage += self.arena.memory_usage()
+
+        return usage
+
     def set_accounting_policy(self, func):
         """
         Sets the accounting policy for agents to use.
@@ -62,25 +169,67 @@ class Network(object):
 
 
     @classmethod
-    def from_database(cls, db_adapter):
+    def from_database(cls, db_adapter, use_arena=False):
         """
         Creates a network from a given database.
 
         :param db: A DatabaseAdapter object.
         """
         assert isinstance(db_adapter, MultiChainDB)
-        blocks = db_adapter.get_all_blocks()
 
-        return cls(blocks)
+        return cls(db_adapter.iter_blocks(), db_adapter.get_num_blocks(), use_arena)
 
     @classmethod
-    def from_file(cls, path):
+    def from_block_table(cls, table, use_arena=False):
+        """
+        Creates a network from a columnar block table.
+
+        :param table: A BlockTable object.
+        """
+        assert isinstance(table, BlockTable)
+        network = cls(use_arena=use_arena)
+        network.create_agents_from_block_table(table)
+
+        return network
+
+    @classmethod
+    def from_file(cls, path, use_arena=False):
+        """
+        Creates a network from a snapshot written by save. The columns of the
+        snapshot are memory-mapped, see BlockTable.load, and the chains and
+        interaction sets of the agents are views on the halfblocks listed by
+        the stored chain_order and chain_offsets, so no Halfblock is created
+        until the blocks of an agent are requested.
+
+        :param path: Path to the snapshot directory.
+        """
+        return cls.from_block_table(BlockTable.load(path), use_arena)
+
+    @classmethod
+    def from_snapshot(cls, path, db_adapter, use_arena=False):
+        """
+        Creates a network from a snapshot, which is first written from the
+        database if it does not exist yet. Remove the snapshot directory to
+        rebuild it after the database has changed.
+
+        :param path: Path to the snapshot directory.
+        :param db_adapter: MultiChainDB to create the snapshot from.
         """
-        Creates a network from a serialized network file.
+        if not BlockTable.is_snapshot(path):
+            BlockTable.from_database(db_adapter).save(path)
+        return cls.from_file(path, use_arena)
 
-        :param filename: Path to the network file.
+    def save(self, path):
         """
-        pass
+        Writes a snapshot of the blocks of the network to a directory. Only
+        networks created from a BlockTable can be saved, as the halfblocks
+        of the agents lack the hashes of the blocks.
+
+        :param path: Path to the snapshot directory.
+        """
+        if self.table is None:
+            raise ValueError("Only a network created from a BlockTable can be saved")
+        self.table.save(path)
 
     def list_agents(self):
         """
@@ -88,25 +237,128 @@ class Network(object):
         """
         return self.agents
 
-    def pairwise_audit(self, requester, responder=None):
+    def pairwise_audit(self, requester, responder=None, reconcile=False):
         """
         Perform pairwise audit between two nodes.
+
+        :param reconcile: Only exchange the blocks the other node is missing.
+        :return: With an AgentRuntime, a deferred which fires with the audit
+        record when the audit is finished, or with None if no responder is
+        given and every reachable agent has been audited.
         """
         assert isinstance(requester, Agent)
 
+        if self.runtime is not None:
+            if responder is None:
+                partner = requester.get_next_audit_partner()
+                if partner is None:
+                    return defer.succeed(None)
+                responder = self.get_agent(partner)
+            return self.runtime.pairwise_audit(requester, responder, reconcile)
+
         if responder is not None:
-            requester.initiate_pairwise_auditing(responder.public_key)
+            requester.initiate_pairwise_auditing(responder.public_key, reconcile)
         else:
-            requester.initiate_pairwise_auditing(None)
+            requester.initiate_pairwise_auditing(None, reconcile)
 
-    def increase_data_to_hops(self, hops):
+    def run_audit_rounds(self, rounds, policy='random', size=None, reconcile=True, seed=None):
+        """
+        Runs rounds of audits between disjoint pairs of agents, see
+        AuditRounds for the policies. The state of the policies is kept
+        between calls as long as no agents are added.
+
+        :param size: Number of pairs per round, as many as possible by default.
+        :param seed: Seed of the random choices of the policies.
+        :return: List of records of the rounds, with the number of pairs, the
+        bytes and blocks moved and the mean fraction of the network known to
+        the agents afterwards
+        """
+        if self.audit_rounds is None or len(self.audit_rounds.public_keys) != len(self.agents):
+            self.audit_rounds = AuditRounds(self, seed)
+        return self.audit_rounds.run(rounds, policy, size, reconcile)
+
+    def calculate_rankings(self, sources=None, batch_size=4, dtype=np.float32):
+        """
+        Calculates the personalized temporal PageRank of a set of source
+        agents over all interactions in the network. The temporal graph is
+        built once and the personalization vectors of up to batch_size
+        sources are iterated together, which needs about
+        24 * batch_size * nodes bytes of memory.
+
+        :param sources: Public keys of the source agents, all agents by default.
+        :param batch_size: Number of sources iterated at once.
+        :return: A ScoreMatrix with one row per source and one column per
+        agent. Rows of sources that did not converge are NaN.
+        """
+        if sources is None:
+            sources = sorted(self.agents, key=lambda public_key: public_key.id)
+
+        graph = TemporalGraph.from_blocks(self.interactions.get_blocks())
+        agent_ids, indicator = graph.agent_matrix()
+        scores = np.zeros((len(sources), len(agent_ids)), dtype=dtype)
+
+        for start in Bar('Calculating rankings').iter(range(0, len(sources), batch_size)):
+            batch = sources[start:start + batch_size]
+            node_scores, iterations = graph.pagerank_batch(graph.personalization_matrix(batch))
+            agent_scores = indicator.dot(node_scores).T
+            agent_scores[iterations < 0] = np.nan
+            scores[start:start + len(batch)] = agent_scores
+
+        return ScoreMatrix.from_ids(sources, agent_ids, scores)
+
+    def set_scheduler(self, scheduler):
+        """
+        Delivers messages between agents through a discrete-event scheduler
+        instead of immediately. Messages are then only delivered while the
+        scheduler runs, see Scheduler.run_until.
+        """
+        self.interface.scheduler = scheduler
+
+    def set_runtime(self, runtime):
+        """
+        Runs the agents in an AgentRuntime, which delivers messages through
+        agent inboxes and runs pairwise audits concurrently.
+        """
+        self.runtime = runtime
+        self.interface.scheduler = runtime
+
+    def get_partner_adjacency(self):
+        """
+        Returns the partners of all agents according to their chains.
+        """
+        return PartnerAdjacency({public_key: agent.chain for public_key, agent in self.agents.iteritems()})
+
+    def get_hop_coverage(self, max_hops):
+        """
+        Calculates for every agent the fraction of the network it knows after
+        increasing its data to 1 up to max_hops hops, without exchanging
+        messages.
+
+        :return: Tuple of the list of public keys and an array of shape
+        (max_hops, number of agents) with the fractions
+        """
+        if self.table is not None and len(self.table.public_keys) == len(self.agents):
+            public_keys = [PublicKey(bin_key) for bin_key in self.table.public_keys]
+            matrix = table_partner_matrix(self.table)
+        else:
+            public_keys = list(self.agents)
+            matrix = partner_matrix(self.get_partner_adjacency(), public_keys)
+
+        return public_keys, hop_coverage(matrix, max_hops)
+
+    def increase_data_to_hops(self, hops, precomputed=True):
         """
         Increases the data to a certain amount of hops. Each agent
         will store at least all data from all agens `hops` hops away.
+
+        :param precomputed: Find the agents to request chains from in the
+        partner adjacency of the network, instead of requesting the chains
+        hop by hop.
         """
+        adjacency = self.get_partner_adjacency() if precomputed else None
         for agent_key in Bar('Increasing data').iter(self.agents):
             agent = self.get_agent(agent_key)
-            agent.obtain_data_from_hops(hops)
+            agent.obtain_data_from_hops(hops, adjacency)
 
     def add_agent(self, public_key):
         """
@@ -117,7 +369,9 @@ class Network(object):
             logging.warning("Agent already exists.")
             return None
 
-        self.agents[public_key] = Agent(self.interface, public_key)
+        self.agents[public_key] = Agent(self.interface, public_key, self.create_interaction_set(),
+                                        EndorsementStore(self.endorsements))
+        self.key_index.add(public_key)
 
         return self.agents[public_key]
 
@@ -141,12 +395,22 @@ class Network(object):
         print "Blocks kept: ", blocks_kept
         print "Removed blocks: ", removed_blocks
 
-    def get_agent(self, public_key):
+    def get_agent(self, public_key, substring=False):
         """
         Tries to get an agent from the network. If it does not exist, it
         returns None.
+
+        Agents can also be found by a prefix of the hex or base64 encoding of
+        their public key. An AmbiguousKeyError is raised if the prefix matches
+        more than one agent. With substring set, the encoded keys of all
+        agents are scanned for the string instead and the list of matching
+        agents is returned if there is more than one.
         """
         if isinstance(public_key, str):
+            if not substring:
+                key = self.key_index.resolve(public_key)
+                return self.agents.get(key) if key is not None else None
+
             results = []
             for key, agent in self.agents.iteritems():
                 if public_key in key.to_hex() or public_key in key.to_base64():
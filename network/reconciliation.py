@@ -0,0 +1,209 @@
+"""
+Module defining set reconciliation of interaction sets with invertible Bloom
+lookup tables (IBLT). Two agents can compute the symmetric difference of
+their interaction sets from a sketch whose size depends on the size of the
+difference only, instead of exchanging all blocks.
+"""
+import numpy as np
+
+# Number of cells every digest is added to.
+NUM_HASHES = 3
+# Smallest sketch that is sent.
+MIN_CELLS = 30
+# Bytes per cell on the wire: a 32 bit count and two 64 bit sums.
+CELL_SIZE = 4 + 8 + 8
+# Bytes of a digest on the wire.
+DIGEST_SIZE = 8
+# One in SAMPLE_RATE digests is sent along with a sketch, so the receiver can
+# estimate the size of the difference when the sketch does not decode.
+SAMPLE_RATE = 64
+# Odd multipliers used to derive independent cell positions and the checksum
+# from a digest.
+_MULTIPLIERS = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9],
+                        dtype=np.uint64)
+_CHECK_MULTIPLIER = np.uint64(0xFF51AFD7ED558CCD)
+
+
+def _checksum(digests):
+    """
+    Returns the checksums of an array of digests.
+    """
+    with np.errstate(over='ignore'):
+        mixed = digests * _CHECK_MULTIPLIER
+    return mixed ^ (mixed >> np.uint64(29))
+
+
+class IBLT(object):
+    """
+    Invertible Bloom lookup table over 64 bit block digests. The cells are
+    split into one partition per hash function, so a digest never lands in
+    the same cell twice.
+    """
+
+    def __init__(self, num_cells):
+        """
+        Creates an empty table with (at least) the given number of cells.
+        """
+        self.partition = max(1, -(-num_cells // NUM_HASHES))
+        self.counts = np.zeros(self.partition * NUM_HASHES, dtype=np.int32)
+        self.digest_sums = np.zeros(self.partition * NUM_HASHES, dtype=np.uint64)
+        self.check_sums = np.zeros(self.partition * NUM_HASHES, dtype=np.uint64)
+
+    @classmethod
+    def from_digests(cls, digests, num_cells):
+        """
+        Creates a table containing the given digests.
+        """
+        table = cls(num_cells)
+        table.insert(np.asarray(digests, dtype=np.uint64))
+        return table
+
+    @classmethod
+    def from_arrays(cls, counts, digest_sums, check_sums):
+        """
+        Creates a table from the arrays of its cells, which are used as they
+        are.
+        """
+        table = cls.__new__(cls)
+        table.partition = len(counts) // NUM_HASHES
+        table.counts = counts
+        table.digest_sums = digest_sums
+        table.check_sums = check_sums
+        return table
+
+    def _cells(self, digests):
+        """
+        Returns the cell indices of the digests, one row per hash function.
+        """
+        with np.errstate(over='ignore'):
+            positions = [(digests * multiplier >> np.uint64(32)) % np.uint64(self.partition)
+                         for multiplier in _MULTIPLIERS]
+        return [positions[i].astype(np.int64) + i * self.partition for i in range(NUM_HASHES)]
+
+    def insert(self, digests):
+        """
+        Adds an array of digests to the table.
+        """
+        checks = _checksum(digests)
+        for cells in self._cells(digests):
+            np.add.at(self.counts, cells, 1)
+            np.bitwise_xor.at(self.digest_sums, cells, digests)
+            np.bitwise_xor.at(self.check_sums, cells, checks)
+
+    def subtract(self, other):
+        """
+        Returns a new table which encodes the difference of the two sets.
+        """
+        assert len(self.counts) == len(other.counts)
+        result = IBLT(len(self.counts))
+        result.counts = self.counts - other.counts
+        result.digest_sums = self.digest_sums ^ other.digest_sums
+        result.check_sums = self.check_sums ^ other.check_sums
+        return result
+
+    def decode(self):
+        """
+        Peels the table. Returns the digests only present in the first set and
+        the digests only present in the second set of a subtracted table, or
+        None if the table is too small to decode the difference.
+        """
+        counts = self.counts.copy()
+        digest_sums = self.digest_sums.copy()
+        check_sums = self.check_sums.copy()
+        only_first = []
+        only_second = []
+
+        def is_pure(cell):
+            """
+            Returns true if a cell contains exactly one digest.
+            """
+            return counts[cell] in (1, -1) and \
+                _checksum(digest_sums[cell:cell + 1])[0] == check_sums[cell]
+
+        queue = [cell for cell in range(len(counts)) if is_pure(cell)]
+        while queue:
+            cell = queue.pop()
+            if not is_pure(cell):
+                continue
+
+            digest = digest_sums[cell:cell + 1].copy()
+            sign = counts[cell]
+            (only_first if sign == 1 else only_second).append(int(digest[0]))
+
+            check = _checksum(digest)[0]
+            for cells in self._cells(digest):
+                target = cells[0]
+                counts[target] -= sign
+                digest_sums[target] ^= digest[0]
+                check_sums[target] ^= check
+                if is_pure(target):
+                    queue.append(target)
+
+        if counts.any() or digest_sums.any() or check_sums.any():
+            return None
+
+        return only_first, only_second
+
+    def size(self):
+        """
+        Returns the size of the table on the wire in bytes.
+        """
+        return len(self.counts) * CELL_SIZE
+
+    def __len__(self):
+        """
+        Returns the number of cells in the table.
+        """
+        return len(self.counts)
+
+
+def sketch_size(difference):
+    """
+    Returns a number of cells with which a difference of the given size
+    decodes with high probability.
+    """
+    return max(MIN_CELLS, int(2 * difference) + NUM_HASHES)
+
+
+def sample_digests(digests):
+    """
+    Returns the deterministic sample of an array of digests which is used to
+    estimate the size of a difference.
+    """
+    return digests[digests % np.uint64(SAMPLE_RATE) == 0]
+
+
+def estimate_difference(sample, other_sample):
+    """
+    Estimates the size of the symmetric difference of two sets from their
+    digest samples.
+    """
+    return SAMPLE_RATE * len(np.setxor1d(sample, other_sample))
+
+
+def get_digests(interactions):
+    """
+    Returns the digests of all blocks in an interaction set as an array,
+    aligned with interactions.get_blocks().
+    """
+    blocks = interactions.get_blocks()
+    return blocks, np.fromiter((block.digest() for block in blocks),
+                               dtype=np.uint64, count=len(blocks))
+
+
+def get_blocks_by_digests(interactions, digests):
+    """
+    Returns the blocks of an interaction set with one of the given digests.
+    """
+    blocks, own_digests = get_digests(interactions)
+    wanted = np.in1d(own_digests, np.asarray(digests, dtype=np.uint64))
+    return [block for block, keep in zip(blocks, wanted) if keep]
+
+
+def halfblock_size(block):
+    """
+    Returns the size of a halfblock on the wire in bytes: four integers, the
+    two public keys and the hash and the signature with their lengths.
+    """
+    return 4 * 8 + len(block.public_key.bin_key) + len(block.link_public_key.bin_key) + \
+        2 + len(block.previous_hash) + 2 + len(block.signature)
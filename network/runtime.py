@@ -0,0 +1,171 @@
+"""
+Module defining the AgentRuntime class, which runs many pairwise audits
+concurrently with Twisted deferreds.
+"""
+from collections import deque
+
+from twisted.internet.defer import Deferred, DeferredQueue, DeferredSemaphore
+
+# Default number of audits that run at the same time.
+CONCURRENCY = 100
+
+
+class AgentRuntime(object):
+    """
+    Runtime in which every agent has an inbox. Sending a message enqueues it
+    and returns a deferred which fires once the message is in the inbox of
+    the receiver. Messages are delivered by one loop instead of recursive
+    receive calls, so audits interleave and a long exchange never blocks the
+    others.
+
+    Without a reactor, queued messages are only delivered by run. With a
+    reactor, delivery is scheduled on it as soon as a message is sent.
+    """
+
+    def __init__(self, network, concurrency=CONCURRENCY, reactor=None):
+        """
+        Creates a runtime for the agents of a network.
+
+        :param concurrency: Maximum number of audits in progress.
+        :param reactor: Twisted reactor to schedule delivery on.
+        """
+        self.network = network
+        self.semaphore = DeferredSemaphore(concurrency)
+        self.reactor = reactor
+        self.ready = deque()
+        self.inboxes = {}
+        self.running = False
+        self.scheduled = False
+        self.audits = {}
+        self.waiting = {}
+        self.delivered = 0
+
+    def get_inbox(self, public_key):
+        """
+        Returns the inbox of an agent, starting its receive loop when it is
+        first used.
+        """
+        inbox = self.inboxes.get(public_key)
+        if inbox is None:
+            inbox = self.inboxes[public_key] = DeferredQueue()
+            agent = self.network.get_agent(public_key)
+            agent.audit_listeners.append(self._audit_finished)
+            self._receive_next(agent, inbox)
+        return inbox
+
+    def _receive_next(self, agent, inbox):
+        """
+        Waits for the next message in the inbox of an agent.
+        """
+        inbox.get().addCallback(self._receive, agent, inbox)
+
+    def _receive(self, message, agent, inbox):
+        """
+        Handles a message taken from the inbox of an agent.
+        """
+        self._receive_next(agent, inbox)
+        agent.receive(message)
+
+    def schedule(self, receiver, message):
+        """
+        Enqueues a message for the agent with public key receiver.
+
+        :return: A deferred which fires when the message is in the inbox
+        """
+        enqueued = Deferred()
+        self.ready.append((receiver, message, enqueued))
+        if self.reactor is not None and not self.running and not self.scheduled:
+            self.scheduled = True
+            self.reactor.callLater(0, self.run)
+        return enqueued
+
+    def run(self):
+        """
+        Delivers messages until no messages are left.
+
+        :return: The number of delivered messages
+        """
+        self.scheduled = False
+        if self.running:
+            return 0
+
+        self.running = True
+        delivered = 0
+        try:
+            while self.ready:
+                receiver, message, enqueued = self.ready.popleft()
+                self.get_inbox(receiver).put(message)
+                enqueued.callback(None)
+                delivered += 1
+        finally:
+            self.running = False
+        self.delivered += delivered
+        return delivered
+
+    def pairwise_audit(self, requester, responder, reconcile=False):
+        """
+        Starts a pairwise audit as soon as fewer than the maximum number of
+        audits are in progress. Agents keep one audit record per partner, so
+        audits of a pair of agents that is already being audited, in either
+        direction, wait until the previous audits of the pair have finished.
+
+        :return: A deferred which fires with the audit record of the
+        requester when the PA_SCORE_REPLY has arrived
+        """
+        pair = frozenset([requester.public_key, responder.public_key])
+        if pair in self.waiting:
+            queued = Deferred()
+            self.waiting[pair].append((requester, responder, reconcile, queued))
+            return queued
+
+        self.waiting[pair] = deque()
+        return self._run_audit(pair, requester, responder, reconcile)
+
+    def _run_audit(self, pair, requester, responder, reconcile):
+        """
+        Runs an audit of a pair and starts the next waiting audit of the pair
+        once it is finished.
+        """
+        finished = self.semaphore.run(self._start_audit, requester, responder, reconcile)
+        finished.addBoth(self._run_next_audit, pair)
+        return finished
+
+    def _run_next_audit(self, result, pair):
+        """
+        Starts the next waiting audit of a pair, passing on the result of the
+        previous one.
+        """
+        waiting = self.waiting[pair]
+        if waiting:
+            requester, responder, reconcile, queued = waiting.popleft()
+            self._run_audit(pair, requester, responder, reconcile).chainDeferred(queued)
+        else:
+            del self.waiting[pair]
+        return result
+
+    def _start_audit(self, requester, responder, reconcile):
+        """
+        Starts a pairwise audit.
+
+        :return: A deferred which fires when the audit is finished
+        """
+        finished = Deferred()
+        self.audits[(requester.public_key, responder.public_key)] = finished
+        self.get_inbox(requester.public_key)
+        self.get_inbox(responder.public_key)
+        requester.initiate_pairwise_auditing(responder.public_key, reconcile)
+        return finished
+
+    def _audit_finished(self, agent, record):
+        """
+        Fires the deferred of an audit once its requester has finished it.
+        """
+        finished = self.audits.pop((agent.public_key, record['partner']), None)
+        if finished is not None:
+            finished.callback(record)
+
+    def pending(self):
+        """
+        Returns the number of messages that have not been delivered yet.
+        """
+        return len(self.ready)
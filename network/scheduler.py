@@ -0,0 +1,119 @@
+"""
+Module defining the Scheduler class, a discrete-event simulator for the
+delivery of messages between agents.
+"""
+import heapq
+import itertools
+import time
+
+# Default one-way latency of a link in seconds.
+LATENCY = 0.05
+# Default bandwidth of a link in bytes per second, None for unlimited.
+BANDWIDTH = None
+
+
+class Scheduler(object):
+    """
+    Event queue of timestamped message deliveries. Sending a message only
+    schedules its delivery, so a pairwise audit no longer runs to completion
+    inside the first send and many audits can be in flight at once. Messages
+    on the same directed link are transmitted one after the other: a message
+    arrives after the link has sent all earlier messages, its own
+    transmission time and the latency of the link.
+    """
+
+    def __init__(self, network, latency=LATENCY, bandwidth=BANDWIDTH):
+        """
+        Creates a scheduler for the agents of a network with the given
+        default link latency and bandwidth.
+        """
+        self.network = network
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.links = {}
+        self.busy_until = {}
+        self.queue = []
+        self.counter = itertools.count()
+        self.now = 0.0
+        self.delivered = 0
+        self.delivered_bytes = 0
+        self.wall_time = 0.0
+
+    def set_link(self, sender, receiver, latency=None, bandwidth=None):
+        """
+        Sets the latency and bandwidth of the directed link between two
+        agents, overriding the defaults.
+        """
+        self.links[(sender, receiver)] = (self.latency if latency is None else latency,
+                                          self.bandwidth if bandwidth is None else bandwidth)
+
+    def get_link(self, sender, receiver):
+        """
+        Returns the latency and bandwidth of a directed link.
+        """
+        return self.links.get((sender, receiver), (self.latency, self.bandwidth))
+
+    def schedule(self, receiver, message):
+        """
+        Schedules the delivery of a message to the agent with public key
+        receiver.
+
+        :return: The simulated time of delivery
+        """
+        sender = message.sender
+        latency, bandwidth = self.get_link(sender, receiver)
+        size = message.size()
+
+        start = max(self.now, self.busy_until.get((sender, receiver), self.now))
+        sent = start + (size / float(bandwidth) if bandwidth else 0.0)
+        self.busy_until[(sender, receiver)] = sent
+        arrival = sent + latency
+
+        heapq.heappush(self.queue, (arrival, next(self.counter), receiver, message, size))
+        return arrival
+
+    def run_until(self, until=None):
+        """
+        Delivers all messages that arrive up to the given simulated time, or
+        until no messages are left. Messages sent by the receivers are
+        scheduled and delivered in the same loop.
+
+        :return: The number of delivered messages
+        """
+        start = time.time()
+        delivered = 0
+        while self.queue and (until is None or self.queue[0][0] <= until):
+            arrival, _, receiver, message, size = heapq.heappop(self.queue)
+            self.now = arrival
+            self.network.get_agent(receiver).receive(message)
+            delivered += 1
+            self.delivered_bytes += size
+
+        if until is not None:
+            self.now = max(self.now, until)
+        self.delivered += delivered
+        self.wall_time += time.time() - start
+        return delivered
+
+    def run(self):
+        """
+        Delivers messages until no messages are left.
+
+        :return: The number of delivered messages
+        """
+        return self.run_until()
+
+    def pending(self):
+        """
+        Returns the number of messages that have not been delivered yet.
+        """
+        return len(self.queue)
+
+    def messages_per_second(self):
+        """
+        Returns the number of delivered messages per second of wall time
+        spent in run_until.
+        """
+        if self.wall_time == 0:
+            return 0.0
+        return self.delivered / self.wall_time
@@ -0,0 +1,272 @@
+"""
+Module defining a sharded network simulation. The agents are partitioned
+over worker processes by a hash of their public key, and messages between
+agents of different shards are encoded with the binary message codec and
+sent over queues. Keys registered before the workers start are sent as
+key ids.
+"""
+import multiprocessing
+import Queue
+import zlib
+from collections import deque
+
+from attestation.halfblock import Halfblock
+from attestation.public_key import REGISTRY, PublicKey
+from agent import Agent
+from codec import MessageCodec
+from network import Network
+
+# Seconds to wait for a reply of the workers before checking that they are
+# still running.
+POLL_INTERVAL = 1.0
+
+
+def shard_of(public_key, num_shards):
+    """
+    Returns the shard of an agent, given its public key or binary key.
+    """
+    bin_key = public_key.bin_key if isinstance(public_key, PublicKey) else public_key
+    return (zlib.crc32(bin_key) & 0xffffffff) % num_shards
+
+
+class ShardWorker(object):
+    """
+    Worker owning the agents of one shard. It acts as the scheduler of the
+    network interface of its agents: messages to local agents are delivered
+    from a local queue, messages to other shards are put in their inboxes.
+    """
+
+    def __init__(self, shard, inboxes, results, agents, shared_keys):
+        """
+        Creates the worker of a shard.
+
+        :param inboxes: Queues of all shards, indexed by shard.
+        :param results: Queue to the coordinator.
+        :param agents: List of (binary key, halfblock tuples) pairs with the
+        interaction set of every agent of the shard.
+        :param shared_keys: Number of keys registered in all workers with the
+        same id.
+        """
+        self.shard = shard
+        self.inboxes = inboxes
+        self.inbox = inboxes[shard]
+        self.results = results
+        self.local = deque()
+        self.codec = MessageCodec(shared_keys)
+        self.sent = 0
+        self.received = 0
+        self.delivered = 0
+
+        self.network = Network()
+        self.network.set_scheduler(self)
+        for bin_key, blocks in agents:
+            agent = self.network.add_agent(PublicKey(bin_key))
+            for block in blocks:
+                agent.add_transaction(Halfblock(block))
+
+    def schedule(self, receiver, message):
+        """
+        Sends a message to an agent of this or another shard.
+        """
+        shard = shard_of(receiver, len(self.inboxes))
+        if shard == self.shard:
+            self.local.append((receiver, message))
+        else:
+            self.inboxes[shard].put(('message', receiver.bin_key, self.codec.encode(message)))
+            self.sent += 1
+
+    def deliver(self):
+        """
+        Delivers messages to local agents until none are left.
+        """
+        while self.local:
+            receiver, message = self.local.popleft()
+            self.network.get_agent(receiver).receive(message)
+            self.delivered += 1
+
+    def run(self):
+        """
+        Handles messages and commands until the stop command arrives.
+        """
+        while True:
+            command = self.inbox.get()
+            kind = command[0]
+            if kind == 'message':
+                self.received += 1
+                self.local.append((PublicKey(command[1]), self.codec.decode(command[2])))
+            elif kind == 'audit':
+                _, requester, responder, reconcile = command
+                self.network.get_agent(PublicKey(requester)) \
+                    .initiate_pairwise_auditing(PublicKey(responder), reconcile)
+            elif kind == 'hops':
+                for agent in self.network.agents.values():
+                    agent.obtain_data_from_hops(command[1])
+            elif kind == 'probe':
+                self.results.put(('counts', self.shard, self.sent, self.received))
+            elif kind == 'stats':
+                sizes = {public_key.bin_key: len(agent.interactions)
+                         for public_key, agent in self.network.agents.iteritems()}
+                self.results.put(('stats', self.shard, self.delivered, sizes))
+            elif kind == 'stop':
+                return
+            self.deliver()
+
+
+def _public_key(agent):
+    """
+    Returns the public key of an agent given as Agent or by public key.
+    """
+    return agent.public_key if isinstance(agent, Agent) else agent
+
+
+def _run_worker(shard, inboxes, results, agents, shared_keys):
+    """
+    Entry point of a worker process.
+    """
+    ShardWorker(shard, inboxes, results, agents, shared_keys).run()
+
+
+class ShardedNetwork(object):
+    """
+    Coordinator of a network simulation sharded over worker processes. It
+    offers the pairwise_audit and increase_data_to_hops methods of Network,
+    which return once all messages they caused have been handled.
+
+    A worker only has the chains of the agents of its shard, so audit
+    partners are chosen by the coordinator, from the partners of all agents
+    and the audits it has started.
+    """
+
+    def __init__(self, network, num_workers):
+        """
+        Starts the workers and hands them the agents of an existing network,
+        with their current interaction sets.
+        """
+        self.num_workers = num_workers
+        self.inboxes = [multiprocessing.Queue() for _ in range(num_workers)]
+        self.results = multiprocessing.Queue()
+        self.adjacency = network.get_partner_adjacency()
+        self.audited = {public_key: set(endorsement.subject for endorsement in agent.endorsements)
+                        for public_key, agent in network.agents.iteritems()}
+
+        shards = [[] for _ in range(num_workers)]
+        for public_key, agent in network.agents.iteritems():
+            blocks = [block.to_tuple() for block in agent.interactions.get_blocks()]
+            shards[shard_of(public_key, num_workers)].append((public_key.bin_key, blocks))
+
+        self.workers = [multiprocessing.Process(target=_run_worker,
+                                                args=(shard, self.inboxes, self.results, shards[shard],
+                                                      len(REGISTRY)))
+                        for shard in range(num_workers)]
+        for worker in self.workers:
+            worker.daemon = True
+            worker.start()
+
+    def _shard_inbox(self, public_key):
+        """
+        Returns the inbox of the shard owning an agent.
+        """
+        return self.inboxes[shard_of(public_key, self.num_workers)]
+
+    def pairwise_audit(self, requester, responder=None, reconcile=False, wait=True):
+        """
+        Perform pairwise audit between two agents, given as Agent or by public
+        key. Without a responder one is chosen as by get_next_audit_partner,
+        and no audit is started if every reachable agent has been audited.
+
+        :param reconcile: Only exchange the blocks the other agent is missing.
+        :param wait: Wait until the audit is finished. Without waiting many
+        audits can be started at once, see wait.
+        :return: The public key of the responder, None if no audit was started
+        """
+        requester = _public_key(requester)
+        if responder is None:
+            responder = self.get_next_audit_partner(requester)
+            if responder is None:
+                return None
+        responder = _public_key(responder)
+
+        # Both agents endorse each other at the end of an audit.
+        self.audited.setdefault(requester, set()).add(responder)
+        self.audited.setdefault(responder, set()).add(requester)
+        self._shard_inbox(requester).put(('audit', requester.bin_key, responder.bin_key, reconcile))
+        if wait:
+            self.wait()
+        return responder
+
+    def get_next_audit_partner(self, public_key):
+        """
+        Chooses the closest agent that has not been audited by or with an
+        agent, see Agent.get_next_audit_partner. Returns None if every
+        reachable agent has been audited.
+        """
+        audited = self.audited.get(public_key, ())
+        for ring in self.adjacency.iter_rings(public_key):
+            if not ring:
+                return None
+            for candidate in ring:
+                if candidate not in audited:
+                    return candidate
+
+    def increase_data_to_hops(self, hops):
+        """
+        Increases the data to a certain amount of hops. Each agent
+        will store at least all data from all agens `hops` hops away.
+        """
+        for inbox in self.inboxes:
+            inbox.put(('hops', hops))
+        self.wait()
+
+    def _collect(self, kind):
+        """
+        Sends a command to all workers and returns their replies by shard.
+        """
+        for inbox in self.inboxes:
+            inbox.put((kind,))
+        replies = {}
+        while len(replies) < self.num_workers:
+            try:
+                reply = self.results.get(timeout=POLL_INTERVAL)
+            except Queue.Empty:
+                for shard, worker in enumerate(self.workers):
+                    if not worker.is_alive():
+                        raise RuntimeError("The worker of shard %d has stopped with exit code %s"
+                                           % (shard, worker.exitcode))
+                continue
+            replies[reply[1]] = reply[2:]
+        return [replies[shard] for shard in range(self.num_workers)]
+
+    def wait(self):
+        """
+        Waits until no messages are left, by collecting the counts of sent
+        and received messages of all workers until two consecutive rounds
+        give the same counts and every sent message was received.
+        """
+        previous = None
+        while True:
+            counts = self._collect('probe')
+            if counts == previous and sum(sent for sent, _ in counts) == sum(received for _, received in counts):
+                return
+            previous = counts
+
+    def get_stats(self):
+        """
+        Returns the number of messages delivered within the shards and a dict
+        mapping the binary key of every agent to the size of its interaction
+        set.
+        """
+        delivered = 0
+        sizes = {}
+        for shard_delivered, shard_sizes in self._collect('stats'):
+            delivered += shard_delivered
+            sizes.update(shard_sizes)
+        return delivered, sizes
+
+    def stop(self):
+        """
+        Stops all workers.
+        """
+        for inbox in self.inboxes:
+            inbox.put(('stop',))
+        for worker in self.workers:
+            worker.join()
@@ -0,0 +1,79 @@
+"""
+Module defining the RankingCache class.
+"""
+from collections import OrderedDict
+
+# Number of rankings kept by the shared cache.
+CAPACITY = 256
+
+
+class RankingCache(object):
+    """
+    Least recently used cache of rankings. A ranking is stored under the
+    public key of the agent and the identity and version of the interaction
+    set it was computed from, so it is never returned after the set grew.
+    """
+
+    def __init__(self, capacity=CAPACITY):
+        """
+        Creates an empty cache holding at most capacity rankings.
+        """
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.latest = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(public_key, interactions):
+        """
+        Returns the cache key of the ranking of an agent.
+        """
+        return public_key, interactions.uid, interactions.version
+
+    def get(self, public_key, interactions):
+        """
+        Returns the cached ranking of an agent, or None if the interaction set
+        changed since it was computed.
+        """
+        key = self.key(public_key, interactions)
+        ranking = self.entries.pop(key, None)
+        if ranking is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries[key] = ranking
+        return ranking
+
+    def put(self, public_key, interactions, ranking):
+        """
+        Stores the ranking of an agent, replacing the ranking of an older
+        version of the same interaction set and evicting the least recently
+        used rankings if the cache is full.
+        """
+        key = self.key(public_key, interactions)
+        self.entries.pop(self.latest.get(key[:2]), None)
+        self.entries[key] = ranking
+        self.latest[key[:2]] = key
+        while len(self.entries) > self.capacity:
+            evicted, _ = self.entries.popitem(last=False)
+            if self.latest.get(evicted[:2]) == evicted:
+                del self.latest[evicted[:2]]
+
+    def clear(self):
+        """
+        Removes all rankings from the cache.
+        """
+        self.entries.clear()
+        self.latest.clear()
+
+    def __len__(self):
+        """
+        Returns the number of cached rankings.
+        """
+        return len(self.entries)
+
+
+# Cache shared by all agents.
+CACHE = RankingCache()
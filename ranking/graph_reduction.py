@@ -0,0 +1,166 @@
+"""
+Module defining the ReducedGraph class, a smaller equivalent of a temporal
+graph for one personalization vector.
+
+The reduction is exact: the reduced system is the Schur complement of the
+PageRank system after eliminating nodes. Three steps are applied:
+
+- Nodes that cannot be reached from the personal nodes have a score of zero
+  and are removed, together with edges of zero weight.
+- A node v that is neither personal nor dangling and has exactly one
+  in-edge (u, v) with transition probability w and one out-edge is
+  eliminated: its score is alpha * w * x_u. Along a run of k such nodes
+  from u to t, the edges are replaced by one edge (u, t) with probability
+  alpha^k * w, so that rows of the reduced matrix may sum to less than one.
+- The power iteration runs on the remaining nodes only, and the scores of
+  the eliminated nodes are recovered from the score of the node at the head
+  of their run.
+
+Error bound: if the reduced iteration stops after a step with L1 change
+delta, the L1 error of the reduced scores is at most
+delta * alpha / (1 - alpha), as the iteration is an L1 contraction with
+factor alpha. The recovered scores of a run add at most alpha / (1 - alpha)
+times the error at its head, and the runs leaving a node carry at most its
+full score, so the L1 error of all node scores is at most
+delta * alpha / (1 - alpha) ** 2. With the stopping criterion of
+TemporalGraph.pagerank delta is below nodes * tol.
+"""
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import breadth_first_order
+
+from temporal_graph import ALPHA, TOLERANCE, MAX_ITERATIONS
+
+
+class ReducedGraph(object):
+    """
+    The reduction of a TemporalGraph for one personalization vector.
+    """
+
+    def __init__(self, graph, personalization, alpha=ALPHA):
+        """
+        Reduces the graph for the given personalization vector.
+        """
+        self.graph = graph
+        self.alpha = alpha
+        num_nodes = len(graph)
+        transitions = graph.transitions
+
+        # Nodes reachable from the personal nodes, found by a breadth first
+        # search from an extra node with an edge to every personal node.
+        personal = personalization > 0
+        sources = np.flatnonzero(personal)
+        extended = sp.csr_matrix((np.ones(transitions.nnz + len(sources)),
+                                  np.concatenate([transitions.indices, sources]),
+                                  np.append(transitions.indptr, transitions.nnz + len(sources))),
+                                 shape=(num_nodes + 1, num_nodes + 1))
+        order = breadth_first_order(extended, num_nodes, directed=True, return_predecessors=False)
+        reachable = np.zeros(num_nodes, dtype=bool)
+        reachable[order[order < num_nodes]] = True
+
+        # Edges of nonzero weight between reachable nodes, renumbered.
+        reachable_nodes = np.flatnonzero(reachable)
+        index = np.cumsum(reachable) - 1
+        coo = transitions.tocoo()
+        edges = reachable[coo.row] & (coo.data != 0)
+        rows = index[coo.row[edges]]
+        cols = index[coo.col[edges]]
+        weights = coo.data[edges]
+        num_reachable = len(reachable_nodes)
+        personal = personal[reachable_nodes]
+        dangling = graph.dangling[reachable_nodes]
+
+        # Nodes on linear runs. The successor, predecessor and in-edge weight
+        # are only used for nodes with a single out-edge or in-edge.
+        out_degree = np.bincount(rows, minlength=num_reachable)
+        in_degree = np.bincount(cols, minlength=num_reachable)
+        eliminated = (in_degree == 1) & (out_degree == 1) & ~personal & ~dangling
+        successor = np.zeros(num_reachable, dtype=np.int64)
+        successor[rows] = cols
+        predecessor = np.zeros(num_reachable, dtype=np.int64)
+        predecessor[cols] = rows
+        in_weight = np.zeros(num_reachable)
+        in_weight[cols] = weights
+
+        # Pointer doubling towards the head of each run. For an eliminated
+        # node, head is the kept node the run starts from and coefficient
+        # the factor between the score of the head and that of the node.
+        nodes = np.flatnonzero(eliminated)
+        head = predecessor
+        coefficient = np.ones(num_reachable)
+        coefficient[nodes] = alpha * in_weight[nodes]
+        pending = nodes[eliminated[head[nodes]]]
+        while len(pending):
+            jump = head[pending]
+            coefficient[pending] *= coefficient[jump]
+            head[pending] = head[jump]
+            pending = pending[eliminated[head[pending]]]
+
+        # Remaining edges between kept nodes, plus one edge per run from its
+        # head to the node after its last node.
+        kept = ~eliminated
+        direct = kept[rows] & kept[cols]
+        ends = nodes[kept[successor[nodes]]]
+        rows = np.concatenate([rows[direct], head[ends]])
+        cols = np.concatenate([cols[direct], successor[ends]])
+        weights = np.concatenate([weights[direct], coefficient[ends]])
+
+        kept_index = np.cumsum(kept) - 1
+        num_kept = kept.sum()
+        self.transposed = sp.csr_matrix((weights, (kept_index[cols], kept_index[rows])),
+                                        shape=(num_kept, num_kept))
+        self.dangling = dangling[kept]
+        self.personalization = personalization[reachable_nodes][kept]
+
+        self.reachable_nodes = reachable_nodes
+        self.kept_nodes = reachable_nodes[kept]
+        self.eliminated_nodes = reachable_nodes[nodes]
+        self.eliminated_heads = kept_index[head[nodes]]
+        self.eliminated_coefficients = coefficient[nodes]
+
+    def __len__(self):
+        """
+        Returns the number of nodes of the reduced graph.
+        """
+        return len(self.kept_nodes)
+
+    def pagerank(self, tol=TOLERANCE, max_iter=MAX_ITERATIONS, start=None):
+        """
+        Runs the power iteration on the reduced graph, with the convergence
+        criterion of TemporalGraph.pagerank for the reduced number of nodes.
+
+        :return: The reduced score vector, the number of iterations and the L1
+        change of the last iteration, or None instead of the scores if the
+        iteration did not converge.
+        """
+        alpha = self.alpha
+        num_nodes = len(self)
+        scores = np.repeat(1.0 / num_nodes, num_nodes) if start is None else start
+        change = float('inf')
+
+        for iteration in range(1, max_iter + 1):
+            previous = scores
+            scores = alpha * (self.transposed.dot(scores) + scores[self.dangling].sum() * self.personalization) + \
+                (1 - alpha) * self.personalization
+            change = np.absolute(scores - previous).sum()
+            if change < num_nodes * tol:
+                return scores, iteration, change
+
+        return None, max_iter, change
+
+    def expand(self, scores):
+        """
+        Returns the score vector of all nodes of the unreduced graph, given
+        the scores of the reduced graph.
+        """
+        full = np.zeros(len(self.graph))
+        full[self.kept_nodes] = scores
+        full[self.eliminated_nodes] = self.eliminated_coefficients * scores[self.eliminated_heads]
+        return full
+
+    def error_bound(self, change):
+        """
+        Returns the bound on the L1 error of the expanded scores after an
+        iteration with the given L1 change.
+        """
+        return change * self.alpha / (1 - self.alpha) ** 2
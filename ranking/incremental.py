@@ -0,0 +1,101 @@
+"""
+Module defining the IncrementalRanking class, which keeps the temporal graph
+and the last scores of an agent between rankings.
+"""
+import logging
+
+import numpy as np
+
+from temporal_graph import TemporalGraph
+
+
+class IncrementalRanking(object):
+    """
+    Temporal PageRank of one agent that is updated as its interaction set
+    grows. New blocks are appended to the graph and the power iteration is
+    warm-started from the previous scores, which are close to the new
+    solution when only a few blocks were added.
+    """
+
+    def __init__(self, public_key, interactions):
+        """
+        Creates the ranking of an agent and subscribes to its interaction set.
+        """
+        self.public_key = public_key
+        self.graph = None
+        self.pending = interactions.get_blocks()
+        self.nodes = None
+        self.scores = None
+        self.ranking = {}
+        self.stats = []
+        interactions.add_listener(self.add_blocks)
+
+    def add_blocks(self, blocks):
+        """
+        Queues blocks that were added to the interaction set for the next
+        ranking.
+        """
+        self.pending.extend(blocks)
+
+    def calculate(self, compare=False):
+        """
+        Returns the ranking of known agents, updated with the blocks that were
+        added since the last call.
+
+        :param compare: Also run a cold start power iteration on the same
+        graph and record the number of iterations the warm start saved.
+        :return: A dict mapping public keys to scores
+        """
+        if not self.pending:
+            return self.ranking
+
+        new_blocks, self.pending = self.pending, []
+        if self.graph is None:
+            self.graph = TemporalGraph.from_blocks(new_blocks)
+        else:
+            self.graph.extend(new_blocks)
+
+        personalization = self.graph.personalization(self.public_key)
+        if personalization is None:
+            self.ranking = {}
+            return self.ranking
+
+        start = self.start_vector()
+        scores, iterations = self.graph.pagerank(personalization, start=start)
+        record = {'blocks': len(new_blocks), 'nodes': len(self.graph), 'warm': start is not None,
+                  'iterations': iterations, 'cold_iterations': None, 'saved': None}
+        if compare:
+            _, cold_iterations = self.graph.pagerank(personalization)
+            record['cold_iterations'] = cold_iterations
+            record['saved'] = cold_iterations - iterations
+        self.stats.append(record)
+
+        if scores is None:
+            logging.info("Temporal PageRank did not converge, returning empty scores")
+            self.nodes = self.scores = None
+            self.ranking = {}
+            return self.ranking
+
+        self.nodes = self.graph.nodes
+        self.scores = scores
+        self.ranking = self.graph.agent_scores(scores)
+        return self.ranking
+
+    def start_vector(self):
+        """
+        Returns the previous scores placed on the nodes of the current graph,
+        with zero for new nodes, or None if there are no previous scores.
+        """
+        if self.scores is None:
+            return None
+
+        start = np.zeros(len(self.graph))
+        start[np.searchsorted(self.graph.nodes, self.nodes)] = self.scores
+        return start
+
+    def iterations_saved(self):
+        """
+        Returns the total number of iterations saved by warm starts in the
+        rankings that were compared with a cold run.
+        """
+        return sum(record['saved'] for record in self.stats if record['saved'] is not None)
@@ -0,0 +1,152 @@
+"""
+Module defining approximate temporal PageRank by local forward push
+(Andersen, Chung and Lang). Instead of iterating over the whole temporal
+graph, probability mass is pushed from the nodes of the ranking agent to the
+nodes it reaches, and edges are only looked up in the interaction set when a
+node is pushed. The cost depends on the part of the graph that receives a
+significant share of the mass, not on the size of the interaction set.
+"""
+from collections import deque
+
+from temporal_graph import ALPHA
+
+# Default bound on the L1 error of the scores.
+EPSILON = 1.0e-3
+
+
+def personal_nodes(interactions, public_key):
+    """
+    Returns the nodes (public key, sequence number) of an agent in the
+    temporal graph of an interaction set.
+    """
+    sequence_numbers = set()
+    for block in interactions.get_blocks_by_key(public_key):
+        sequence_numbers.add(block.sequence_number)
+        sequence_numbers.add(block.sequence_number + 1)
+    for block in interactions.get_blocks_by_link(public_key):
+        sequence_numbers.add(block.link_sequence_number)
+        sequence_numbers.add(block.link_sequence_number + 1)
+
+    return [(public_key, sequence_number) for sequence_number in sorted(sequence_numbers)]
+
+
+def out_edges(interactions, node):
+    """
+    Returns the out-edges of a node in the temporal graph as a list of
+    (target, probability) pairs, or an empty list for a dangling node. The
+    edges are the same as those TemporalGraph creates for the blocks of the
+    node itself and the blocks linking to it.
+    """
+    public_key, sequence_number = node
+    weights = {}
+
+    block = interactions.get_block(public_key, sequence_number)
+    if block is not None:
+        weights[(public_key, sequence_number + 1)] = block.contribution
+        weights[(block.link_public_key, block.link_sequence_number + 1)] = \
+            block.contribution - block.net_contribution
+    for block in interactions.get_blocks_by_link(public_key, sequence_number):
+        weights[(public_key, sequence_number + 1)] = block.contribution - block.net_contribution
+        weights[(block.public_key, block.sequence_number + 1)] = block.contribution
+
+    total = float(sum(weights.itervalues()))
+    if total == 0:
+        return []
+
+    return [(target, weight / total) for target, weight in weights.iteritems() if weight != 0]
+
+
+def forward_push(interactions, public_key, epsilon=EPSILON, alpha=ALPHA):
+    """
+    Approximates the personalized temporal PageRank of an agent by forward
+    push. Every node keeps a residual of unprocessed mass, and nodes with a
+    residual above a threshold are pushed: a 1 - alpha share of the residual
+    becomes score and the rest moves to the out-neighbours. The mass of
+    dangling nodes returns to the nodes of the agent, as in
+    TemporalGraph.pagerank.
+
+    The estimates never exceed the exact scores and their L1 distance to the
+    exact scores equals the total remaining residual. The threshold starts at
+    the initial residual of the personal nodes and is halved until the total
+    residual is at most epsilon, so only nodes that receive a significant
+    share of the mass are ever expanded.
+
+    :param epsilon: Bound on the L1 error of the scores.
+    :return: A dict mapping nodes to estimated scores and the L1 error bound,
+    or None and 0 if the agent has no nodes.
+    """
+    personal = personal_nodes(interactions, public_key)
+    if not personal:
+        return None, 0.0
+
+    share = 1.0 / len(personal)
+    estimates = {}
+    residuals = dict.fromkeys(personal, share)
+    edges = {}
+    # Mass of dangling nodes that still has to be spread over the personal
+    # nodes. It is spread in one go once every node would get more than the
+    # threshold from it.
+    teleport = 0.0
+    remaining = 1.0
+    threshold = share
+
+    while remaining > epsilon:
+        threshold /= 2
+        queue = deque(node for node, residual in residuals.iteritems() if residual > threshold)
+        queued = set(queue)
+        if teleport * share > threshold:
+            queue.append(None)
+            queued.add(None)
+
+        while queue:
+            node = queue.popleft()
+            queued.discard(node)
+            if node is None:
+                # Spread the teleport mass.
+                targets = [(target, share) for target in personal]
+                mass, teleport = teleport / alpha, 0.0
+            else:
+                mass = residuals.pop(node)
+                estimates[node] = estimates.get(node, 0.0) + (1 - alpha) * mass
+
+                targets = edges.get(node)
+                if targets is None:
+                    targets = edges[node] = out_edges(interactions, node)
+
+                if not targets:
+                    teleport += alpha * mass
+                    if teleport * share > threshold and None not in queued:
+                        queue.append(None)
+                        queued.add(None)
+                    continue
+
+            for target, probability in targets:
+                residual = residuals.get(target, 0.0) + alpha * mass * probability
+                residuals[target] = residual
+                if residual > threshold and target not in queued:
+                    queue.append(target)
+                    queued.add(target)
+
+        remaining = sum(residuals.itervalues()) + teleport
+
+    return estimates, remaining
+
+
+def calculate_tpr_push(own_public_key, interactions, epsilon=EPSILON):
+    """
+    Calculates an approximate ranking of the agents in an interaction set
+    with forward push.
+
+    :param epsilon: Bound on the sum of the absolute errors of all scores.
+    :return: A dict mapping public keys to estimated scores, and the error
+    bound that was reached
+    """
+    estimates, error = forward_push(interactions, own_public_key, epsilon)
+    if estimates is None:
+        return {}, 0.0
+
+    ranking = {}
+    for (public_key, _), score in estimates.iteritems():
+        ranking[public_key] = ranking.get(public_key, 0.0) + score
+
+    return ranking, error
@@ -0,0 +1,58 @@
+"""
+Module defining the ScoreMatrix class.
+"""
+from attestation.public_key import PublicKey
+
+
+class ScoreMatrix(object):
+    """
+    Dense matrix of ranking scores, with one row per source agent and one
+    column per ranked agent.
+    """
+
+    def __init__(self, sources, targets, scores):
+        """
+        Creates the score matrix.
+
+        :param sources: Public keys of the agents the rows are computed for.
+        :param targets: Public keys of the ranked agents.
+        :param scores: Array of shape (len(sources), len(targets)).
+        """
+        assert scores.shape == (len(sources), len(targets))
+        self.sources = sources
+        self.targets = targets
+        self.scores = scores
+        self.source_index = {public_key: row for row, public_key in enumerate(sources)}
+        self.target_index = {public_key: column for column, public_key in enumerate(targets)}
+
+    @classmethod
+    def from_ids(cls, source_keys, target_ids, scores):
+        """
+        Creates the score matrix for targets given by their key ids.
+        """
+        return cls(source_keys, [PublicKey.from_id(int(key_id)) for key_id in target_ids], scores)
+
+    def get_score(self, source, target):
+        """
+        Returns the score of the target agent in the ranking of the source
+        agent.
+        """
+        column = self.target_index.get(target)
+        if column is None:
+            return 0.0
+        return float(self.scores[self.source_index[source], column])
+
+    def get_ranking(self, source):
+        """
+        Returns the ranking of a source agent as a dict of public keys to
+        scores, in the format of calculate_tpr.
+        """
+        row = self.scores[self.source_index[source]]
+        return {target: float(row[column]) for column, target in enumerate(self.targets)}
+
+    @property
+    def shape(self):
+        """
+        Returns the shape of the score matrix.
+        """
+        return self.scores.shape
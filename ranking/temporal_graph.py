@@ -0,0 +1,253 @@
+"""
+Module defining the TemporalGraph class, a sparse matrix representation of
+the temporal interaction graph used for temporal PageRank.
+"""
+import numpy as np
+import scipy.sparse as sp
+
+from attestation.public_key import PublicKey
+
+# Damping factor, convergence tolerance and iteration limit, equal to the
+# defaults of networkx.pagerank_scipy.
+ALPHA = 0.85
+TOLERANCE = 1.0e-6
+MAX_ITERATIONS = 100
+# Number of bits reserved for the sequence number in a node key.
+SEQUENCE_BITS = 32
+
+
+def node_keys(key_ids, sequence_numbers):
+    """
+    Combines public key ids and sequence numbers into int64 node keys. The
+    sequence number is stored plus one, so the sequence number -1 of a half
+    not yet signed by the responder stays within the bits of its key id.
+    """
+    return (np.asarray(key_ids, dtype=np.int64) << SEQUENCE_BITS) + \
+        (np.asarray(sequence_numbers, dtype=np.int64) + 1)
+
+
+def block_columns(blocks):
+    """
+    Returns the halfblock columns of a list of halfblocks, in the argument
+    order of TemporalGraph.
+    """
+    count = len(blocks)
+    return (np.fromiter((block.public_key.id for block in blocks), np.int64, count),
+            np.fromiter((block.sequence_number for block in blocks), np.int64, count),
+            np.fromiter((block.link_public_key.id for block in blocks), np.int64, count),
+            np.fromiter((block.link_sequence_number for block in blocks), np.int64, count),
+            np.fromiter((block.contribution for block in blocks), np.float64, count),
+            np.fromiter((block.net_contribution for block in blocks), np.float64, count))
+
+
+class TemporalGraph(object):
+    """
+    The temporal graph has one node per (public key, sequence number) pair.
+    Every halfblock links its node to the next node in the chains of both
+    participants, weighted by the contribution in that direction. The graph
+    is stored as a row-normalized CSR transition matrix.
+    """
+
+    def __init__(self, key_ids, sequence_numbers, link_key_ids, link_sequence_numbers,
+                 contributions, net_contributions):
+        """
+        Creates the temporal graph from halfblock columns. Public keys are
+        given by their registry ids.
+        """
+        self.columns = [np.asarray(key_ids, dtype=np.int64),
+                        np.asarray(sequence_numbers, dtype=np.int64),
+                        np.asarray(link_key_ids, dtype=np.int64),
+                        np.asarray(link_sequence_numbers, dtype=np.int64),
+                        np.asarray(contributions, dtype=np.float64),
+                        np.asarray(net_contributions, dtype=np.float64)]
+        self.build()
+
+    @classmethod
+    def from_blocks(cls, blocks):
+        """
+        Creates the temporal graph from a list of halfblocks.
+        """
+        return cls(*block_columns(blocks))
+
+    @classmethod
+    def from_block_table(cls, table):
+        """
+        Creates the temporal graph of all blocks in a BlockTable.
+        """
+        key_ids = np.array([PublicKey(bin_key).id for bin_key in table.public_keys], dtype=np.int64)
+        columns = table.halfblock_columns()
+        return cls(key_ids[columns['public_key']], columns['sequence_number'],
+                   key_ids[columns['link_public_key']], columns['link_sequence_number'],
+                   columns['contribution'], columns['net_contribution'])
+
+    def extend(self, blocks):
+        """
+        Appends the edges of new halfblocks to the graph and rebuilds the
+        transition matrix. Nodes keep their sorted order, so the previous
+        node keys can be located in the extended graph.
+        """
+        if not blocks:
+            return
+
+        self.columns = [np.concatenate([column, new_column])
+                        for column, new_column in zip(self.columns, block_columns(blocks))]
+        self.build()
+
+    def build(self):
+        """
+        Builds the nodes and the transition matrix from the halfblock columns.
+        """
+        key_ids, sequence_numbers, link_key_ids, link_sequence_numbers, \
+            contributions, net_contributions = self.columns
+        own = node_keys(key_ids, sequence_numbers)
+        link = node_keys(link_key_ids, link_sequence_numbers)
+        received = contributions - net_contributions
+
+        # Four edges per halfblock, in the order in which the networkx graph
+        # adds them. A repeated edge overwrites the earlier weight there, so
+        # only the last occurrence of each edge is kept.
+        sources = np.column_stack([own, own, link, link]).ravel()
+        targets = np.column_stack([own + 1, link + 1, link + 1, own + 1]).ravel()
+        weights = np.column_stack([contributions, received, received, contributions]).ravel()
+
+        self.nodes, inverse = np.unique(np.concatenate([sources, targets]), return_inverse=True)
+        rows = inverse[:len(sources)]
+        cols = inverse[len(sources):]
+
+        num_nodes = len(self.nodes)
+        edge_ids = rows * num_nodes + cols
+        _, last = np.unique(edge_ids[::-1], return_index=True)
+        keep = len(edge_ids) - 1 - last
+
+        matrix = sp.csr_matrix((weights[keep], (rows[keep], cols[keep])), shape=(num_nodes, num_nodes))
+        out_weights = np.asarray(matrix.sum(axis=1)).ravel()
+        self.dangling = out_weights == 0
+        scale = np.zeros(num_nodes)
+        scale[~self.dangling] = 1.0 / out_weights[~self.dangling]
+        self.transitions = sp.diags(scale).dot(matrix).tocsr()
+        self.transposed = self.transitions.T.tocsr()
+        self.node_agents = self.nodes >> SEQUENCE_BITS
+
+    def __len__(self):
+        """
+        Returns the number of nodes in the graph.
+        """
+        return len(self.nodes)
+
+    def personalization(self, public_key):
+        """
+        Returns the personalization vector of an agent: uniform over the
+        nodes of its chain. Returns None if the agent has no nodes.
+        """
+        personal = self.node_agents == public_key.id
+        count = personal.sum()
+        if count == 0:
+            return None
+
+        return personal / float(count)
+
+    def personalization_matrix(self, public_keys):
+        """
+        Returns a sparse matrix with the personalization vectors of the given
+        agents as columns. Agents without nodes get an empty column.
+        """
+        key_ids = np.array([public_key.id for public_key in public_keys], dtype=np.int64)
+        # Nodes are sorted by key, so the nodes of each agent are one range.
+        starts = np.searchsorted(self.node_agents, key_ids, side='left')
+        ends = np.searchsorted(self.node_agents, key_ids, side='right')
+        counts = ends - starts
+
+        rows = np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)] +
+                              [np.zeros(0, np.int64)])
+        cols = np.repeat(np.arange(len(key_ids)), counts)
+        values = np.repeat(1.0 / np.maximum(counts, 1), counts)
+
+        return sp.csc_matrix((values, (rows, cols)), shape=(len(self), len(key_ids)))
+
+    def pagerank_batch(self, personalizations, alpha=ALPHA, tol=TOLERANCE, max_iter=MAX_ITERATIONS):
+        """
+        Runs personalized PageRank for several personalization vectors at
+        once, iterating all of them together as columns of one matrix. Every
+        column stops once it meets the convergence criterion of pagerank.
+
+        :param personalizations: Sparse matrix with one personalization
+        vector per column.
+        :return: A dense matrix with one score vector per column and an array
+        with the number of iterations per column, which is negative for
+        columns that did not converge.
+        """
+        num_nodes, num_columns = personalizations.shape
+        personal = np.asarray(personalizations.todense())
+        dangling = np.flatnonzero(self.dangling)
+        current = np.full((num_nodes, num_columns), 1.0 / num_nodes)
+        scores = np.empty((num_nodes, num_columns))
+        iterations = np.full(num_columns, -max_iter, dtype=np.int64)
+        active = np.arange(num_columns)
+
+        for iteration in range(1, max_iter + 1):
+            previous = current
+            jump = alpha * previous[dangling].sum(axis=0) + (1 - alpha)
+            current = self.transposed.dot(previous)
+            current *= alpha
+            current += personal * jump
+
+            # The difference is computed in place in the previous scores,
+            # which are not needed anymore.
+            np.subtract(current, previous, out=previous)
+            np.absolute(previous, out=previous)
+            converged = previous.sum(axis=0) < num_nodes * tol
+            if converged.any():
+                # Store finished columns and continue with the others only.
+                scores[:, active[converged]] = current[:, converged]
+                iterations[active[converged]] = iteration
+                active = active[~converged]
+                current = current[:, ~converged]
+                personal = personal[:, ~converged]
+                if len(active) == 0:
+                    break
+
+        scores[:, active] = current
+        return scores, iterations
+
+    def agent_matrix(self):
+        """
+        Returns the ids of all agents in the graph and a sparse matrix which
+        sums node scores into agent scores.
+        """
+        agent_ids, inverse = np.unique(self.node_agents, return_inverse=True)
+        indicator = sp.csr_matrix((np.ones(len(self)), (inverse, np.arange(len(self)))),
+                                  shape=(len(agent_ids), len(self)))
+        return agent_ids, indicator
+
+    def pagerank(self, personalization, alpha=ALPHA, tol=TOLERANCE, max_iter=MAX_ITERATIONS, start=None):
+        """
+        Runs personalized PageRank by power iteration. Dangling nodes jump to
+        the personalization vector. Convergence is reached when the L1 change
+        of an iteration is below the number of nodes times tol.
+
+        :param start: Start vector, uniform by default.
+        :return: The score vector and the number of iterations, or None and
+        the number of iterations if the iteration did not converge.
+        """
+        num_nodes = len(self)
+        scores = np.repeat(1.0 / num_nodes, num_nodes) if start is None else start
+
+        for iteration in range(1, max_iter + 1):
+            previous = scores
+            scores = alpha * (self.transposed.dot(scores) + scores[self.dangling].sum() * personalization) + \
+                (1 - alpha) * personalization
+            if np.absolute(scores - previous).sum() < num_nodes * tol:
+                return scores, iteration
+
+        return None, max_iter
+
+    def agent_scores(self, scores):
+        """
+        Sums the scores of the nodes of each agent.
+
+        :return: A dict mapping public keys to their total score
+        """
+        agent_ids, inverse = np.unique(self.node_agents, return_inverse=True)
+        sums = np.bincount(inverse, scores, minlength=len(agent_ids))
+
+        return {PublicKey.from_id(int(agent_id)): float(score) for agent_id, score in zip(agent_ids, sums)}
@@ -1,9 +1,45 @@
+import logging
+
 import networkx as nx
 from progress.bar import Bar
 
-def calculate_tpr(own_public_key, blocks):
+from temporal_graph import TemporalGraph
+from graph_reduction import ReducedGraph
+
+def calculate_tpr(own_public_key, blocks, reduce=False):
+    """
+    Creates a sparse temporal graph of the interactions and calculates
+    personalized pagerank with power iteration.
+    :param reduce: Iterate on the graph reduced for the personalization
+    vector, see ranking.graph_reduction.
+    :return: PageRank from one node
+    """
+    if not blocks:
+        return {}
+
+    graph = TemporalGraph.from_blocks(blocks)
+    personalization = graph.personalization(own_public_key)
+    if personalization is None:
+        return {}
+
+    if reduce:
+        reduced = ReducedGraph(graph, personalization)
+        scores, _, _ = reduced.pagerank()
+        if scores is not None:
+            scores = reduced.expand(scores)
+    else:
+        scores, _ = graph.pagerank(personalization)
+    if scores is None:
+        logging.info("Temporal PageRank did not converge, returning empty scores")
+        return {}
+
+    return graph.agent_scores(scores)
+
+
+def calculate_tpr_networkx(own_public_key, blocks):
     """
-    Creates a graph of the interactions and calculates pagerank.
+    Creates a networkx graph of the interactions and calculates pagerank.
+    Reference implementation of calculate_tpr.
     :return: PageRank from one node
     """
 
@@ -40,7 +76,7 @@ def calculate_tpr(own_public_key, blocks):
     try:
         result = nx.pagerank_scipy(G, personalization=personalisation, weight='contribution')
     except nx.NetworkXException:
-        self._logger.info("Empty Temporal PageRank, returning empty scores")
+        logging.info("Empty Temporal PageRank, returning empty scores")
         return {}
 
     sums = {}
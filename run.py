@@ -43,12 +43,15 @@ def run_experiment(experiment):
 
 @click.group()
 @click.option('--db', default="databases/multichain_10000.db")
+@click.option('--snapshot', default=None,
+              help="Snapshot directory of the database, written on first use and memory-mapped afterwards.")
 @click.pass_context
-def main(ctx, db):
+def main(ctx, db, snapshot):
     """
     Main function.
     """
     ctx.obj['DB'] = db
+    ctx.obj['SNAPSHOT'] = snapshot
 
 @main.command()
 @click.argument('experiment',
@@ -60,7 +63,7 @@ def experiment(ctx, experiment):
     Experiment command.
     """
     exp = load_experiment(experiment)
-    run_experiment(exp.Experiment(ctx.obj['DB']))
+    run_experiment(exp.Experiment(ctx.obj['DB'], ctx.obj['SNAPSHOT']))
 
 if __name__ =="__main__":
     main(obj={})
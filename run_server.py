@@ -1,9 +1,27 @@
+import click
+
 from network.network import Network
 from attestation.database import MultiChainDB
 from server.server import RESTManager
 
-db = MultiChainDB('databases/multichain_10000.db')
-net = Network.from_database(db)
-rm = RESTManager()
-rm.start(net)
-rm.run()
+
+@click.command()
+@click.option('--db', default="databases/multichain_10000.db")
+@click.option('--snapshot', default=None,
+              help="Snapshot directory of the database, written on first use and memory-mapped afterwards.")
+def main(db, snapshot):
+    """
+    Serves the network of a database over the REST API.
+    """
+    database = MultiChainDB(db)
+    if snapshot is None:
+        net = Network.from_database(database)
+    else:
+        net = Network.from_snapshot(snapshot, database)
+    rm = RESTManager()
+    rm.start(net)
+    rm.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,8 @@ from twisted.web import resource
 
 import json
 
+from lookup import AgentLookupError, find_agent
+
 class AgentsEndpoint(resource.Resource):
 
     def __init__(self, network):
@@ -33,6 +35,9 @@ class AgentsSpecificEndpoint(resource.Resource):
         self.agent_query = path
 
     def render_GET(self, request):
-        agent = self.network.get_agent(self.agent_query)
+        try:
+            agent = find_agent(self.network, self.agent_query)
+        except AgentLookupError as error:
+            return error.render(request)
 
         return json.dumps(agent.to_dict())
\ No newline at end of file
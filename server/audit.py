@@ -1,7 +1,9 @@
-from twisted.web import resource
+from twisted.web import http, resource
 
 import json
 
+from lookup import AgentLookupError, find_agent
+
 class AuditEndpoint(resource.Resource):
 
     def __init__(self, network):
@@ -22,15 +24,19 @@ class AuditEndpoint(resource.Resource):
         request.setHeader('Access-Control-Allow-Headers', 'x-prototype-version,x-requested-with')
         request.setHeader('Access-Control-Max-Age', 2520)
 
+        if 'node1' not in request.args or 'node2' not in request.args:
+            request.setResponseCode(http.BAD_REQUEST)
+            request.setHeader('Content-Type', 'application/json')
+            return json.dumps({'error': "Both node1 and node2 are required", 'matches': []})
+
         node1 = request.args['node1']
         node2 = request.args['node2']
-        print node1
-        print node2
-        agent1 = self.network.get_agent(node1[0])
-        agent2 = self.network.get_agent(node2[0])
-        
-        print len(agent1.blocks)
+        try:
+            agent1 = find_agent(self.network, node1[0])
+            agent2 = find_agent(self.network, node2[0])
+        except AgentLookupError as error:
+            return error.render(request)
+
         self.network.pairwise_audit(agent1, agent2)
-        print len(agent1.blocks)
 
         return json.dumps([agent1.to_dict(), agent2.to_dict()])
@@ -0,0 +1,42 @@
+import json
+
+from twisted.web import http
+
+from network.key_index import AmbiguousKeyError
+
+
+class AgentLookupError(Exception):
+    """
+    Raised when a request names an agent that cannot be found, with the
+    HTTP status code and JSON body of the response.
+    """
+
+    def __init__(self, code, body):
+        Exception.__init__(self, body['error'])
+        self.code = code
+        self.body = body
+
+    def render(self, request):
+        """
+        Sets the status code of a request and returns the response body.
+        """
+        request.setResponseCode(self.code)
+        request.setHeader('Content-Type', 'application/json')
+        return json.dumps(self.body)
+
+
+def find_agent(network, query):
+    """
+    Returns the agent of which the public key starts with the query. Raises
+    an AgentLookupError with status 400 and the matching keys if the prefix
+    is ambiguous, and with status 404 if no agent matches.
+    """
+    try:
+        agent = network.get_agent(query)
+    except AmbiguousKeyError as error:
+        raise AgentLookupError(http.BAD_REQUEST, {'error': str(error),
+                                                  'matches': [key.to_hex() for key in error.matches]})
+
+    if agent is None:
+        raise AgentLookupError(http.NOT_FOUND, {'error': "No agent matches '%s'" % query, 'matches': []})
+    return agent
@@ -1,7 +1,9 @@
-from twisted.web import resource
+from twisted.web import http, resource
 
 import json
 
+from lookup import AgentLookupError, find_agent
+
 class PagerankEndpoint(resource.Resource):
 
     def __init__(self, network):
@@ -33,8 +35,25 @@ class PagerankSpecificEndpoint(resource.Resource):
         self.agent_query = path
 
     def render_GET(self, request):
-        agent = self.network.get_agent(self.agent_query)
-        rank = agent.calculate_ranking()
+        try:
+            agent = find_agent(self.network, self.agent_query)
+        except AgentLookupError as error:
+            return error.render(request)
+
+        if 'epsilon' in request.args:
+            try:
+                epsilon = float(request.args['epsilon'][0])
+            except ValueError:
+                epsilon = None
+            # Also rejects infinity and NaN.
+            if epsilon is None or not 0 < epsilon < float('inf'):
+                request.setResponseCode(http.BAD_REQUEST)
+                request.setHeader('Content-Type', 'application/json')
+                return json.dumps({'error': "epsilon must be a positive number, got '%s'"
+                                            % request.args['epsilon'][0]})
+            rank = agent.calculate_ranking(epsilon=epsilon)
+        else:
+            rank = agent.calculate_ranking()
 
         converted_rank = {}
         for key, score in rank.iteritems():